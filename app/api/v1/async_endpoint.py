@@ -0,0 +1,59 @@
+import functools
+import inspect
+from typing import Callable
+
+from fastapi import Depends, Response
+from fastapi.routing import APIRoute
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+def _session_parameter(endpoint: Callable):
+    # The parameter whose dependency has an async variant, i.e. get_db or a replica_db
+    for parameter in inspect.signature(endpoint).parameters.values():
+        if hasattr(getattr(parameter.default, 'dependency', None), 'async_dependency'):
+            return parameter
+    return None
+
+
+def async_endpoint(route: APIRoute) -> Callable:
+    """The endpoint of route as async def, running on the event loop with an AsyncSession (DATABASE_ASYNC).
+
+    The sync endpoint runs unchanged in AsyncSession.run_sync: it gets the sync session of the AsyncSession, whose
+    queries await asyncpg instead of blocking a thread, and whose session events fire as usual. The result is
+    validated against the response model inside run_sync as well, since attributes can only be loaded there.
+    Endpoints without a session are returned as they are.
+    """
+    endpoint = route.endpoint
+    parameter = _session_parameter(endpoint)
+    if parameter is None or inspect.iscoroutinefunction(endpoint):
+        return endpoint
+    response_field = route.response_field
+
+    @functools.wraps(endpoint)
+    async def run_endpoint(**kwargs):
+        db: AsyncSession = kwargs[parameter.name]
+
+        def run(session):
+            result = endpoint(**dict(kwargs, **{parameter.name: session}))
+            if response_field is not None and not isinstance(result, Response):
+                value, errors = response_field.validate(result, {}, loc=('response',))
+                if not errors:
+                    return value
+            return result
+
+        return await db.run_sync(run)
+
+    signature = inspect.signature(endpoint)
+    run_endpoint.__signature__ = signature.replace(parameters=[
+        other.replace(default=Depends(parameter.default.dependency.async_dependency))
+        if other.name == parameter.name else other
+        for other in signature.parameters.values()
+    ])
+    return run_endpoint
+
+
+def run_on_event_loop(router):
+    """Replaces the endpoints of the routes of router by their async_endpoint, before the app includes router."""
+    for route in router.routes:
+        if isinstance(route, APIRoute):
+            route.endpoint = async_endpoint(route)
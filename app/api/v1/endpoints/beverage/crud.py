@@ -1,13 +1,16 @@
 import logging
 import uuid
+from sqlalchemy import lambda_stmt, select
 from sqlalchemy.orm import Session
-from app.api.v1.endpoints.beverage.schemas import BeverageCreateSchema
+from app.api.v1.endpoints.beverage.schemas import BeverageCreateSchema, BeverageListItemSchema
+from app.database.catalog_cache import catalog_cache, invalidate_on_commit
 from app.database.models import Beverage
 
 
 def create_beverage(schema: BeverageCreateSchema, db: Session):
     entity = Beverage(**schema.dict())
     db.add(entity)
+    invalidate_on_commit(db, Beverage)
     db.commit()
     logging.info('Beverage created with ID: {}; name: {}; price: {}; stock: {}; description: {}'.format(
         entity.id, entity.name, entity.price, entity.stock, entity.description))
@@ -15,7 +18,7 @@ def create_beverage(schema: BeverageCreateSchema, db: Session):
 
 
 def get_beverage_by_id(beverage_id: uuid.UUID, db: Session):
-    entity = db.query(Beverage).filter(Beverage.id == beverage_id).first()
+    entity = db.get(Beverage, beverage_id)
     if entity:
         logging.info('Beverage retrieved with ID: {}'.format(beverage_id))
     else:
@@ -24,7 +27,7 @@ def get_beverage_by_id(beverage_id: uuid.UUID, db: Session):
 
 
 def get_beverage_by_name(beverage_name: str, db: Session):
-    entity = db.query(Beverage).filter(Beverage.name == beverage_name).first()
+    entity = db.scalars(lambda_stmt(lambda: select(Beverage).where(Beverage.name == beverage_name))).first()
     if entity:
         logging.info('Beverage retrieved with name: {}'.format(beverage_name))
     else:
@@ -33,14 +36,18 @@ def get_beverage_by_name(beverage_name: str, db: Session):
 
 
 def get_all_beverages(db: Session):
-    beverages = db.query(Beverage).all()
-    logging.info('All beverages retrieved, count: {}'.format(len(beverages)))
-    return beverages
+    def load(session: Session):
+        beverages = session.query(Beverage).order_by(Beverage.id).all()
+        logging.info('All beverages retrieved, count: {}'.format(len(beverages)))
+        return [BeverageListItemSchema.from_orm(beverage) for beverage in beverages]
+
+    return catalog_cache.get(Beverage, load, db)
 
 
 def update_beverage(beverage: Beverage, changed_beverage: BeverageCreateSchema, db: Session):
     for key, value in changed_beverage.dict().items():
         setattr(beverage, key, value)
+    invalidate_on_commit(db, Beverage)
     db.commit()
     db.refresh(beverage)
     logging.info('Beverage {} updated with name: {}; price: {}; stock: {}; description: {}'.format(
@@ -52,6 +59,7 @@ def delete_beverage_by_id(beverage_id: uuid.UUID, db: Session):
     entity = get_beverage_by_id(beverage_id, db)
     if entity:
         db.delete(entity)
+        invalidate_on_commit(db, Beverage)
         db.commit()
         logging.info('Beverage {} with ID {} deleted'.format(entity.name, beverage_id))
     else:
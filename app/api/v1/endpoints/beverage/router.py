@@ -7,24 +7,27 @@ from sqlalchemy.orm import Session
 
 import app.api.v1.endpoints.beverage.crud as beverage_crud
 from app.api.v1.endpoints.beverage.schemas import BeverageSchema, BeverageCreateSchema, BeverageListItemSchema
-from app.database.connection import SessionLocal
-
-
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
+from app.api.v1.etag import entity_tag, is_not_modified, not_modified
+from app.api.v1.pagination import PageParams, page_of_list, paginate
+from app.database.session import get_db, get_replica_db
 
 router = APIRouter()
 
 
 @router.get('', response_model=List[BeverageListItemSchema], tags=['beverage'])
-def get_all_beverages(db: Session = Depends(get_db)):
+def get_all_beverages(
+        request: Request,
+        response: Response,
+        page: PageParams = Depends(),
+        db: Session = Depends(get_replica_db),
+):
+    after = page.after(uuid.UUID)
     beverages = beverage_crud.get_all_beverages(db)
-    return beverages
+    etag = entity_tag(beverages.etag, page.cursor, page.limit)
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+    response.headers['ETag'] = etag
+    return paginate(request, response, page_of_list(beverages, after, page.limit), page.limit, lambda item: (item.id,))
 
 
 @router.post('', response_model=BeverageSchema, status_code=status.HTTP_201_CREATED, tags=['beverage'])
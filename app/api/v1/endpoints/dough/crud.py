@@ -1,15 +1,18 @@
 import logging
 import uuid
 
+from sqlalchemy import lambda_stmt, select
 from sqlalchemy.orm import Session
 
-from app.api.v1.endpoints.dough.schemas import DoughCreateSchema
+from app.api.v1.endpoints.dough.schemas import DoughCreateSchema, DoughListItemSchema
+from app.database.catalog_cache import catalog_cache, invalidate_on_commit
 from app.database.models import Dough
 
 
 def create_dough(schema: DoughCreateSchema, db: Session):
     entity = Dough(**schema.dict())
     db.add(entity)
+    invalidate_on_commit(db, Dough)
     db.commit()
     logging.info('Dough created with name {}; price {}; stock {}; description {}'.format(
         entity.name, entity.price, entity.stock, entity.description))
@@ -17,7 +20,7 @@ def create_dough(schema: DoughCreateSchema, db: Session):
 
 
 def get_dough_by_id(dough_id: uuid.UUID, db: Session):
-    entity = db.query(Dough).filter(Dough.id == dough_id).first()
+    entity = db.get(Dough, dough_id)
     if not entity:
         logging.error('Dough with ID {} not found'.format(dough_id))
     else:
@@ -26,7 +29,7 @@ def get_dough_by_id(dough_id: uuid.UUID, db: Session):
 
 
 def get_dough_by_name(dough_name: str, db: Session):
-    entity = db.query(Dough).filter(Dough.name == dough_name).first()
+    entity = db.scalars(lambda_stmt(lambda: select(Dough).where(Dough.name == dough_name))).first()
     if entity:
         logging.info('Dough retrieved with name {}'.format(dough_name))
     else:
@@ -35,14 +38,18 @@ def get_dough_by_name(dough_name: str, db: Session):
 
 
 def get_all_doughs(db: Session):
-    logging.info('Retrieving all doughs')
-    return db.query(Dough).all()
+    def load(session: Session):
+        logging.info('Retrieving all doughs')
+        return [DoughListItemSchema.from_orm(entity) for entity in session.query(Dough).order_by(Dough.id).all()]
+
+    return catalog_cache.get(Dough, load, db)
 
 
 def update_dough(dough: Dough, changed_dough: DoughCreateSchema, db: Session):
     original_values = {key: getattr(dough, key) for key in changed_dough.dict()}
     for key, value in changed_dough.dict().items():
         setattr(dough, key, value)
+    invalidate_on_commit(db, Dough)
     db.commit()
     db.refresh(dough)
     logging.info('Dough updated from {} to {}'.format(original_values, changed_dough.dict()))
@@ -53,6 +60,7 @@ def delete_dough_by_id(dough_id: uuid.UUID, db: Session):
     entity = get_dough_by_id(dough_id, db)
     if entity:
         db.delete(entity)
+        invalidate_on_commit(db, Dough)
         db.commit()
         logging.info('Dough with ID {} deleted'.format(dough_id))
     else:
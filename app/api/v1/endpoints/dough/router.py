@@ -6,23 +6,31 @@ from fastapi.responses import RedirectResponse
 from sqlalchemy.orm import Session
 
 import app.api.v1.endpoints.dough.crud as dough_crud
-from app.api.v1.endpoints.dough.schemas import DoughSchema, DoughCreateSchema, DoughListItemSchema
-from app.database.connection import SessionLocal
+import app.api.v1.endpoints.order.stock_logic.stock_shard_crud as stock_shard_crud
+from app.api.v1.endpoints.dough.schemas import DoughSchema, DoughCreateSchema, DoughListItemSchema, \
+    DoughStockShardsSchema, DoughStockShardsUpdateSchema
+from app.database.models import Dough
+from app.api.v1.etag import entity_tag, is_not_modified, not_modified
+from app.api.v1.pagination import PageParams, page_of_list, paginate
+from app.database.session import get_db, get_replica_db
 
 router = APIRouter()
 
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-
 @router.get('', response_model=List[DoughListItemSchema], tags=['dough'])
-def get_all_doughs(db: Session = Depends(get_db)):
-    return dough_crud.get_all_doughs(db)
+def get_all_doughs(
+        request: Request,
+        response: Response,
+        page: PageParams = Depends(),
+        db: Session = Depends(get_replica_db),
+):
+    after = page.after(uuid.UUID)
+    doughs = dough_crud.get_all_doughs(db)
+    etag = entity_tag(doughs.etag, page.cursor, page.limit)
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+    response.headers['ETag'] = etag
+    return paginate(request, response, page_of_list(doughs, after, page.limit), page.limit, lambda item: (item.id,))
 
 
 @router.post('', response_model=DoughSchema, status_code=status.HTTP_201_CREATED, tags=['dough'])
@@ -88,3 +96,35 @@ def delete_dough(dough_id: uuid.UUID, db: Session = Depends(get_db)):
 
     dough_crud.delete_dough_by_id(dough_id, db)
     return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+
+def _stock_shards_of(dough: Dough, db: Session):
+    return DoughStockShardsSchema(
+        shards=dough.stock_shards, stock=dough.stock,
+        shard_stock=stock_shard_crud.get_stock_of_shards(Dough, dough.id, db),
+    )
+
+
+@router.get('/{dough_id}/stock-shards', response_model=DoughStockShardsSchema, tags=['dough'])
+def get_dough_stock_shards(dough_id: uuid.UUID, db: Session = Depends(get_db)):
+    dough = dough_crud.get_dough_by_id(dough_id, db)
+
+    if not dough:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+
+    return _stock_shards_of(dough, db)
+
+
+@router.put('/{dough_id}/stock-shards', response_model=DoughStockShardsSchema, tags=['dough'])
+def update_dough_stock_shards(
+        dough_id: uuid.UUID,
+        stock_shards: DoughStockShardsUpdateSchema,
+        db: Session = Depends(get_db),
+):
+    dough = dough_crud.get_dough_by_id(dough_id, db)
+
+    if not dough:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+
+    stock_shard_crud.set_stock_shards(Dough, dough, stock_shards.shards, db)
+    return _stock_shards_of(dough, db)
@@ -1,6 +1,7 @@
 import uuid
+from typing import List
 
-from pydantic import BaseModel
+from pydantic import BaseModel, conint
 
 
 class DoughBaseSchema(BaseModel):
@@ -28,3 +29,15 @@ class DoughListItemSchema(BaseModel):
 
     class Config:
         orm_mode = True
+
+
+class DoughStockShardsUpdateSchema(BaseModel):
+    # 1 stops sharding
+    shards: conint(ge=1, le=64)
+
+
+class DoughStockShardsSchema(BaseModel):
+    shards: int
+    stock: int
+    # Stock of every shard, empty if the dough is not sharded; stock minus their sum is not taken from shards yet
+    shard_stock: List[int]
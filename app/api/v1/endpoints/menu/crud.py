@@ -0,0 +1,71 @@
+import hashlib
+import logging
+from typing import List
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session, joinedload, selectinload
+
+import app.api.v1.endpoints.order.stock_logic.stock_availability_crud as stock_availability_crud
+from app.api.v1.endpoints.dough.schemas import DoughListItemSchema
+from app.api.v1.endpoints.menu.schemas import (
+    MenuPizzaTypeCatalogSchema, MenuPizzaTypeSchema, MenuSchema, MenuToppingSchema,
+)
+from app.api.v1.endpoints.pizza_type.schemas import PizzaTypeSchema
+from app.api.v1.endpoints.sauce.schemas import SauceListItemSchema
+from app.api.v1.endpoints.topping.schemas import ToppingListItemSchema
+from app.database.catalog_cache import catalog_cache
+from app.database.models import Dough, PizzaType, PizzaTypeSauce, PizzaTypeToppingQuantity, Sauce, Topping
+
+# Entity types the menu is built from, a committed write to any of them rebuilds it. max_makeable changes with almost
+# every order, so it is merged in from the availability map instead
+MENU_SOURCES = (PizzaType, PizzaTypeToppingQuantity, PizzaTypeSauce, Dough, Sauce, Topping)
+
+
+class MenuSnapshot:
+    """The menu serialized to JSON, with the ETag of the body."""
+
+    def __init__(self, menu: MenuSchema):
+        self.body = menu.json().encode()
+        self.etag = '"{}"'.format(hashlib.sha1(self.body).hexdigest())
+
+
+def build_menu(db: Session) -> List[MenuPizzaTypeCatalogSchema]:
+    """All pizza types with their dough, sauces and recipe, from three queries however many pizza types there are."""
+    pizza_types = db.scalars(
+        select(PizzaType)
+        .options(
+            joinedload(PizzaType.dough),
+            selectinload(PizzaType.sauces).joinedload(PizzaTypeSauce.sauce),
+            selectinload(PizzaType.toppings).joinedload(PizzaTypeToppingQuantity.topping))
+        .order_by(PizzaType.name)
+        .execution_options(populate_existing=True)).all()
+    logging.info('Menu built with {} pizza types'.format(len(pizza_types)))
+    return [
+        MenuPizzaTypeCatalogSchema(
+            **PizzaTypeSchema.from_orm(pizza_type).dict(),
+            dough=DoughListItemSchema.from_orm(pizza_type.dough),
+            sauces=[SauceListItemSchema.from_orm(pizza_type_sauce.sauce)
+                    for pizza_type_sauce in sorted(pizza_type.sauces, key=lambda item: item.sauce.name)],
+            toppings=[MenuToppingSchema(**ToppingListItemSchema.from_orm(quantity.topping).dict(),
+                                        quantity=quantity.quantity)
+                      for quantity in sorted(pizza_type.toppings, key=lambda item: item.topping.name)],
+        )
+        for pizza_type in pizza_types
+    ]
+
+
+def _merge_availability(db: Session) -> MenuSnapshot:
+    # Serializes the cached menu with the cached counts, without a query unless one of them has to be loaded
+    pizza_types = catalog_cache.get_snapshot('menu_catalog', MENU_SOURCES, build_menu, db)
+    availability = stock_availability_crud.get_pizza_type_availability(db)
+    return MenuSnapshot(MenuSchema(pizza_types=[
+        MenuPizzaTypeSchema(**pizza_type.dict(), max_makeable=availability.get(pizza_type.id, 0))
+        for pizza_type in pizza_types
+    ]))
+
+
+def get_menu(db: Session) -> MenuSnapshot:
+    """The serialized menu. A stock change only merges the new counts into the cached menu, a catalog change rebuilds
+    it."""
+    return catalog_cache.get_snapshot(
+        'menu', MENU_SOURCES + (stock_availability_crud.PIZZA_TYPE_AVAILABILITY,), _merge_availability, db)
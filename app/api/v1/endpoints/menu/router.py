@@ -0,0 +1,18 @@
+from fastapi import APIRouter, Depends, Request, Response
+from sqlalchemy.orm import Session
+
+import app.api.v1.endpoints.menu.crud as menu_crud
+from app.api.v1.endpoints.menu.schemas import MenuSchema
+from app.api.v1.etag import is_not_modified, not_modified
+from app.database.session import get_replica_db
+
+router = APIRouter()
+
+
+@router.get('', response_model=MenuSchema, tags=['menu'])
+def get_menu(request: Request, db: Session = Depends(get_replica_db)):
+    menu = menu_crud.get_menu(db)
+    if is_not_modified(request, menu.etag):
+        return not_modified(menu.etag)
+    # The snapshot is serialized already, the response model only documents its schema
+    return Response(content=menu.body, media_type='application/json', headers={'ETag': menu.etag})
@@ -0,0 +1,29 @@
+from typing import List
+
+from pydantic import BaseModel
+
+from app.api.v1.endpoints.dough.schemas import DoughListItemSchema
+from app.api.v1.endpoints.pizza_type.schemas import PizzaTypeSchema
+from app.api.v1.endpoints.sauce.schemas import SauceListItemSchema
+from app.api.v1.endpoints.topping.schemas import ToppingListItemSchema
+
+
+class MenuToppingSchema(ToppingListItemSchema):
+    # Amount of the topping in the recipe of the pizza type
+    quantity: int
+
+
+class MenuPizzaTypeCatalogSchema(PizzaTypeSchema):
+    # A pizza type of the menu without the number of pizzas that can be made, which changes with the stock
+    dough: DoughListItemSchema
+    sauces: List[SauceListItemSchema]
+    toppings: List[MenuToppingSchema]
+
+
+class MenuPizzaTypeSchema(MenuPizzaTypeCatalogSchema):
+    # Number of pizzas of this type that can still be made from the stock, 0 means sold out
+    max_makeable: int
+
+
+class MenuSchema(BaseModel):
+    pizza_types: List[MenuPizzaTypeSchema]
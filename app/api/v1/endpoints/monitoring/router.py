@@ -0,0 +1,31 @@
+from typing import List
+
+from fastapi import APIRouter
+
+from app.api.v1.endpoints.monitoring.schemas import CatalogCacheStatisticsSchema, ConnectionHoldStatisticsSchema, \
+    PoolStatisticsSchema, ReplicaStatisticsSchema
+from app.database.catalog_cache import catalog_cache
+from app.database.connection import get_pool_statistics, get_replica_statistics
+from app.database.session import get_connection_hold_statistics
+
+router = APIRouter()
+
+
+@router.get('/pool', response_model=PoolStatisticsSchema, tags=['monitoring'])
+def get_pool_statistics_of_database():
+    return get_pool_statistics()
+
+
+@router.get('/replicas', response_model=List[ReplicaStatisticsSchema], tags=['monitoring'])
+def get_replica_statistics_of_database():
+    return get_replica_statistics()
+
+
+@router.get('/sessions', response_model=ConnectionHoldStatisticsSchema, tags=['monitoring'])
+def get_connection_hold_statistics_of_requests():
+    return get_connection_hold_statistics()
+
+
+@router.get('/catalog-cache', response_model=List[CatalogCacheStatisticsSchema], tags=['monitoring'])
+def get_catalog_cache_statistics():
+    return catalog_cache.get_statistics()
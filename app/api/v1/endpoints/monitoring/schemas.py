@@ -0,0 +1,45 @@
+from typing import List, Optional
+
+from pydantic import BaseModel
+
+
+class HistogramBucketSchema(BaseModel):
+    le: Optional[float]
+    count: int
+
+
+class PoolStatisticsSchema(BaseModel):
+    size: int
+    max_overflow: int
+    timeout: float
+    checked_in: int
+    checked_out: int
+    overflow: int
+    checkouts: int
+    timeouts: int
+    wait_time_total: float
+    wait_time_max: float
+    wait_time_avg: float
+    checkout_latency_histogram: List[HistogramBucketSchema]
+
+
+class ConnectionHoldStatisticsSchema(BaseModel):
+    requests: int
+    hold_time_total: float
+    hold_time_max: float
+    hold_time_avg: float
+    hold_time_histogram: List[HistogramBucketSchema]
+
+
+class ReplicaStatisticsSchema(BaseModel):
+    host: str
+    replication_lag: Optional[float]
+    pool: PoolStatisticsSchema
+
+
+class CatalogCacheStatisticsSchema(BaseModel):
+    entity_type: str
+    version: int
+    cached: bool
+    hits: int
+    misses: int
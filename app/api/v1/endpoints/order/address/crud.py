@@ -1,8 +1,11 @@
 import uuid
+from typing import Optional, Tuple
 
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 
 from app.api.v1.endpoints.order.address.schemas import AddressCreateSchema
+from app.api.v1.pagination import keyset
 from app.database.models import Address
 
 
@@ -15,7 +18,7 @@ def create_address(schema: AddressCreateSchema, db: Session):
 
 
 def get_address_by_id(address_id: uuid.UUID, db: Session):
-    entity = db.query(Address).filter(Address.id == address_id).first()
+    entity = db.get(Address, address_id)
     return entity
 
 
@@ -35,5 +38,5 @@ def update_address(address: Address, changed_address: AddressCreateSchema, db: S
     return address
 
 
-def get_all_addresses(db: Session):
-    return db.query(Address).all()
+def get_all_addresses(db: Session, after: Optional[Tuple] = None, limit: Optional[int] = None):
+    return db.scalars(keyset(select(Address), (Address.id,), after, limit)).all()
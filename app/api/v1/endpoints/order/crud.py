@@ -1,53 +1,154 @@
 import uuid
 import logging
-from typing import List, Optional
+from collections import defaultdict
+from decimal import Decimal
+from itertools import chain
+from typing import Dict, Iterable, List, Optional, Tuple
 
-from sqlalchemy import func
-from sqlalchemy.orm import Session
+from sqlalchemy import (
+    Integer, Uuid, cast, delete, event, func, insert, inspect, lambda_stmt, literal, or_, select, true, update,
+)
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.orm import Session, selectinload
 
-from app.api.v1.endpoints.order.address.crud import create_address
+import app.api.v1.endpoints.order.stock_logic.stock_beverage_crud as stock_beverage_crud
+import app.api.v1.endpoints.order.stock_logic.stock_ingredients_crud as stock_ingredients_crud
+import app.api.v1.endpoints.order.stock_logic.stock_reservation_crud as stock_reservation_crud
 from app.api.v1.endpoints.order.schemas import (
-    JoinedPizzaPizzaTypeSchema, OrderBeverageQuantityCreateSchema, OrderCreateSchema,
+    JoinedPizzaPizzaTypeSchema, OrderBeverageQuantityCreateSchema, OrderCheckoutSchema, OrderCreateSchema,
+    OrderPizzaQuantitySchema,
 )
-from app.database.models import Order, Pizza, PizzaType, OrderBeverageQuantity, Beverage, OrderStatus
+from app.api.v1.pagination import keyset
+from app.database.connection import SessionLocal
+from app.database.models import Address, Order, Pizza, PizzaType, OrderBeverageQuantity, Beverage, OrderStatus
 
 
-def create_order(schema: OrderCreateSchema, db: Session):
-    address = create_address(schema.address, db)
+def _new_order(schema: OrderCreateSchema):
     order = Order(user_id=schema.user_id)
-    order.address = address
+    order.address = Address(**schema.address.dict())
     order.order_status = OrderStatus.TRANSMITTED
+    order.reserved_until = stock_reservation_crud.reservation_deadline()
+    return order
+
+
+def create_order(schema: OrderCreateSchema, db: Session):
+    order = _new_order(schema)
     db.add(order)
     db.commit()
     logging.info('Order created with ID {}; user ID {}; status {}'.format(order.id, order.user_id, order.order_status))
     return order
 
 
-def get_order_by_id(order_id: uuid.UUID, db: Session):
-    entity = db.query(Order).filter(Order.id == order_id).first()
+def checkout_order(schema: OrderCheckoutSchema, db: Session):
+    """Creates the order with its address, pizzas and beverages and takes their stock in one transaction.
+
+    The pizza types and beverages must exist. Returns None and rolls back everything if the stock of any ingredient
+    or beverage is not sufficient.
+    """
+    order = _new_order(schema)
+    db.add(order)
+    db.flush()
+
+    if _insert_pizzas(order, count_pizza_types(schema.pizzas), db) is None:
+        db.rollback()
+        return None
+
+    # The same beverage may be listed more than once, but it is a single row of the order
+    beverage_quantities: Dict[uuid.UUID, int] = {}
+    for beverage_quantity in schema.beverages:
+        beverage_quantities[beverage_quantity.beverage_id] = \
+            beverage_quantities.get(beverage_quantity.beverage_id, 0) + beverage_quantity.quantity
+    if not stock_beverage_crud.take_beverage_demand(beverage_quantities, db, order.id):
+        db.rollback()
+        return None
+    prices = dict(db.execute(select(Beverage.id, Beverage.price).where(Beverage.id.in_(beverage_quantities))).all())
+    for beverage_id, quantity in beverage_quantities.items():
+        order.beverages.append(
+            OrderBeverageQuantity(beverage_id=beverage_id, quantity=quantity, unit_price=prices[beverage_id]))
+
+    db.commit()
+    logging.info('Order created with ID {}; user ID {}; {} pizza types; {} beverages'.format(
+        order.id, order.user_id, len(schema.pizzas), len(beverage_quantities)))
+    return order
+
+
+def copy_order(schema: OrderCreateSchema, copy_order_id: uuid.UUID, db: Session):
+    """Creates the order with the same pizzas and beverages as the copied order in one transaction.
+
+    The stock is checked and taken once per ingredient and beverage and the items are copied with INSERT ... SELECT,
+    so the number of statements does not grow with the size of the copied order. The copies cost the current prices.
+    Returns None and rolls back everything if the stock is not sufficient.
+    """
+    order = _new_order(schema)
+    db.add(order)
+    db.flush()
+
+    dough_demand, topping_demand = stock_ingredients_crud.get_ingredient_demand_of_order(copy_order_id, db)
+    beverage_demand = dict(db.execute(
+        select(OrderBeverageQuantity.beverage_id, OrderBeverageQuantity.quantity)
+        .where(OrderBeverageQuantity.order_id == copy_order_id)).all())
+    if not stock_ingredients_crud.take_ingredient_demand(dough_demand, topping_demand, db, order.id) \
+            or not stock_beverage_crud.take_beverage_demand(beverage_demand, db, order.id):
+        db.rollback()
+        return None
+
+    db.execute(insert(Pizza).from_select(
+        ['id', 'pizza_type_id', 'order_id', 'unit_price'],
+        select(func.gen_random_uuid(), Pizza.pizza_type_id, literal(order.id), PizzaType.price)
+        .join(PizzaType, PizzaType.id == Pizza.pizza_type_id)
+        .where(Pizza.order_id == copy_order_id)))
+    db.execute(insert(OrderBeverageQuantity).from_select(
+        ['order_id', 'beverage_id', 'quantity', 'unit_price'],
+        select(literal(order.id), OrderBeverageQuantity.beverage_id, OrderBeverageQuantity.quantity, Beverage.price)
+        .join(Beverage, Beverage.id == OrderBeverageQuantity.beverage_id)
+        .where(OrderBeverageQuantity.order_id == copy_order_id)))
+    refresh_order_totals(db, [order.id])
+
+    db.commit()
+    logging.info('Order created with ID {}; user ID {}; copied from order ID {}'.format(
+        order.id, order.user_id, copy_order_id))
+    return order
+
+
+def get_order_by_id(order_id: uuid.UUID, db: Session, *options):
+    # Only the relationships of the given loader options are loaded, e.g. joinedload(Order.address) for OrderSchema
+    entity = db.get(Order, order_id, options=options)
     if not entity:
         logging.error('Order with ID {} not found'.format(order_id))
     return entity
 
 
-def get_all_orders(db: Session, status: Optional[OrderStatus] = None):
+def get_updated_at_of_order(order_id: uuid.UUID, db: Session):
+    """updated_at of the order without loading it, None if it doesn't exist."""
+    return db.scalar(lambda_stmt(lambda: select(Order.updated_at).where(Order.id == order_id)))
+
+
+def get_all_orders(db: Session, status: Optional[OrderStatus] = None, after: Optional[Tuple] = None,
+                   limit: Optional[int] = None):
+    """Orders by (order_datetime, id), starting after the given key; limit + 1 of them if a limit is given."""
+    # The address is part of every listed order: one query for all of them instead of one per order
+    statement = select(Order).options(selectinload(Order.address))
     if status:
-        return db.query(Order).filter(Order.order_status == status).all()
-    return db.query(Order).all()
+        statement = statement.where(Order.order_status == status)
+    return db.scalars(keyset(statement, (Order.order_datetime, Order.id), after, limit)).all()
 
 
 def delete_order_by_id(order_id: uuid.UUID, db: Session):
-    entity = get_order_by_id(order_id, db)
-    if entity:
-        db.delete(entity)
-        db.commit()
-        logging.info('Order with ID {} deleted'.format(order_id))
-    else:
+    """Deletes the order with its items and address and puts its stock back. Returns False if it doesn't exist."""
+    if not stock_reservation_crud.delete_orders(db, Order.id == order_id):
+        db.rollback()
         logging.error('Failed to delete order with ID {}: not found'.format(order_id))
+        return False
+    db.commit()
+    logging.info('Order with ID {} deleted'.format(order_id))
+    return True
 
 
 def update_order_status(order: Order, changed_order: OrderStatus, db: Session):
     setattr(order, 'order_status', changed_order)
+    if changed_order != OrderStatus.TRANSMITTED:
+        # The order is being made, its stock is no longer released
+        order.reserved_until = None
     db.commit()
     db.refresh(order)
     logging.info('Order ID {} status updated to {}'.format(order.id, changed_order))
@@ -58,6 +159,7 @@ def create_pizza(pizza_type: PizzaType, db: Session):
     entity = Pizza()
     if pizza_type:
         entity.pizza_type_id = pizza_type.id
+        entity.unit_price = pizza_type.price
     db.add(entity)
     db.commit()
     logging.info('Pizza created with type ID {}'.format(pizza_type.id))
@@ -66,22 +168,70 @@ def create_pizza(pizza_type: PizzaType, db: Session):
 
 def add_pizza_to_order(order: Order, pizza_type: PizzaType, db: Session):
     pizza = create_pizza(pizza_type, db)
-    order.pizzas.append(pizza)
+    pizza.order_id = order.id
     db.commit()
     db.refresh(order)
     logging.info('Pizza with ID {} added to order ID {}'.format(pizza.id, order.id))
     return pizza
 
 
+def count_pizza_types(pizza_quantities: List[OrderPizzaQuantitySchema]):
+    counts: Dict[uuid.UUID, int] = defaultdict(int)
+    for pizza_quantity in pizza_quantities:
+        counts[pizza_quantity.pizza_type_id] += pizza_quantity.quantity
+    return counts
+
+
+def _insert_pizzas(order: Order, pizza_type_counts: Dict[uuid.UUID, int], db: Session):
+    # Takes the ingredients of all pizzas from stock and inserts the pizzas with one statement, without committing.
+    # Returns the ids of the new pizzas or None if the stock is not sufficient
+    if not pizza_type_counts:
+        return []
+    dough_demand, topping_demand = stock_ingredients_crud.get_ingredient_demand(pizza_type_counts, db)
+    if not stock_ingredients_crud.take_ingredient_demand(dough_demand, topping_demand, db, order.id):
+        return None
+
+    # One row per pizza is generated by the database, the request only sends one count per pizza type
+    pizza_type_ids, counts = zip(*sorted(pizza_type_counts.items()))
+    lines = func.unnest(cast(list(pizza_type_ids), ARRAY(Uuid)), cast(list(counts), ARRAY(Integer))) \
+        .table_valued('pizza_type_id', 'count') \
+        .render_derived(name='lines')
+    units = func.generate_series(1, lines.c.count).table_valued('unit').lateral('units')
+    pizzas = select(func.gen_random_uuid(), PizzaType.id, literal(order.id), PizzaType.price) \
+        .select_from(lines) \
+        .join(PizzaType, PizzaType.id == lines.c.pizza_type_id) \
+        .join(units, true())
+    pizza_ids = db.execute(insert(Pizza)
+                           .from_select(['id', 'pizza_type_id', 'order_id', 'unit_price'], pizzas)
+                           .returning(Pizza.id)).scalars().all()
+    refresh_order_totals(db, [order.id])
+    return pizza_ids
+
+
+def add_pizzas_to_order(order: Order, pizza_type_counts: Dict[uuid.UUID, int], db: Session):
+    if not stock_reservation_crud.extend_reservation(order.id, db):
+        db.rollback()
+        return None
+    pizza_ids = _insert_pizzas(order, pizza_type_counts, db)
+    if pizza_ids is None:
+        db.rollback()
+        return None
+    db.commit()
+    logging.info('{} pizzas added to order ID {}'.format(len(pizza_ids), order.id))
+    return pizza_ids
+
+
 def get_pizza_by_id(pizza_id: uuid.UUID, db: Session):
-    entity = db.query(Pizza).filter(Pizza.id == pizza_id).first()
+    entity = db.get(Pizza, pizza_id)
     if not entity:
         logging.error('Pizza with ID {} not found'.format(pizza_id))
     return entity
 
 
 def get_all_pizzas_of_order(order: Order, db: Session):
-    pizza_types = db.query(Pizza.id, PizzaType.name, PizzaType.price, PizzaType.description, PizzaType.dough_id) \
+    # The price the pizza was ordered for, not the current price of its type
+    pizza_types = db.query(Pizza.id, PizzaType.name, Pizza.unit_price.label('price'), PizzaType.description,
+                           PizzaType.dough_id) \
         .join(Pizza.pizza_type) \
         .filter(Pizza.order_id == order.id)
 
@@ -92,21 +242,44 @@ def get_all_pizzas_of_order(order: Order, db: Session):
     return returnlist
 
 
+def _detach(db: Session, model, identity):
+    # The DELETE bypasses the session, detach a loaded row like a delete through the session would
+    loaded = db.identity_map.get(db.identity_key(model, identity))
+    if loaded is not None:
+        db.expunge(loaded)
+
+
 def delete_pizza_from_order(order: Order, pizza_id: uuid.UUID, db: Session):
-    entity = db.query(Pizza).filter(Pizza.order_id == order.id, Pizza.id == pizza_id).first()
-    if entity:
-        db.delete(entity)
-        db.commit()
-        logging.info('Pizza with ID {} deleted from order ID {}'.format(pizza_id, order.id))
-        return True
-    else:
+    """Deletes the pizza of the order and puts its ingredients back, with one commit. Returns False if the order has
+    no such pizza (any more).
+
+    Only the request whose DELETE returned the pizza restocks it, so concurrent deletes of the same pizza can't put
+    its ingredients back twice. The stock of an expired order is back already.
+    """
+    holds_stock = stock_reservation_crud.extend_reservation(order.id, db)
+    pizzas = Pizza.__table__
+    pizza_type_id = db.execute(
+        delete(pizzas)
+        .where(pizzas.c.id == pizza_id, pizzas.c.order_id == order.id)
+        .returning(pizzas.c.pizza_type_id),
+    ).scalar()
+    if pizza_type_id is None:
+        db.rollback()
         logging.error('Failed to delete pizza with ID {} from order ID {}: not found'.format(pizza_id, order.id))
         return False
+    if holds_stock:
+        stock_ingredients_crud.return_ingredients_of_pizza_type(pizza_type_id, db, order.id)
+    refresh_order_totals(db, [order.id])
+    _detach(db, Pizza, pizza_id)
+    db.commit()
+    logging.info('Pizza with ID {} deleted from order ID {}'.format(pizza_id, order.id))
+    return True
 
 
 def create_beverage_quantity(order: Order, schema: OrderBeverageQuantityCreateSchema, db: Session):
-    entity = OrderBeverageQuantity(**schema.dict())
-    order.beverages.append(entity)
+    entity = OrderBeverageQuantity(
+        **schema.dict(), order_id=order.id, unit_price=db.get(Beverage, schema.beverage_id).price)
+    db.add(entity)
     db.commit()
     db.refresh(order)
     logging.info('Beverage quantity created for order ID {}'.format(order.id))
@@ -114,10 +287,7 @@ def create_beverage_quantity(order: Order, schema: OrderBeverageQuantityCreateSc
 
 
 def get_beverage_quantity_by_id(order_id: uuid.UUID, beverage_id: uuid.UUID, db: Session):
-    entity = db.query(OrderBeverageQuantity) \
-        .filter(OrderBeverageQuantity.beverage_id == beverage_id,
-                OrderBeverageQuantity.order_id == order_id) \
-        .first()
+    entity = db.get(OrderBeverageQuantity, (order_id, beverage_id))
     if not entity:
         logging.error('Beverage quantity with beverage ID {} and order ID {} not found'.format(beverage_id, order_id))
     return entity
@@ -128,50 +298,122 @@ def get_joined_beverage_quantities_by_order(order_id: uuid.UUID, db: Session):
         .filter(OrderBeverageQuantity.order_id == order_id).all()
 
 
-def update_beverage_quantity_of_order(order_id: uuid.UUID, beverage_id: uuid.UUID, new_quantity: int, db: Session):
-    order_beverage = db.query(OrderBeverageQuantity).filter(order_id == OrderBeverageQuantity.order_id,
-                                                            beverage_id == OrderBeverageQuantity.beverage_id).first()
-    if order_beverage:
-        setattr(order_beverage, 'quantity', new_quantity)
-        db.commit()
-        db.refresh(order_beverage)
-        logging.info('Beverage quantity updated for beverage ID {} in order ID {}'.format(beverage_id, order_id))
-        return order_beverage
-    else:
+def update_beverage_quantity_of_order(
+        order_id: uuid.UUID, beverage_id: uuid.UUID, new_quantity: int, db: Session) -> Optional[int]:
+    """Sets the quantity of the beverage line of the order and returns its previous quantity, None if there is no
+    such line.
+
+    The previous quantity is read under the row lock of the update, so concurrent updates of the line see each
+    other's quantity. The caller changes the stock by the difference and commits.
+    """
+    lines = OrderBeverageQuantity.__table__
+    previous = select(lines.c.order_id, lines.c.beverage_id, lines.c.quantity) \
+        .where(lines.c.order_id == order_id, lines.c.beverage_id == beverage_id) \
+        .with_for_update() \
+        .subquery('previous')
+    old_quantity = db.execute(
+        update(lines)
+        .where(lines.c.order_id == previous.c.order_id, lines.c.beverage_id == previous.c.beverage_id)
+        .values(quantity=new_quantity)
+        .returning(previous.c.quantity),
+    ).scalar()
+    if old_quantity is None:
         logging.error('Beverage quantity with beverage ID {} and order ID {} not found'.format(beverage_id, order_id))
         return None
+    refresh_order_totals(db, [order_id])
+    logging.info('Beverage quantity updated for beverage ID {} in order ID {}'.format(beverage_id, order_id))
+    return old_quantity
 
 
 def delete_beverage_from_order(order_id: uuid.UUID, beverage_id: uuid.UUID, db: Session):
-    entity = db.query(OrderBeverageQuantity).filter(order_id == OrderBeverageQuantity.order_id,
-                                                    beverage_id == OrderBeverageQuantity.beverage_id).first()
-    if entity:
-        db.delete(entity)
-        db.commit()
-        logging.info('Beverage with ID {} deleted from order ID {}'.format(beverage_id, order_id))
-        return True
-    else:
+    """Deletes the beverage line of the order and puts its quantity back, with one commit. Returns False if the
+    order has no such line (any more).
+
+    Like delete_pizza_from_order, only the request whose DELETE returned the line restocks it.
+    """
+    holds_stock = stock_reservation_crud.extend_reservation(order_id, db)
+    lines = OrderBeverageQuantity.__table__
+    quantity = db.execute(
+        delete(lines)
+        .where(lines.c.order_id == order_id, lines.c.beverage_id == beverage_id)
+        .returning(lines.c.quantity),
+    ).scalar()
+    if quantity is None:
+        db.rollback()
         logging.error('Failed to delete beverage with ID {} from order ID {}: not found'.format(beverage_id, order_id))
         return False
-
-
-def get_price_of_order(order_id: uuid.UUID, db: Session):
-    price_beverage: float = 0
-    for row in db.query(Beverage.price, OrderBeverageQuantity.quantity) \
-            .join(OrderBeverageQuantity) \
-            .join(Order) \
-            .filter(Order.id == order_id):
-        price_beverage += (row.price * row.quantity)
-
-    price_pizza = db.query(func.sum(PizzaType.price)) \
-        .join(Pizza) \
-        .join(Order) \
-        .filter(Order.id == order_id).first()[0]
-
-    if price_pizza is None:
-        logging.info('Calculated price for order ID {}: {}'.format(order_id, price_beverage))
-        return price_beverage
-
-    total_price = price_pizza + price_beverage
-    logging.info('Calculated price for order ID {}: {}'.format(order_id, total_price))
-    return total_price
+    if holds_stock:
+        stock_beverage_crud.return_beverage_demand({beverage_id: quantity}, db, order_id)
+    refresh_order_totals(db, [order_id])
+    _detach(db, OrderBeverageQuantity, (order_id, beverage_id))
+    db.commit()
+    logging.info('Beverage with ID {} deleted from order ID {}'.format(beverage_id, order_id))
+    return True
+
+
+def _order_totals():
+    # Total price, number of pizzas and number of beverages of every order, from the prices on its own lines.
+    # Correlated aggregates instead of joining both item tables, which would multiply the rows of one by the other
+    pizza_total = select(func.sum(Pizza.unit_price)).where(Pizza.order_id == Order.id).scalar_subquery()
+    pizza_count = select(func.count()).where(Pizza.order_id == Order.id).scalar_subquery()
+    beverage_total = select(func.sum(OrderBeverageQuantity.unit_price * OrderBeverageQuantity.quantity)) \
+        .where(OrderBeverageQuantity.order_id == Order.id) \
+        .scalar_subquery()
+    beverage_count = select(func.sum(OrderBeverageQuantity.quantity)) \
+        .where(OrderBeverageQuantity.order_id == Order.id) \
+        .scalar_subquery()
+    return {
+        'total_price': func.coalesce(pizza_total, 0) + func.coalesce(beverage_total, 0),
+        'pizza_count': pizza_count,
+        'beverage_count': func.coalesce(beverage_count, 0),
+    }
+
+
+def refresh_order_totals(db: Session, order_ids: Iterable[uuid.UUID]):
+    """Recomputes the stored totals of the given orders with one UPDATE, without committing."""
+    order_ids = list(order_ids)
+    if not order_ids:
+        return
+    result = db.connection().execute(update(Order).where(Order.id.in_(order_ids)).values(**_order_totals()))
+    logging.debug('Refreshed the totals of {} orders'.format(result.rowcount))
+
+
+@event.listens_for(SessionLocal, 'after_flush')
+def _refresh_totals_after_flush(session, flush_context):
+    # Items of orders changed through the ORM, the set-based inserts refresh explicitly
+    order_ids = set()
+    for entity in chain(session.new, session.dirty, session.deleted):
+        if isinstance(entity, (Pizza, OrderBeverageQuantity)):
+            order_history = inspect(entity).attrs.order_id.history
+            order_ids.update(order_id for order_id in chain(order_history.sum(), [entity.order_id]) if order_id)
+    refresh_order_totals(session, order_ids)
+
+
+def get_price_of_order(order_id: uuid.UUID, db: Session) -> Optional[Decimal]:
+    """Stored total price of the order, None if the order doesn't exist."""
+    price = db.scalar(select(Order.total_price).where(Order.id == order_id))
+    if price is None:
+        logging.error('Failed to get the price of order ID {}: not found'.format(order_id))
+        return None
+    logging.info('Price of order ID {}: {}'.format(order_id, price))
+    return price
+
+
+def get_prices_of_orders(order_ids: List[uuid.UUID], db: Session) -> Dict[uuid.UUID, Decimal]:
+    """Stored total price of every existing order of order_ids, with one query."""
+    prices = dict(db.execute(select(Order.id, Order.total_price).where(Order.id.in_(order_ids))).all())
+    logging.info('Got the prices of {} orders'.format(len(prices)))
+    return prices
+
+
+def find_order_total_drift(db: Session):
+    """Orders whose stored totals differ from their pizzas and beverages, with one query."""
+    stored = [Order.total_price, Order.pizza_count, Order.beverage_count]
+    computed = select(
+        Order.id, *stored, *(total.label('computed_' + name) for name, total in _order_totals().items()),
+    ).subquery()
+    drift = []
+    for row in db.execute(select(computed).where(or_(*(
+            computed.c[column.key] != computed.c['computed_' + column.key] for column in stored)))):
+        drift.append({'order_id': row.id, 'stored': tuple(row[1:4]), 'computed': tuple(row[4:7])})
+    return drift
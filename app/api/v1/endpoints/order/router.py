@@ -1,41 +1,44 @@
+import datetime
 import uuid
 from typing import List, Optional, TypeVar
 
-from fastapi import APIRouter, Depends, Request, Response, status, HTTPException
+from fastapi import APIRouter, Depends, Query, Request, Response, status, HTTPException
 from fastapi.responses import RedirectResponse
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, joinedload, selectinload
 
 import app.api.v1.endpoints.beverage.crud as beverage_crud
 import app.api.v1.endpoints.order.crud as order_crud
+import app.api.v1.endpoints.order.stock_logic.stock_availability_crud as stock_availability_crud
 import app.api.v1.endpoints.order.stock_logic.stock_beverage_crud as stock_beverage_crud
-import app.api.v1.endpoints.order.stock_logic.stock_ingredients_crud as stock_ingredients_crud
 import app.api.v1.endpoints.pizza_type.crud as pizza_type_crud
 import app.api.v1.endpoints.user.crud as user_crud
 from app.api.v1.endpoints.order.schemas \
     import OrderSchema, PizzaCreateSchema, JoinedPizzaPizzaTypeSchema, \
     PizzaWithoutPizzaTypeSchema, OrderBeverageQuantityCreateSchema, JoinedOrderBeverageQuantitySchema, \
-    OrderPriceSchema, OrderBeverageQuantityBaseSchema, OrderCreateSchema, OrderStatus, OrderUpdateOrderStatusSchema
+    OrderPriceSchema, OrderBeverageQuantityBaseSchema, OrderCreateSchema, OrderStatus, OrderUpdateOrderStatusSchema, \
+    OrderCheckoutSchema, OrderPizzaQuantitySchema, CartSchema, CartAvailabilitySchema, OrderIdPriceSchema, \
+    OrderBeverageQuantitySchema
 from app.api.v1.endpoints.user.schemas import UserSchema
-from app.database.connection import SessionLocal
+from app.api.v1.etag import entity_tag, http_date, is_not_modified, not_modified
+from app.api.v1.idempotency.route import IdempotentRoute
+from app.api.v1.pagination import PageParams, paginate
+from app.database.models import Order
+from app.database.session import get_db, replica_db
 
-router = APIRouter()
-
-
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+router = APIRouter(route_class=IdempotentRoute)
 
 
 @router.get('', response_model=List[OrderSchema], tags=['order'])
 def get_all_orders(
+        request: Request,
+        response: Response,
         order_status: Optional[OrderStatus] = None,
-        db: Session = Depends(get_db),
+        page: PageParams = Depends(),
+        db: Session = Depends(replica_db(max_staleness=1)),
 ):
-    orders = order_crud.get_all_orders(db, order_status)
-    return orders
+    after = page.after(datetime.datetime.fromisoformat, uuid.UUID)
+    orders = order_crud.get_all_orders(db, order_status, after, page.limit)
+    return paginate(request, response, orders, page.limit, lambda order: (order.order_datetime.isoformat(), order.id))
 
 
 @router.post('', response_model=OrderSchema, status_code=status.HTTP_201_CREATED, tags=['order'])
@@ -44,53 +47,92 @@ def create_order(order: OrderCreateSchema, db: Session = Depends(get_db),
     if user_crud.get_user_by_id(order.user_id, db) is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
 
-    # Create Order
-    new_order = order_crud.create_order(order, db)
-
     # Check if Copy Order is specified
     if copy_order_id is None:
-        return new_order
+        return order_crud.create_order(order, db)
 
     # Check Copy Order
-    copy_order = order_crud.get_order_by_id(copy_order_id, db)
-    if not copy_order:
-        order_crud.delete_order_by_id(new_order.id, db)
+    if not order_crud.get_order_by_id(copy_order_id, db):
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
 
-    # Copy Pizzas
-    for pizza in copy_order.pizzas:
-        pizza_type = pizza.pizza_type
-        if not stock_ingredients_crud.ingredients_are_available(pizza_type):
-            # Not enough Stock
-            order_crud.delete_order_by_id(new_order.id, db)
-            raise HTTPException(status_code=409, detail='Conflict')
-
-        order_crud.add_pizza_to_order(new_order, pizza_type, db)
-        stock_ingredients_crud.reduce_stock_of_ingredients(pizza_type, db)
-
-    # Copy Beverages
-    for beverage_quantity in copy_order.beverages:
-        schema = OrderBeverageQuantityCreateSchema(
-            **{'quantity': beverage_quantity.quantity, 'beverage_id': beverage_quantity.beverage_id})
-        if not stock_beverage_crud.change_stock_of_beverage(beverage_quantity.beverage_id,
-                                                            -beverage_quantity.quantity, db):
-            # Not enough Stock
-            order_crud.delete_order_by_id(new_order.id, db)
-            raise HTTPException(status_code=409, detail='Conflict')
-
-        order_crud.create_beverage_quantity(new_order, schema, db)
+    # Create Order with the Pizzas and Beverages of the Copy Order, nothing is stored if the Stock is not sufficient
+    new_order = order_crud.copy_order(order, copy_order_id, db)
+    if not new_order:
+        raise HTTPException(status_code=409, detail='Conflict')
+    return new_order
 
+
+def _check_pizza_types(pizza_quantities: List[OrderPizzaQuantitySchema], db: Session):
+    # One Query for all Pizza Types
+    if not pizza_type_crud.pizza_types_exist({pizza_quantity.pizza_type_id for pizza_quantity in pizza_quantities}, db):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+
+
+@router.post('/checkout', response_model=OrderSchema, status_code=status.HTTP_201_CREATED, tags=['order'])
+def checkout_order(order: OrderCheckoutSchema, db: Session = Depends(get_db)):
+    if user_crud.get_user_by_id(order.user_id, db) is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+
+    # Check if all Pizza Types and Beverages exist, the Quantities are validated by the Schema
+    _check_pizza_types(order.pizzas, db)
+    for beverage_quantity in order.beverages:
+        if not beverage_crud.get_beverage_by_id(beverage_quantity.beverage_id, db):
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+
+    # Create Order with all Items, nothing is stored if the Stock is not sufficient
+    new_order = order_crud.checkout_order(order, db)
+    if not new_order:
+        raise HTTPException(status_code=409, detail='Conflict')
     return new_order
 
 
+@router.post('/availability', response_model=CartAvailabilitySchema, tags=['order'])
+def check_cart_availability(cart: CartSchema, db: Session = Depends(get_db)):
+    # Lines of the same Pizza Type or Beverage are checked as one
+    beverage_counts = {}
+    for beverage_quantity in cart.beverages:
+        beverage_counts[beverage_quantity.beverage_id] = \
+            beverage_counts.get(beverage_quantity.beverage_id, 0) + beverage_quantity.quantity
+    pizza_type_counts = order_crud.count_pizza_types(cart.pizzas)
+
+    availability = stock_availability_crud.get_cart_availability(pizza_type_counts, beverage_counts, db)
+    if availability is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    return availability
+
+
+@router.get('/prices', response_model=List[OrderIdPriceSchema], tags=['order'])
+def get_prices_of_orders(
+        order_id: List[uuid.UUID] = Query(default=[], max_items=1000),
+        db: Session = Depends(get_db),
+):
+    # Prices of many Orders with one Query, e.g. for the Kitchen Dashboard. Unknown Orders are left out
+    prices = order_crud.get_prices_of_orders(order_id, db)
+    return [{'order_id': found_id, 'price': prices[found_id]} for found_id in dict.fromkeys(order_id)
+            if found_id in prices]
+
+
 @router.get('/{order_id}', response_model=OrderSchema, tags=['order'])
 def get_order(
         order_id: uuid.UUID,
+        request: Request,
+        response: Response,
         db: Session = Depends(get_db)):
-    order = order_crud.get_order_by_id(order_id, db)
+    # Polling clients mostly get a 304 from the version of the order alone, without loading it
+    updated_at = order_crud.get_updated_at_of_order(order_id, db)
+    if updated_at is None:
+        return Response(status_code=status.HTTP_404_NOT_FOUND)
+    etag = entity_tag(order_id, updated_at.isoformat())
+    if is_not_modified(request, etag):
+        return not_modified(etag, **{'Last-Modified': http_date(updated_at)})
+
+    order = order_crud.get_order_by_id(order_id, db, joinedload(Order.address))
     if not order:
         return Response(status_code=status.HTTP_404_NOT_FOUND)
 
+    # Tag of the loaded row, which may be newer than the one checked above
+    response.headers['ETag'] = entity_tag(order_id, order.updated_at.isoformat())
+    response.headers['Last-Modified'] = http_date(order.updated_at)
     return order
 
 
@@ -99,19 +141,9 @@ def delete_order(
         order_id: uuid.UUID,
         db: Session = Depends(get_db),
 ):
-    order = order_crud.get_order_by_id(order_id, db)
-    if not order:
+    # Puts Ingredients and Beverages back to Stock, only if this Request deleted the Order
+    if not order_crud.delete_order_by_id(order_id, db):
         return Response(status_code=status.HTTP_404_NOT_FOUND)
-
-    ordered_pizzas = order.pizzas
-    if ordered_pizzas:
-        for pizza in ordered_pizzas:
-            stock_ingredients_crud.increase_stock_of_ingredients(pizza.pizza_type, db)
-    order_beverages = order_crud.get_joined_beverage_quantities_by_order(order_id, db)
-    if order_beverages:
-        for order_beverage in order_beverages:
-            stock_beverage_crud.change_stock_of_beverage(order_beverage.beverage.id, order_beverage.quantity, db)
-    order_crud.delete_order_by_id(order_id, db)
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
 
@@ -128,11 +160,35 @@ def add_pizza_to_order(
     pizza_type = pizza_type_crud.get_pizza_type_by_id(schema.pizza_type_id, db)
     if not pizza_type:
         return Response(status_code=status.HTTP_404_NOT_FOUND)
-    if not stock_ingredients_crud.ingredients_are_available(pizza_type):
+    # Takes the Stock and adds the Pizza in one Transaction
+    pizza_ids = order_crud.add_pizzas_to_order(order, {pizza_type.id: 1}, db)
+    if pizza_ids is None:
         return Response(status_code=status.HTTP_409_CONFLICT)
-    stock_ingredients_crud.reduce_stock_of_ingredients(pizza_type, db)
-    pizza = order_crud.add_pizza_to_order(order, pizza_type, db)
-    return pizza
+    return {'id': pizza_ids[0]}
+
+
+@router.post(
+    '/{order_id}/pizzas/bulk',
+    response_model=List[PizzaWithoutPizzaTypeSchema],
+    status_code=status.HTTP_201_CREATED,
+    tags=['order'],
+)
+def add_pizzas_to_order(
+        order_id: uuid.UUID,
+        pizza_quantities: List[OrderPizzaQuantitySchema],
+        db: Session = Depends(get_db),
+):
+    order = order_crud.get_order_by_id(order_id, db)
+    if not order:
+        return Response(status_code=status.HTTP_404_NOT_FOUND)
+
+    _check_pizza_types(pizza_quantities, db)
+
+    # Takes the Stock of all Pizzas at once, no Pizza is added if it is not sufficient
+    pizza_ids = order_crud.add_pizzas_to_order(order, order_crud.count_pizza_types(pizza_quantities), db)
+    if pizza_ids is None:
+        raise HTTPException(status_code=409, detail='Conflict')
+    return [{'id': pizza_id} for pizza_id in pizza_ids]
 
 
 @router.get('/{order_id}/pizzas', response_model=List[JoinedPizzaPizzaTypeSchema], tags=['order'])
@@ -158,12 +214,7 @@ def delete_pizza_from_order(
     if not order:
         return Response(status_code=status.HTTP_404_NOT_FOUND)
 
-    pizza_entity = order_crud.get_pizza_by_id(pizza.id, db)
-    if not pizza_entity:
-        return Response(status_code=status.HTTP_404_NOT_FOUND)
-
-    stock_ingredients_crud.increase_stock_of_ingredients(pizza_entity.pizza_type, db)
-
+    # Puts the Ingredients back to Stock, committed together with the Deletion
     if not order_crud.delete_pizza_from_order(order, pizza.id, db):
         return Response(status_code=status.HTTP_404_NOT_FOUND)
 
@@ -175,7 +226,7 @@ def delete_pizza_from_order(
 # should be fixed in near future
 MyPyEitherItem = TypeVar(
     'MyPyEitherItem',
-    List[OrderBeverageQuantityCreateSchema],
+    List[OrderBeverageQuantitySchema],
     List[JoinedOrderBeverageQuantitySchema],
     None,
 )
@@ -191,22 +242,19 @@ def get_order_beverages(
         db: Session = Depends(get_db),
         join: bool = False,
 ):
-    order = order_crud.get_order_by_id(order_id, db)
+    # The Beverages are loaded with the Order unless the joined Query loads them
+    order = order_crud.get_order_by_id(order_id, db, *([] if join else [selectinload(Order.beverages)]))
     if not order:
         return Response(status_code=status.HTTP_404_NOT_FOUND)
 
-    order = order_crud.get_order_by_id(order_id, db)
-
-    beverages = order.beverages
     if join:
-        beverages = order_crud.get_joined_beverage_quantities_by_order(order.id, db)
-
-    return beverages
+        return order_crud.get_joined_beverage_quantities_by_order(order.id, db)
+    return order.beverages
 
 
 @router.post(
     '/{order_id}/beverages',
-    response_model=OrderBeverageQuantityCreateSchema,
+    response_model=OrderBeverageQuantitySchema,
     status_code=status.HTTP_201_CREATED,
     tags=['order'],
 )
@@ -220,10 +268,6 @@ def create_order_beverage(
     if not order:
         return Response(status_code=status.HTTP_404_NOT_FOUND)
 
-    # Check if new Quantity is valid
-    if beverage_quantity.quantity <= 0:
-        raise HTTPException(status_code=422)
-
     beverage = beverage_crud.get_beverage_by_id(beverage_quantity.beverage_id, db)
     if not beverage:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
@@ -233,9 +277,9 @@ def create_order_beverage(
         url = request.url_for('get_order_beverages', order_id=beverage_quantity_found.order_id)
         return RedirectResponse(url=url, status_code=status.HTTP_303_SEE_OTHER)
     # Change Stock of Beverage if enough is available
-    if not stock_beverage_crud.beverage_is_available(beverage_quantity.beverage_id, beverage_quantity.quantity, db):
+    if not stock_beverage_crud.change_stock_of_beverage(
+            beverage_quantity.beverage_id, -beverage_quantity.quantity, db, order_id):
         raise HTTPException(status_code=409, detail='Conflict')
-    stock_beverage_crud.change_stock_of_beverage(beverage_quantity.beverage_id, -beverage_quantity.quantity, db)
     new_beverage_quantity = order_crud.create_beverage_quantity(order, beverage_quantity, db)
     return new_beverage_quantity
 
@@ -254,27 +298,16 @@ def update_beverage_of_order(
     if not order:
         return Response(status_code=status.HTTP_404_NOT_FOUND)
 
-    # Check if new Quantity is valid
-    if beverage_quantity.quantity <= 0:
-        return Response(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY)
-
     beverage_id = beverage_quantity.beverage_id
-    order_beverage_quantity = order_crud.get_beverage_quantity_by_id(order_id, beverage_id, db)
-    if not order_beverage_quantity:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
     new_quantity = beverage_quantity.quantity
-    old_quantity = order_beverage_quantity.quantity
-    # Change Stock if enough is available: change Amount is Previous - New
-    if not stock_beverage_crud.change_stock_of_beverage(beverage_id, old_quantity - new_quantity, db):
+    old_quantity = order_crud.update_beverage_quantity_of_order(order_id, beverage_id, new_quantity, db)
+    if old_quantity is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    # Change Stock if enough is available: change Amount is Previous - New, committed with the new quantity
+    if not stock_beverage_crud.change_stock_of_beverage(beverage_id, old_quantity - new_quantity, db, order_id):
         raise HTTPException(status_code=409, detail='Conflict')
-    # Update
-    new_order_beverage_quantity = order_crud.update_beverage_quantity_of_order(
-        order_id, beverage_quantity.beverage_id, beverage_quantity.quantity, db)
     # Return updated OrderBeverageQuantity
-    if new_order_beverage_quantity:
-        return new_order_beverage_quantity
-    else:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    return order_crud.get_beverage_quantity_by_id(order_id, beverage_id, db)
 
 
 @router.delete(
@@ -289,14 +322,9 @@ def delete_beverage_from_order(
     if not order:
         return Response(status_code=status.HTTP_404_NOT_FOUND)
 
-    order_beverage = order_crud.get_beverage_quantity_by_id(order_id, beverage_id, db)
-    if not order_beverage:
+    # Delete OrderBeverageQuantity and increase Stock by its quantity
+    if not order_crud.delete_beverage_from_order(order_id, beverage_id, db):
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
-    # Increase Stock by the quantity of the deleted order
-    order_quantity = order_beverage.quantity
-    stock_beverage_crud.change_stock_of_beverage(beverage_id, order_quantity, db)
-    # Delete OrderBeverageQuantity
-    order_crud.delete_beverage_from_order(order_id, beverage_id, db)
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
 
@@ -310,11 +338,10 @@ def get_price_of_order(
         order_id: uuid.UUID,
         db: Session = Depends(get_db),
 ):
-    order = order_crud.get_order_by_id(order_id, db)
-    if not order:
-        return Response(status_code=status.HTTP_404_NOT_FOUND)
-
+    # One query, an unknown order has no price
     price = order_crud.get_price_of_order(order_id, db)
+    if price is None:
+        return Response(status_code=status.HTTP_404_NOT_FOUND)
 
     return OrderPriceSchema(**{
         'price': price,
@@ -334,10 +361,7 @@ def get_user_of_order(
     if not order:
         return Response(status_code=status.HTTP_404_NOT_FOUND)
 
-    order = order_crud.get_order_by_id(order_id, db)
-    if not order:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
-    user = order.user
+    user = user_crud.get_user_by_id(order.user_id, db)
     return user
 
 
@@ -350,9 +374,12 @@ def update_order_status(
     order_status_schema: OrderUpdateOrderStatusSchema,
     db: Session = Depends(get_db),
 ):
-    order = order_crud.get_order_by_id(order_id, db)
+    order = order_crud.get_order_by_id(order_id, db, joinedload(Order.address))
     if not order:
         return Response(status_code=status.HTTP_404_NOT_FOUND)
+    # The stock of an expired order is back in stock, and only the sweeper expires orders
+    if OrderStatus.EXPIRED in (order.order_status, order_status_schema.order_status):
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail='Conflict')
 
     updated_order = order_crud.update_order_status(order, order_status_schema.order_status, db)
     return updated_order
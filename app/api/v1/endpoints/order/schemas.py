@@ -1,19 +1,31 @@
 import datetime
 import uuid
+from decimal import Decimal
 from enum import Enum
+from typing import Dict, List
 
-from pydantic import BaseModel
+from pydantic import BaseModel, conint, conlist, validator
 
 from app.api.v1.endpoints.beverage.schemas import BeverageBaseSchema
 from app.api.v1.endpoints.order.address.schemas import AddressCreateSchema, AddressSchema
 from app.api.v1.endpoints.pizza_type.schemas import PizzaTypeBaseSchema
 
 
+# Upper bound of the quantity of one order line, so a single request cannot reserve and insert unbounded items
+MAX_LINE_QUANTITY = 1000
+# Upper bound of the lines of one checkout or cart, so the summed lines stay bounded as well
+MAX_ORDER_LINES = 100
+
+LineQuantity = conint(gt=0, le=MAX_LINE_QUANTITY)
+
+
 class OrderStatus(str, Enum):
     TRANSMITTED = 'TRANSMITTED'
     PREPARING = 'PREPARING'
     IN_DELIVERY = 'IN_DELIVERY'
     COMPLETED = 'COMPLETED'
+    # Set by the reservation sweeper only
+    EXPIRED = 'EXPIRED'
 
 
 class OrderBaseSchema(BaseModel):
@@ -31,10 +43,17 @@ class OrderSchema(OrderCreateSchema):
     id: uuid.UUID
     order_datetime: datetime.datetime
     address: AddressSchema
+    total_price: Decimal
+    pizza_count: int
+    beverage_count: int
 
 
 class OrderPriceSchema(OrderBaseSchema):
-    price: float
+    price: Decimal
+
+
+class OrderIdPriceSchema(OrderPriceSchema):
+    order_id: uuid.UUID
 
 
 class PizzaBaseSchema(BaseModel):
@@ -63,6 +82,7 @@ class JoinedPizzaSpecialWishPizzaSchema(PizzaWithoutPizzaTypeSchema):
 
 
 class OrderBeverageQuantityBaseSchema(BaseModel):
+    # Unbounded in responses: lines stored before MAX_LINE_QUANTITY existed must still be returned
     quantity: int
 
     class Config:
@@ -70,6 +90,11 @@ class OrderBeverageQuantityBaseSchema(BaseModel):
 
 
 class OrderBeverageQuantityCreateSchema(OrderBeverageQuantityBaseSchema):
+    quantity: LineQuantity
+    beverage_id: uuid.UUID
+
+
+class OrderBeverageQuantitySchema(OrderBeverageQuantityBaseSchema):
     beverage_id: uuid.UUID
 
 
@@ -79,3 +104,70 @@ class JoinedOrderBeverageQuantitySchema(OrderBaseSchema, BeverageBaseSchema):
 
 class OrderUpdateOrderStatusSchema(OrderBaseSchema):
     order_status: OrderStatus
+
+
+class OrderPizzaQuantitySchema(PizzaCreateSchema):
+    quantity: LineQuantity
+
+
+def _check_summed_quantities(lines, key: str):
+    # Lines of the same pizza type or beverage are summed up into one, which must stay within MAX_LINE_QUANTITY
+    quantities: Dict[uuid.UUID, int] = {}
+    for line in lines:
+        quantities[getattr(line, key)] = quantities.get(getattr(line, key), 0) + line.quantity
+    if any(quantity > MAX_LINE_QUANTITY for quantity in quantities.values()):
+        raise ValueError('summed quantity of a {} exceeds {}'.format(key, MAX_LINE_QUANTITY))
+    return lines
+
+
+class OrderLinesSchema(BaseModel):
+    pizzas: conlist(OrderPizzaQuantitySchema, max_items=MAX_ORDER_LINES) = []
+    beverages: conlist(OrderBeverageQuantityCreateSchema, max_items=MAX_ORDER_LINES) = []
+
+    @validator('pizzas')
+    def check_pizza_quantities(cls, pizzas):
+        return _check_summed_quantities(pizzas, 'pizza_type_id')
+
+    @validator('beverages')
+    def check_beverage_quantities(cls, beverages):
+        return _check_summed_quantities(beverages, 'beverage_id')
+
+
+class OrderCheckoutSchema(OrderCreateSchema, OrderLinesSchema):
+    pass
+
+
+class CartSchema(OrderLinesSchema):
+    pass
+
+
+class CartLineAvailabilitySchema(BaseModel):
+    quantity: int
+    available: bool
+    # How many of this line the stock suffices for, next to the other lines of the cart
+    max_quantity: int
+    shortfall: int
+
+
+class CartPizzaAvailabilitySchema(CartLineAvailabilitySchema):
+    pizza_type_id: uuid.UUID
+
+
+class CartBeverageAvailabilitySchema(CartLineAvailabilitySchema):
+    beverage_id: uuid.UUID
+
+
+class StockShortfallSchema(BaseModel):
+    # dough, topping or beverage
+    kind: str
+    id: uuid.UUID
+    needed: int
+    stock: int
+    missing: int
+
+
+class CartAvailabilitySchema(BaseModel):
+    available: bool
+    pizzas: List[CartPizzaAvailabilitySchema]
+    beverages: List[CartBeverageAvailabilitySchema]
+    shortfalls: List[StockShortfallSchema]
@@ -0,0 +1,204 @@
+import uuid
+import logging
+from itertools import chain
+from typing import Dict, Iterable, Optional
+
+from sqlalchemy import Integer, Uuid, cast, event, func, literal, or_, select, union_all, update
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.orm import Session
+
+import app.api.v1.endpoints.order.stock_logic.stock_ledger_crud as stock_ledger_crud
+from app.database.catalog_cache import CatalogMap, catalog_cache, invalidate_on_commit
+from app.database.connection import SessionLocal
+from app.database.models import Beverage, Dough, PizzaType, PizzaTypeToppingQuantity, Topping
+
+# Catalog cache map of max_makeable per pizza type, versioned apart from the pizza types because orders change it
+PIZZA_TYPE_AVAILABILITY = 'pizza_type_availability'
+
+
+def _max_makeable():
+    # Toppings limit the count to floor(stock / quantity); LEAST ignores the NULL of pizza types without toppings
+    topping_limit = select(func.min(Topping.stock // PizzaTypeToppingQuantity.quantity)) \
+        .select_from(PizzaTypeToppingQuantity) \
+        .join(Topping, Topping.id == PizzaTypeToppingQuantity.topping_id) \
+        .where(PizzaTypeToppingQuantity.pizza_type_id == PizzaType.id) \
+        .scalar_subquery()
+    dough_limit = select(Dough.stock).where(Dough.id == PizzaType.dough_id).scalar_subquery()
+    return func.least(dough_limit, topping_limit)
+
+
+def refresh_max_makeable(
+        db: Session,
+        dough_ids: Iterable[uuid.UUID] = (),
+        topping_ids: Iterable[uuid.UUID] = (),
+        pizza_type_ids: Iterable[uuid.UUID] = (),
+):
+    """Recomputes max_makeable of the pizza types using any of the given doughs or toppings, without committing.
+
+    Only the affected pizza types whose count changes are updated, with one statement, and the cached availability map
+    is invalidated if any did; the cached pizza types themselves don't carry the count. Sauces are not part of the
+    count, because ordering a pizza doesn't take sauce from stock.
+    """
+    dough_ids, topping_ids, pizza_type_ids = list(dough_ids), list(topping_ids), list(pizza_type_ids)
+    if not (dough_ids or topping_ids or pizza_type_ids):
+        return
+    max_makeable = _max_makeable()
+    result = db.connection().execute(
+        update(PizzaType)
+        .where(or_(
+            PizzaType.dough_id.in_(dough_ids),
+            PizzaType.id.in_(
+                select(PizzaTypeToppingQuantity.pizza_type_id)
+                .where(PizzaTypeToppingQuantity.topping_id.in_(topping_ids))),
+            PizzaType.id.in_(pizza_type_ids),
+        ), PizzaType.max_makeable.is_distinct_from(max_makeable))
+        .values(max_makeable=max_makeable))
+    if result.rowcount:
+        invalidate_on_commit(db, PIZZA_TYPE_AVAILABILITY)
+    logging.debug('Refreshed max_makeable of {} pizza types'.format(result.rowcount))
+
+
+def refresh_max_makeable_on_commit(
+        db: Session,
+        dough_ids: Iterable[uuid.UUID] = (),
+        topping_ids: Iterable[uuid.UUID] = (),
+        pizza_type_ids: Iterable[uuid.UUID] = (),
+):
+    """Marks the pizza types using any of the given doughs or toppings for a refresh of max_makeable on commit.
+
+    All marks of a transaction are refreshed together with one statement right before it commits, so stock writes
+    and flushes don't run the aggregate each.
+    """
+    dirty = db.info.setdefault('max_makeable_dirty', (set(), set(), set()))
+    for ids, new_ids in zip(dirty, (dough_ids, topping_ids, pizza_type_ids)):
+        ids.update(new_ids)
+
+
+def get_pizza_type_availability(db: Session) -> CatalogMap:
+    """max_makeable of every pizza type, from the catalog cache. Pizza types missing from it can't be made."""
+    return catalog_cache.get_map(PIZZA_TYPE_AVAILABILITY, lambda session: dict(
+        session.execute(select(PizzaType.id, PizzaType.max_makeable).order_by(PizzaType.id)).all()), db)
+
+
+@event.listens_for(SessionLocal, 'after_flush')
+def _mark_after_flush(session, flush_context):
+    # Changes through the ORM: stock of doughs and toppings, pizza types and their topping quantities.
+    # The set-based stock updates in stock_logic mark explicitly
+    # New doughs and toppings are not used by any pizza type yet
+    dough_ids, topping_ids, pizza_type_ids = set(), set(), set()
+    for entity in chain(session.new, session.dirty, session.deleted):
+        if isinstance(entity, (Dough, Topping)) and entity in session.new:
+            continue
+        if isinstance(entity, Dough) and stock_ledger_crud.stock_changed(entity):
+            dough_ids.add(entity.id)
+        elif isinstance(entity, Topping) and stock_ledger_crud.stock_changed(entity):
+            topping_ids.add(entity.id)
+        elif isinstance(entity, PizzaType):
+            pizza_type_ids.add(entity.id)
+        elif isinstance(entity, PizzaTypeToppingQuantity):
+            pizza_type_ids.add(entity.pizza_type_id)
+    refresh_max_makeable_on_commit(session, dough_ids, topping_ids, pizza_type_ids)
+
+
+@event.listens_for(SessionLocal, 'before_commit')
+def _refresh_before_commit(session):
+    # The commit flushes after this hook, so pending ORM changes are flushed (and marked) first
+    session.flush()
+    dirty = session.info.pop('max_makeable_dirty', None)
+    if dirty:
+        refresh_max_makeable(session, *dirty)
+
+
+@event.listens_for(SessionLocal, 'after_rollback')
+def _discard_after_rollback(session):
+    session.info.pop('max_makeable_dirty', None)
+
+
+def _cart_lines(name: str, counts: Dict[uuid.UUID, int]):
+    # Cast arrays like stock_crud._amounts; the parameters of a VALUES list reach asyncpg without a type
+    ids, quantities = zip(*counts.items())
+    return func.unnest(cast(list(ids), ARRAY(Uuid)), cast(list(quantities), ARRAY(Integer))) \
+        .table_valued('id', 'quantity') \
+        .render_derived(name=name)
+
+
+def get_cart_availability(
+        pizza_type_counts: Dict[uuid.UUID, int], beverage_counts: Dict[uuid.UUID, int], db: Session,
+) -> Optional[dict]:
+    """Checks whether the stock suffices for a whole cart, with one query.
+
+    The query lists every ingredient of every pizza line and every beverage line with its stock and the total demand
+    of the cart on it. A line is available if all of its ingredients suffice for the whole cart; otherwise its
+    shortfall is how many of the line can't be made while the other lines keep their quantities.
+    Returns None if a pizza type or beverage doesn't exist.
+    """
+    parts = []
+    if pizza_type_counts:
+        pizzas = _cart_lines('cart_pizzas', pizza_type_counts)
+        parts.append(
+            select(literal('pizza').label('line'), pizzas.c.id.label('line_id'), pizzas.c.quantity,
+                   literal('dough').label('kind'), Dough.id.label('stock_id'), literal(1).label('amount'), Dough.stock)
+            .select_from(pizzas)
+            .join(PizzaType, PizzaType.id == pizzas.c.id)
+            .join(Dough, Dough.id == PizzaType.dough_id))
+        parts.append(
+            select(literal('pizza'), pizzas.c.id, pizzas.c.quantity,
+                   literal('topping'), Topping.id, PizzaTypeToppingQuantity.quantity, Topping.stock)
+            .select_from(pizzas)
+            .join(PizzaTypeToppingQuantity, PizzaTypeToppingQuantity.pizza_type_id == pizzas.c.id)
+            .join(Topping, Topping.id == PizzaTypeToppingQuantity.topping_id))
+    if beverage_counts:
+        beverages = _cart_lines('cart_beverages', beverage_counts)
+        parts.append(
+            select(literal('beverage'), beverages.c.id, beverages.c.quantity,
+                   literal('beverage'), Beverage.id, literal(1), Beverage.stock)
+            .select_from(beverages)
+            .join(Beverage, Beverage.id == beverages.c.id))
+    if not parts:
+        return {'available': True, 'pizzas': [], 'beverages': [], 'shortfalls': []}
+
+    requirements = union_all(*parts).subquery()
+    rows = db.execute(select(
+        requirements,
+        func.sum(requirements.c.amount * requirements.c.quantity)
+        .over(partition_by=(requirements.c.kind, requirements.c.stock_id)).label('needed'),
+    )).all()
+
+    found_lines = {(row.line, row.line_id) for row in rows}
+    if len(found_lines) < len(pizza_type_counts) + len(beverage_counts):
+        return None
+
+    # Largest quantity of each line the stock suffices for, next to the demand of the other lines
+    max_quantities = {'pizza': {}, 'beverage': {}}
+    shortfalls = {}
+    for row in rows:
+        needed = int(row.needed)
+        others = needed - row.amount * row.quantity
+        max_quantity = max(row.stock - others, 0) // row.amount
+        current = max_quantities[row.line].get(row.line_id)
+        max_quantities[row.line][row.line_id] = max_quantity if current is None else min(current, max_quantity)
+        if needed > row.stock:
+            shortfalls[(row.kind, row.stock_id)] = {
+                'kind': row.kind, 'id': row.stock_id, 'needed': needed, 'stock': row.stock,
+                'missing': needed - row.stock,
+            }
+
+    def line_availability(id_key, counts, line):
+        lines = []
+        for line_id, quantity in counts.items():
+            max_quantity = max_quantities[line][line_id]
+            lines.append({
+                id_key: line_id,
+                'quantity': quantity,
+                'available': quantity <= max_quantity,
+                'max_quantity': max_quantity,
+                'shortfall': max(quantity - max_quantity, 0),
+            })
+        return lines
+
+    return {
+        'available': not shortfalls,
+        'pizzas': line_availability('pizza_type_id', pizza_type_counts, 'pizza'),
+        'beverages': line_availability('beverage_id', beverage_counts, 'beverage'),
+        'shortfalls': list(shortfalls.values()),
+    }
@@ -1,9 +1,12 @@
 import uuid
 import logging
+from typing import Dict, Optional
 
 from sqlalchemy.orm import Session
 
 import app.api.v1.endpoints.beverage.crud as beverage_crud
+import app.api.v1.endpoints.order.stock_logic.stock_crud as stock_crud
+import app.api.v1.endpoints.order.stock_logic.stock_reservation_crud as stock_reservation_crud
 from app.database.models import Beverage
 
 
@@ -19,23 +22,28 @@ def beverage_is_available(beverage_id: uuid.UUID, amount: int, db: Session):
         return False
 
 
-def change_stock_of_beverage(beverage_id: uuid.UUID, change_amount: int, db: Session):
-    # Get Beverage
-    beverage = db.query(Beverage).filter(Beverage.id == beverage_id).first()
-
-    # Check if Beverage exists and if Stock is not getting smaller than zero
-    if beverage:
-        if beverage.stock + change_amount >= 0:
-            setattr(beverage, 'stock', beverage.stock + change_amount)
-            db.commit()
-            db.refresh(beverage)
-            return True
-        else:
-            logging.error(
-                f'Stock change would result in negative stock for beverage {beverage_id}. '
-                f'Current stock: {beverage.stock}, Change amount: {change_amount}',
-            )
+def change_stock_of_beverage(
+        beverage_id: uuid.UUID, change_amount: int, db: Session, order_id: Optional[uuid.UUID] = None,
+):
+    # Guarded update, the stock can't get smaller than zero even with concurrent changes
+    if order_id is not None and not stock_reservation_crud.extend_reservation(order_id, db):
+        db.rollback()
+        return False
+    if change_amount < 0:
+        if not stock_crud.take_stock(Beverage, {beverage_id: -change_amount}, db, order_id):
+            db.rollback()
             return False
+    else:
+        stock_crud.return_stock(Beverage, {beverage_id: change_amount}, db, order_id)
+    db.commit()
+    return True
+
+
+def take_beverage_demand(beverage_demand: Dict[uuid.UUID, int], db: Session, order_id: Optional[uuid.UUID] = None):
+    # One guarded update for all beverages, the caller commits or rolls back
+    return stock_crud.take_stock(Beverage, beverage_demand, db, order_id)
+
 
-    logging.error(f'Beverage with ID {beverage_id} does not exist.')
-    return False
+def return_beverage_demand(beverage_demand: Dict[uuid.UUID, int], db: Session, order_id: Optional[uuid.UUID] = None):
+    # One update for all beverages, the caller commits
+    return stock_crud.return_stock(Beverage, beverage_demand, db, order_id)
@@ -0,0 +1,77 @@
+import uuid
+import logging
+from typing import Dict, Optional
+
+from sqlalchemy import Integer, Uuid, cast, func, update
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.orm import Session
+
+import app.api.v1.endpoints.order.stock_logic.stock_ledger_crud as stock_ledger_crud
+from app.database.models import StockMovementReason
+
+
+def _amounts(amounts: Dict[uuid.UUID, int]):
+    # Rows in id order, so concurrent updates of the same rows lock them in the same order. The arrays are bound
+    # parameters, so the statement is compiled once per table instead of once per call like a VALUES list.
+    item_ids, item_amounts = zip(*sorted(amounts.items()))
+    return func.unnest(cast(list(item_ids), ARRAY(Uuid)), cast(list(item_amounts), ARRAY(Integer))) \
+        .table_valued('id', 'amount') \
+        .render_derived(name='amounts')
+
+
+def _change_stock(model, amounts, sign: int, reason: StockMovementReason, order_id: Optional[uuid.UUID], db: Session):
+    # One statement updates the stock and records a movement per updated row, taking stock is guarded
+    table = model.__table__
+    criteria = [table.c.id == amounts.c.id]
+    if sign < 0:
+        criteria.append(table.c.stock >= amounts.c.amount)
+    changed = update(table) \
+        .where(*criteria) \
+        .values(stock=table.c.stock + sign * amounts.c.amount) \
+        .returning(table.c.id, table.c.stock, (sign * amounts.c.amount).label('change')) \
+        .cte('changed')
+    return db.execute(stock_ledger_crud.movements_of(model, changed, reason, order_id)).all()
+
+
+def take_stock(model, demand: Dict[uuid.UUID, int], db: Session, order_id: Optional[uuid.UUID] = None):
+    """Takes the demanded amount of every item from stock with one guarded UPDATE, without committing.
+
+    Stock is only taken from rows with enough stock, so concurrent reservations can neither lose updates nor make the
+    stock negative. Every taken amount is recorded as RESERVE movement of the order. Returns False if any item is
+    missing or short; the other items were updated then and the caller has to roll back.
+    """
+    demand = {item_id: amount for item_id, amount in demand.items() if amount > 0}
+    if not demand:
+        return True
+
+    rows = _change_stock(model, _amounts(demand), -1, StockMovementReason.RESERVE, order_id, db)
+
+    if len(rows) < len(demand):
+        logging.error('Not enough stock of {} with IDs {}, needed: {}'.format(
+            model.__tablename__, [str(item_id) for item_id in demand.keys() - {row.item_id for row in rows}], demand))
+        return False
+    logging.info('Took stock of {}: {}'.format(
+        model.__tablename__, {str(row.item_id): {'amount': demand[row.item_id], 'new_stock': row.stock_after}
+                              for row in rows}))
+    return True
+
+
+def return_stock(model, amounts: Dict[uuid.UUID, int], db: Session, order_id: Optional[uuid.UUID] = None):
+    """Puts the amount of every item back to stock with one UPDATE, without committing. Returns the updated ids."""
+    amounts = {item_id: amount for item_id, amount in amounts.items() if amount > 0}
+    if not amounts:
+        return []
+    return return_stock_of(model, _amounts(amounts), db, order_id)
+
+
+def return_stock_of(model, amounts, db: Session, order_id: Optional[uuid.UUID] = None):
+    """Puts amounts back to stock with one UPDATE, without committing.
+
+    amounts is a subquery with the columns id and amount, e.g. an aggregate over the items of an order, so the
+    amounts never have to be loaded. Every amount is recorded as RELEASE movement of the order. Returns the updated
+    ids.
+    """
+    rows = _change_stock(model, amounts, 1, StockMovementReason.RELEASE, order_id, db)
+    logging.info('Returned stock of {}: {}'.format(
+        model.__tablename__, {str(row.item_id): {'new_stock': row.stock_after} for row in rows}))
+    return [row.item_id for row in rows]
@@ -1,61 +1,118 @@
+import uuid
 import logging
+from collections import defaultdict
+from typing import Dict, Optional
 
+from sqlalchemy import func, select
 from sqlalchemy.orm import Session
 
-from app.database.models import PizzaType
+import app.api.v1.endpoints.order.stock_logic.stock_availability_crud as stock_availability_crud
+import app.api.v1.endpoints.order.stock_logic.stock_crud as stock_crud
+import app.api.v1.endpoints.order.stock_logic.stock_shard_crud as stock_shard_crud
+from app.database.models import Dough, Pizza, PizzaType, PizzaTypeToppingQuantity, Topping
 
 
-def ingredients_are_available(pizza_type: PizzaType):
-    if pizza_type.dough.stock <= 0:
-        logging.error(
-            'PizzaType {} with id {} has not enough dough with ID {} in stock. Dough name: {}, Dough stock: {}'.format(
-                pizza_type.name, pizza_type.id, pizza_type.dough_id, pizza_type.dough.name, pizza_type.dough.stock))
+def ingredients_are_available(pizza_type: PizzaType, amount: int = 1):
+    # Reads the maintained count instead of loading the dough and every topping
+    if pizza_type.max_makeable < amount:
+        logging.error('PizzaType {} with id {} can be made {} more times, needed: {}'.format(
+            pizza_type.name, pizza_type.id, pizza_type.max_makeable, amount))
         return False
+    return True
 
-    for topping_quantity in pizza_type.toppings:
-        if topping_quantity.topping.stock < topping_quantity.quantity:
-            logging.error(
-                'PizzaType {} with id {} has not enough topping with ID {} in stock. Topping name: {}, '
-                'Topping Stock: {}, Topping needed: {}'.format(
-                    pizza_type.name,
-                    pizza_type.id,
-                    topping_quantity.topping.name,
-                    topping_quantity.topping.id,
-                    topping_quantity.topping.stock,
-                    topping_quantity.quantity))
-
-            return False
 
-    return True
+def _ingredients_of(pizza_type: PizzaType, db: Session):
+    dough_amounts = {pizza_type.dough_id: 1}
+    topping_amounts = dict(db.execute(
+        select(PizzaTypeToppingQuantity.topping_id, PizzaTypeToppingQuantity.quantity)
+        .where(PizzaTypeToppingQuantity.pizza_type_id == pizza_type.id)).all())
+    return dough_amounts, topping_amounts
 
 
 def reduce_stock_of_ingredients(pizza_type: PizzaType, db: Session):
-    pizza_type.dough.stock -= 1
+    if not take_ingredient_demand(*_ingredients_of(pizza_type, db), db):
+        db.rollback()
+        return False
+    db.commit()
+    logging.info(f'Reduced stock of ingredients for pizza type {pizza_type.id}')
+    return True
 
-    toppings_info = []
-    for topping_quantity in pizza_type.toppings:
-        topping_quantity.topping.stock -= topping_quantity.quantity
-        toppings_info.append({
-            'topping_id': topping_quantity.topping.id,
-            'quantity': topping_quantity.quantity,
-            'new_stock': topping_quantity.topping.stock,
-        })
 
+def increase_stock_of_ingredients(pizza_type: PizzaType, db: Session):
+    dough_amounts, topping_amounts = _ingredients_of(pizza_type, db)
+    stock_availability_crud.refresh_max_makeable_on_commit(
+        db, stock_crud.return_stock(Dough, dough_amounts, db), stock_crud.return_stock(Topping, topping_amounts, db))
     db.commit()
-    logging.info(f'Reduced stock of ingredients for pizza type {pizza_type.id}. Toppings: {toppings_info}')
+    logging.info(f'Increased stock of ingredients for pizza type {pizza_type.id}')
 
 
-def increase_stock_of_ingredients(pizza_type: PizzaType, db: Session):
-    pizza_type.dough.stock += 1
+def get_ingredient_demand(pizza_quantities: Dict[uuid.UUID, int], db: Session):
+    """Total amount of every dough and topping needed for the given number of pizzas per pizza type."""
+    dough_demand: Dict[uuid.UUID, int] = defaultdict(int)
+    for pizza_type_id, dough_id in db.execute(
+            select(PizzaType.id, PizzaType.dough_id).where(PizzaType.id.in_(pizza_quantities))):
+        dough_demand[dough_id] += pizza_quantities[pizza_type_id]
 
-    toppings_info = []
-    for topping_quantity in pizza_type.toppings:
-        topping_quantity.topping.stock += topping_quantity.quantity
-        toppings_info.append({
-            'topping_id': topping_quantity.topping.id,
-            'quantity': topping_quantity.quantity,
-            'new_stock': topping_quantity.topping.stock,
-        })
+    topping_demand: Dict[uuid.UUID, int] = defaultdict(int)
+    for pizza_type_id, topping_id, quantity in db.execute(
+            select(PizzaTypeToppingQuantity.pizza_type_id, PizzaTypeToppingQuantity.topping_id,
+                   PizzaTypeToppingQuantity.quantity)
+            .where(PizzaTypeToppingQuantity.pizza_type_id.in_(pizza_quantities))):
+        topping_demand[topping_id] += quantity * pizza_quantities[pizza_type_id]
 
-    db.commit()
-    logging.info(f'Increased stock of ingredients for pizza type {pizza_type.id}. Toppings: {toppings_info}')
+    return dough_demand, topping_demand
+
+
+def _dough_demand_of_pizzas(*criteria):
+    return select(PizzaType.dough_id.label('id'), func.count().label('amount')) \
+        .join(Pizza, Pizza.pizza_type_id == PizzaType.id) \
+        .where(*criteria) \
+        .group_by(PizzaType.dough_id)
+
+
+def _topping_demand_of_pizzas(*criteria):
+    return select(PizzaTypeToppingQuantity.topping_id.label('id'),
+                  func.sum(PizzaTypeToppingQuantity.quantity).label('amount')) \
+        .join(Pizza, Pizza.pizza_type_id == PizzaTypeToppingQuantity.pizza_type_id) \
+        .where(*criteria) \
+        .group_by(PizzaTypeToppingQuantity.topping_id)
+
+
+def get_ingredient_demand_of_order(order_id: uuid.UUID, db: Session):
+    """Total amount of every dough and topping needed to make all pizzas of the order once more."""
+    dough_demand = dict(db.execute(_dough_demand_of_pizzas(Pizza.order_id == order_id)).all())
+    topping_demand = dict(db.execute(_topping_demand_of_pizzas(Pizza.order_id == order_id)).all())
+    return dough_demand, topping_demand
+
+
+def return_ingredients_of_pizza_type(pizza_type_id: uuid.UUID, db: Session, order_id: Optional[uuid.UUID] = None):
+    """Puts the ingredients of one pizza of the pizza type back to stock, without committing."""
+    dough_demand, topping_demand = get_ingredient_demand({pizza_type_id: 1}, db)
+    stock_availability_crud.refresh_max_makeable_on_commit(
+        db,
+        stock_crud.return_stock(Dough, dough_demand, db, order_id),
+        stock_crud.return_stock(Topping, topping_demand, db, order_id),
+    )
+
+
+def take_ingredient_demand(
+        dough_demand: Dict[uuid.UUID, int], topping_demand: Dict[uuid.UUID, int], db: Session,
+        order_id: Optional[uuid.UUID] = None,
+):
+    # One guarded update per ingredient table, sharded ingredients are taken from their shards.
+    # The caller commits or rolls back
+    demands = []
+    for model, demand in ((Dough, dough_demand), (Topping, topping_demand)):
+        sharded_ids = stock_shard_crud.get_sharded_ids(model, demand, db)
+        demands.append((
+            model,
+            {item_id: amount for item_id, amount in demand.items() if item_id not in sharded_ids},
+            {item_id: amount for item_id, amount in demand.items() if item_id in sharded_ids},
+        ))
+    for model, demand, sharded_demand in demands:
+        if not stock_crud.take_stock(model, demand, db, order_id) \
+                or not stock_shard_crud.take_sharded_stock(model, sharded_demand, db, order_id):
+            return False
+    # Sharded ingredients too: the refresh before commit counts their stock with the shards
+    stock_availability_crud.refresh_max_makeable_on_commit(db, dough_demand, topping_demand)
+    return True
@@ -0,0 +1,88 @@
+import logging
+import os
+import threading
+from typing import Callable
+
+from sqlalchemy.orm import Session
+
+import app.api.v1.endpoints.order.crud as order_crud
+import app.api.v1.endpoints.order.stock_logic.stock_ledger_crud as stock_ledger_crud
+import app.api.v1.endpoints.order.stock_logic.stock_reservation_crud as stock_reservation_crud
+import app.api.v1.endpoints.order.stock_logic.stock_shard_crud as stock_shard_crud
+from app.database.connection import SessionLocal
+
+# Seconds between two runs of the compactor, 0 disables it
+STOCK_SNAPSHOT_INTERVAL = float(os.getenv('STOCK_SNAPSHOT_INTERVAL', '60'))
+# Seconds between two runs of the shard rebalancer, 0 disables it
+STOCK_SHARD_REBALANCE_INTERVAL = float(os.getenv('STOCK_SHARD_REBALANCE_INTERVAL', '10'))
+# Seconds between two runs of the sweeper releasing expired order reservations, 0 disables it
+ORDER_RESERVATION_SWEEP_INTERVAL = float(os.getenv('ORDER_RESERVATION_SWEEP_INTERVAL', '30'))
+# Seconds between two checks of the stored order totals, 0 disables them
+ORDER_TOTAL_CHECK_INTERVAL = float(os.getenv('ORDER_TOTAL_CHECK_INTERVAL', '300'))
+
+
+class PeriodicStockJob:
+    """Background thread calling function with a session of its own every interval seconds."""
+
+    def __init__(self, name: str, interval: float, function: Callable[[Session], object]):
+        self.name = name
+        self.interval = interval
+        self.function = function
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self.interval <= 0 or self._thread is not None:
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def run_once(self):
+        db = SessionLocal()
+        try:
+            self.function(db)
+            db.rollback()
+        except Exception as e:
+            logging.error('{} failed: {}'.format(self.name, e))
+        finally:
+            db.close()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self.run_once()
+
+
+def compact_and_check_stock(db: Session):
+    stock_ledger_crud.compact_stock_snapshots(db)
+    for item in stock_ledger_crud.find_stock_drift(db):
+        logging.error('Stock of {} {} is {}, the ledger says {}'.format(
+            item['item_type'], item['item_id'], item['stock'], item['ledger_stock']))
+
+
+def check_order_totals(db: Session):
+    for order in order_crud.find_order_total_drift(db):
+        logging.error('Totals (price, pizzas, beverages) of order {} are {}, its items say {}'.format(
+            order['order_id'], order['stored'], order['computed']))
+
+
+# Rolls the stock snapshots forward, so stock reads only sum a short tail of movements
+stock_snapshot_compactor = PeriodicStockJob(
+    'stock-snapshot-compactor', STOCK_SNAPSHOT_INTERVAL if stock_ledger_crud.STOCK_LEDGER else 0,
+    compact_and_check_stock)
+# Spreads the stock of sharded items evenly over their shards again
+stock_shard_rebalancer = PeriodicStockJob(
+    'stock-shard-rebalancer', STOCK_SHARD_REBALANCE_INTERVAL, stock_shard_crud.rebalance_stock_shards)
+# Releases the stock of TRANSMITTED orders whose reservation expired
+order_reservation_sweeper = PeriodicStockJob(
+    'order-reservation-sweeper', ORDER_RESERVATION_SWEEP_INTERVAL, stock_reservation_crud.release_expired_reservations)
+# Logs orders whose stored totals drifted from their items
+order_total_checker = PeriodicStockJob('order-total-checker', ORDER_TOTAL_CHECK_INTERVAL, check_order_totals)
+
+STOCK_JOBS = (stock_snapshot_compactor, stock_shard_rebalancer, order_reservation_sweeper, order_total_checker)
@@ -0,0 +1,161 @@
+import uuid
+import logging
+import os
+from itertools import chain
+from typing import Dict, Iterable, Optional
+
+from sqlalchemy import event, func, inspect, insert, literal, select, union_all, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from app.database.connection import SessionLocal
+from app.database.models import Beverage, Dough, Sauce, StockMovement, StockMovementReason, StockSnapshot, Topping
+
+STOCK_MODELS = (Dough, Topping, Sauce, Beverage)
+# Whether stock changes are recorded as movements. The ledger is an audit trail, not a way to more throughput: every
+# stock change of an order inserts its movements under the row lock of the stock update, so writers of a hot item
+# wait longer for each other (see tests/benchmark/stock_writers.py). Hot items are sharded instead
+STOCK_LEDGER = os.getenv('STOCK_LEDGER', 'true').lower() in ('1', 'true', 'yes')
+
+
+def movements_of(model, changed, reason: StockMovementReason, order_id: Optional[uuid.UUID] = None):
+    """INSERT of one movement per row of changed, to be executed as the only statement of the stock change.
+
+    changed is a CTE over an UPDATE of the stock of model returning id, stock (after the update) and the signed
+    amount as change. Returns item_id, change and stock_after of the recorded movements; without STOCK_LEDGER the
+    same columns of the updated rows, and nothing is recorded.
+    """
+    if not STOCK_LEDGER:
+        return select(changed.c.id.label('item_id'), changed.c.change, changed.c.stock.label('stock_after'))
+    return insert(StockMovement).from_select(
+        ['item_type', 'item_id', 'change', 'stock_after', 'reason', 'order_id'],
+        select(
+            literal(model.__tablename__), changed.c.id, changed.c.change, changed.c.stock,
+            literal(reason, StockMovement.__table__.c.reason.type),
+            literal(order_id, StockMovement.__table__.c.order_id.type),
+        ),
+    ).returning(StockMovement.item_id, StockMovement.change, StockMovement.stock_after).add_cte(changed)
+
+
+def stock_changed(item) -> bool:
+    # The stock column is mapped as own_stock on items that can be sharded
+    mapper = inspect(item).mapper
+    key = mapper.get_property_by_column(mapper.local_table.c.stock).key
+    return inspect(item).attrs[key].history.has_changes()
+
+
+def _restock_movement(model, item_id: uuid.UUID):
+    # The change is the difference of the stock after the flush to the stock according to the ledger. The flush holds
+    # the lock of the item row, so no other change of the stock can come in between.
+    stock = select(model.stock).where(model.id == item_id).scalar_subquery()
+    ledger_stock = select(_ledger_stock_query(model, [item_id]).subquery().c.stock).scalar_subquery()
+    change = stock - func.coalesce(ledger_stock, 0)
+    return insert(StockMovement).from_select(
+        ['item_type', 'item_id', 'change', 'stock_after', 'reason'],
+        select(
+            literal(model.__tablename__), literal(item_id, StockMovement.__table__.c.item_id.type),
+            change, stock, literal(StockMovementReason.RESTOCK, StockMovement.__table__.c.reason.type),
+        ).where(change != 0),
+    )
+
+
+@event.listens_for(SessionLocal, 'after_flush')
+def _record_restocks(session, flush_context):
+    # Stock set on new or updated items; orders change stock with movements_of and don't pass through the flush
+    if not STOCK_LEDGER:
+        return
+    for item in chain(session.new, session.dirty):
+        if isinstance(item, STOCK_MODELS) and stock_changed(item):
+            session.connection().execute(_restock_movement(type(item), item.id))
+
+
+def _ledger_stock_query(model, item_ids: Optional[Iterable[uuid.UUID]] = None):
+    snapshots = select(StockSnapshot.item_id, StockSnapshot.stock.label('change')) \
+        .where(StockSnapshot.item_type == model.__tablename__)
+    tail = select(StockMovement.item_id, StockMovement.change) \
+        .where(StockMovement.item_type == model.__tablename__, StockMovement.compacted.is_(False))
+    if item_ids is not None:
+        item_ids = list(item_ids)
+        snapshots = snapshots.where(StockSnapshot.item_id.in_(item_ids))
+        tail = tail.where(StockMovement.item_id.in_(item_ids))
+    balances = union_all(snapshots, tail).subquery()
+    return select(balances.c.item_id, func.sum(balances.c.change).label('stock')).group_by(balances.c.item_id)
+
+
+def get_ledger_stock(model, item_ids: Iterable[uuid.UUID], db: Session) -> Dict[uuid.UUID, int]:
+    """Stock of the items computed from their snapshot and the movements not compacted into it yet."""
+    return {item_id: stock for item_id, stock in db.execute(_ledger_stock_query(model, item_ids))}
+
+
+def get_stock_movements(model, item_id: uuid.UUID, db: Session):
+    return db.scalars(
+        select(StockMovement)
+        .where(StockMovement.item_type == model.__tablename__, StockMovement.item_id == item_id)
+        .order_by(StockMovement.id)).all()
+
+
+def _compact_item(item_type: str, item_id: uuid.UUID, watermark: int, db: Session):
+    # Folds the movements of one item into its snapshot with one statement. The UPDATE only flags committed
+    # movements; a movement that commits later keeps compacted = false and stays in the tail, whatever its id.
+    # The upsert adds to the snapshot under the row lock of the snapshot row, writers of the stock never wait.
+    movements = StockMovement.__table__
+    folded = update(movements) \
+        .where(movements.c.item_type == item_type, movements.c.item_id == item_id,
+               movements.c.compacted.is_(False), movements.c.id <= watermark) \
+        .values(compacted=True) \
+        .returning(movements.c.id, movements.c.change) \
+        .cte('folded')
+    statement = pg_insert(StockSnapshot).from_select(
+        ['item_type', 'item_id', 'stock', 'last_movement_id', 'created_at'],
+        select(
+            literal(item_type), literal(item_id, StockSnapshot.__table__.c.item_id.type),
+            func.sum(folded.c.change), func.max(folded.c.id), func.now(),
+        ).having(func.count() > 0),
+    )
+    statement = statement.on_conflict_do_update(
+        index_elements=[StockSnapshot.item_type, StockSnapshot.item_id],
+        set_={
+            'stock': StockSnapshot.stock + statement.excluded.stock,
+            'last_movement_id': func.greatest(StockSnapshot.last_movement_id, statement.excluded.last_movement_id),
+            'created_at': statement.excluded.created_at,
+        },
+    ).add_cte(folded)
+    return db.execute(statement).rowcount
+
+
+def compact_stock_snapshots(db: Session):
+    """Rolls the snapshot of every item with uncompacted movements forward, one item and commit at a time.
+
+    Covers the movements up to the largest id at the start, so a busy item does not keep the run going. Takes no lock
+    that writers of the stock wait for. Returns the number of rolled snapshots.
+    """
+    watermark = db.scalar(select(func.max(StockMovement.id)))
+    if watermark is None:
+        return 0
+    items = db.execute(
+        select(StockMovement.item_type, StockMovement.item_id)
+        .where(StockMovement.compacted.is_(False), StockMovement.id <= watermark)
+        .distinct()).all()
+    db.commit()
+
+    rolled = 0
+    for item_type, item_id in items:
+        rolled += _compact_item(item_type, item_id, watermark, db)
+        db.commit()
+    logging.info('Compacted stock snapshots of {} items'.format(rolled))
+    return rolled
+
+
+def find_stock_drift(db: Session):
+    """Items whose stock differs from the stock computed from the ledger, one consistent query per item table."""
+    drift = []
+    for model in STOCK_MODELS:
+        ledger = _ledger_stock_query(model).subquery()
+        ledger_stock = func.coalesce(ledger.c.stock, 0)
+        for item_id, stock, computed_stock in db.execute(
+                select(model.id, model.stock, ledger_stock)
+                .outerjoin(ledger, ledger.c.item_id == model.id)
+                .where(model.stock != ledger_stock)):
+            drift.append({'item_type': model.__tablename__, 'item_id': item_id, 'stock': stock,
+                          'ledger_stock': computed_stock})
+    return drift
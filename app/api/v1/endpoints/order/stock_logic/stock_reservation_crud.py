@@ -0,0 +1,175 @@
+import uuid
+import datetime
+import logging
+import os
+
+from sqlalchemy import case, delete, func, literal, select, union_all, update
+from sqlalchemy.orm import Session
+
+import app.api.v1.endpoints.order.stock_logic.stock_availability_crud as stock_availability_crud
+import app.api.v1.endpoints.order.stock_logic.stock_crud as stock_crud
+from app.database.models import (
+    Address, Beverage, Dough, Order, OrderBeverageQuantity, OrderStatus, Pizza, PizzaType, PizzaTypeToppingQuantity,
+    Topping,
+)
+
+# Seconds a TRANSMITTED order holds its stock after its last change, 0 keeps the stock until the order is deleted
+ORDER_RESERVATION_TTL = float(os.getenv('ORDER_RESERVATION_TTL', '1800'))
+# Expired orders released per transaction of the sweeper
+ORDER_RESERVATION_SWEEP_BATCH = int(os.getenv('ORDER_RESERVATION_SWEEP_BATCH', '100'))
+
+
+def reservation_deadline():
+    """reserved_until of an order reserving stock now, evaluated by the database. None if reservations don't expire."""
+    if ORDER_RESERVATION_TTL <= 0:
+        return None
+    return func.now() + datetime.timedelta(seconds=ORDER_RESERVATION_TTL)
+
+
+def extend_reservation(order_id: uuid.UUID, db: Session):
+    """Moves the expiry of a TRANSMITTED order to a full TTL from now, without committing.
+
+    Called first in every transaction adding to an order: the updated row stays locked until the commit, so the
+    sweeper skips the order meanwhile. Returns False if the order doesn't exist (any more) or expired; the stock of
+    an expired order is back in stock, so nothing can be added to it.
+    """
+    return db.execute(
+        update(Order)
+        .where(Order.id == order_id, Order.order_status != OrderStatus.EXPIRED)
+        .values(reserved_until=case(
+            (Order.order_status == OrderStatus.TRANSMITTED, reservation_deadline()), else_=Order.reserved_until))
+        .execution_options(synchronize_session=False)).rowcount > 0
+
+
+def _stock_of(released, pizza_type_ids, beverage_quantities, *other_rows):
+    # One row per released order and per dough, topping and beverage to restock: (kind, id, amount)
+    return union_all(
+        *other_rows,
+        select(literal('order'), released.c.id, literal(0)),
+        select(literal(Dough.__tablename__), PizzaType.dough_id, func.count())
+        .select_from(pizza_type_ids)
+        .join(PizzaType, PizzaType.id == pizza_type_ids.c.pizza_type_id)
+        .group_by(PizzaType.dough_id),
+        select(literal(Topping.__tablename__), PizzaTypeToppingQuantity.topping_id,
+               func.sum(PizzaTypeToppingQuantity.quantity))
+        .select_from(pizza_type_ids)
+        .join(PizzaTypeToppingQuantity, PizzaTypeToppingQuantity.pizza_type_id == pizza_type_ids.c.pizza_type_id)
+        .group_by(PizzaTypeToppingQuantity.topping_id),
+        select(literal(Beverage.__tablename__), beverage_quantities.c.beverage_id,
+               func.sum(beverage_quantities.c.quantity))
+        .group_by(beverage_quantities.c.beverage_id),
+    ).subquery()
+
+
+def _detach(db: Session, model, ids):
+    # The statements bypass the session, detach loaded rows like a delete through the session would
+    for row_id in ids:
+        loaded = db.identity_map.get(db.identity_key(model, row_id))
+        if loaded is not None:
+            db.expunge(loaded)
+
+
+def _restock(db: Session, rows):
+    # Puts the stock of the rows of _stock_of back and returns the ids of the released orders
+    released_orders = [row[1] for row in rows if row[0] == 'order']
+    # The movements reference the order if there is just one
+    order_id = released_orders[0] if len(released_orders) == 1 else None
+    restocked = {}
+    for model in (Dough, Topping, Beverage):
+        amounts = {row[1]: row[2] for row in rows if row[0] == model.__tablename__}
+        restocked[model] = stock_crud.return_stock(model, amounts, db, order_id)
+    stock_availability_crud.refresh_max_makeable_on_commit(db, restocked[Dough], restocked[Topping])
+    return released_orders
+
+
+def delete_orders(db: Session, *criteria):
+    """Deletes the orders matching criteria with their items and addresses and puts their stock back, without
+    committing.
+
+    One statement deletes the orders, their pizzas, beverage quantities and addresses and returns the amounts to
+    restock. Only the transaction whose DELETE removed an order restocks it, and only if the order still held its
+    stock: a concurrent delete of the same order waits for its row and deletes nothing, and the stock of an EXPIRED
+    order is back already. Returns the ids of the deleted orders.
+    """
+    orders, pizzas, beverages, addresses = \
+        Order.__table__, Pizza.__table__, OrderBeverageQuantity.__table__, Address.__table__
+    deleted = delete(orders) \
+        .where(*criteria) \
+        .returning(orders.c.id, orders.c.address_id, orders.c.order_status) \
+        .cte('deleted')
+    deleted_addresses = delete(addresses) \
+        .where(addresses.c.id.in_(select(deleted.c.address_id))) \
+        .returning(addresses.c.id) \
+        .cte('deleted_addresses')
+    deleted_pizzas = delete(pizzas) \
+        .where(pizzas.c.order_id.in_(select(deleted.c.id))) \
+        .returning(pizzas.c.order_id, pizzas.c.pizza_type_id) \
+        .cte('deleted_pizzas')
+    deleted_beverages = delete(beverages) \
+        .where(beverages.c.order_id.in_(select(deleted.c.id))) \
+        .returning(beverages.c.order_id, beverages.c.beverage_id, beverages.c.quantity) \
+        .cte('deleted_beverages')
+    holding = select(deleted.c.id).where(deleted.c.order_status != OrderStatus.EXPIRED)
+    stock = _stock_of(
+        deleted,
+        select(deleted_pizzas.c.pizza_type_id).where(deleted_pizzas.c.order_id.in_(holding)).subquery(),
+        select(deleted_beverages).where(deleted_beverages.c.order_id.in_(holding)).subquery(),
+        select(literal('address'), deleted_addresses.c.id, literal(0)),
+    )
+    rows = db.execute(select(stock)).all()
+
+    deleted_orders = _restock(db, rows)
+    _detach(db, Order, deleted_orders)
+    _detach(db, Address, [row[1] for row in rows if row[0] == 'address'])
+    return deleted_orders
+
+
+def expire_orders(db: Session, *criteria):
+    """Marks the orders matching criteria EXPIRED and puts their stock back, without committing.
+
+    One statement updates the orders and returns the amounts to restock; the orders keep their items and addresses.
+    Returns the ids of the expired orders.
+    """
+    orders, pizzas, beverages = Order.__table__, Pizza.__table__, OrderBeverageQuantity.__table__
+    expired = update(orders) \
+        .where(*criteria) \
+        .values(order_status=OrderStatus.EXPIRED, reserved_until=None) \
+        .returning(orders.c.id) \
+        .cte('expired')
+    stock = _stock_of(
+        expired,
+        select(pizzas.c.pizza_type_id).where(pizzas.c.order_id.in_(select(expired.c.id))).subquery(),
+        select(beverages).where(beverages.c.order_id.in_(select(expired.c.id))).subquery(),
+    )
+    expired_orders = _restock(db, db.execute(select(stock)).all())
+    for expired_id in expired_orders:
+        loaded = db.identity_map.get(db.identity_key(Order, expired_id))
+        if loaded is not None:
+            db.expire(loaded)
+    return expired_orders
+
+
+def release_expired_reservations(db: Session):
+    """Marks the TRANSMITTED orders whose reservation expired EXPIRED and puts their stock back, in batches.
+
+    Every batch is one transaction with a fixed number of statements: the expired orders are locked in expiry order,
+    skipping orders a request is changing right now, and expired by expire_orders. The orders stay readable with
+    their items. Returns the number of released orders.
+    """
+    released = 0
+    while True:
+        expired = select(Order.id) \
+            .where(Order.order_status == OrderStatus.TRANSMITTED, Order.reserved_until < func.now()) \
+            .order_by(Order.reserved_until) \
+            .limit(ORDER_RESERVATION_SWEEP_BATCH) \
+            .with_for_update(skip_locked=True)
+        order_ids = expire_orders(db, Order.id.in_(expired.scalar_subquery()))
+        db.commit()
+        if not order_ids:
+            break
+        released += len(order_ids)
+        logging.info('Released the stock of {} expired orders: {}'.format(
+            len(order_ids), [str(order_id) for order_id in order_ids]))
+        if len(order_ids) < ORDER_RESERVATION_SWEEP_BATCH:
+            break
+    return released
@@ -0,0 +1,206 @@
+import uuid
+import logging
+from typing import Dict, Iterable, List, Optional, Set
+
+from sqlalchemy import Integer, cast, delete, event, func, insert, literal, select, update
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.orm import Session
+
+import app.api.v1.endpoints.order.stock_logic.stock_crud as stock_crud
+import app.api.v1.endpoints.order.stock_logic.stock_ledger_crud as stock_ledger_crud
+from app.database.connection import SessionLocal
+from app.database.models import Dough, StockMovementReason, StockShard, Topping
+
+SHARDED_MODELS = (Dough, Topping)
+# The stock of an item is spread again if a shard holds less than this part of the average shard
+STOCK_SHARD_REBALANCE_THRESHOLD = 0.5
+
+shard_table = StockShard.__table__
+
+
+def _shards_of(model, item_id: uuid.UUID):
+    return shard_table.c.item_type == model.__tablename__, shard_table.c.item_id == item_id
+
+
+def _split(stock: int, shards: int) -> List[int]:
+    # Even shares, the first shards get one more of the remainder
+    share, remainder = divmod(stock, shards)
+    return [share + 1 if shard < remainder else share for shard in range(shards)]
+
+
+def get_sharded_ids(model, item_ids: Iterable[uuid.UUID], db: Session) -> Set[uuid.UUID]:
+    item_ids = list(item_ids)
+    if not item_ids:
+        return set()
+    return set(db.scalars(select(model.id).where(model.id.in_(item_ids), model.stock_shards > 1)))
+
+
+def get_stock_of_shards(model, item_id: uuid.UUID, db: Session) -> List[int]:
+    return list(db.scalars(
+        select(shard_table.c.stock).where(*_shards_of(model, item_id)).order_by(shard_table.c.shard)))
+
+
+def _take_from_shards(model, item_id: uuid.UUID, takes: Dict[int, int], db: Session, order_id):
+    # One UPDATE of the given shards, recorded as RESERVE movements
+    shards, amounts = zip(*sorted(takes.items()))
+    amounts_table = func.unnest(cast(list(shards), ARRAY(Integer)), cast(list(amounts), ARRAY(Integer))) \
+        .table_valued('shard', 'amount') \
+        .render_derived(name='amounts')
+    changed = update(shard_table) \
+        .where(*_shards_of(model, item_id), shard_table.c.shard == amounts_table.c.shard,
+               shard_table.c.stock >= amounts_table.c.amount) \
+        .values(stock=shard_table.c.stock - amounts_table.c.amount) \
+        .returning(shard_table.c.item_id.label('id'), shard_table.c.stock, (-amounts_table.c.amount).label('change')) \
+        .cte('changed')
+    return db.execute(stock_ledger_crud.movements_of(model, changed, StockMovementReason.RESERVE, order_id)).all()
+
+
+def _take_from_one_shard(model, item_id: uuid.UUID, amount: int, db: Session, order_id, skip_locked: bool):
+    # A random shard with enough stock; with skip_locked only shards no other transaction holds, without waiting
+    chosen = select(shard_table.c.shard) \
+        .where(*_shards_of(model, item_id), shard_table.c.stock >= amount) \
+        .order_by(func.random()) \
+        .limit(1) \
+        .with_for_update(skip_locked=skip_locked) \
+        .cte('chosen')
+    changed = update(shard_table) \
+        .where(*_shards_of(model, item_id), shard_table.c.shard == chosen.c.shard) \
+        .values(stock=shard_table.c.stock - amount) \
+        .returning(shard_table.c.item_id.label('id'), shard_table.c.stock, literal(-amount).label('change')) \
+        .cte('changed')
+    return bool(db.execute(
+        stock_ledger_crud.movements_of(model, changed, StockMovementReason.RESERVE, order_id)).all())
+
+
+def _take_from_all_shards(model, item_id: uuid.UUID, amount: int, db: Session, order_id):
+    # Waits for the item and all its shards, then takes from the fullest shards and finally from own_stock
+    table = model.__table__
+    own_stock = db.execute(select(table.c.stock).where(table.c.id == item_id).with_for_update()).scalar()
+    shards = db.execute(
+        select(shard_table.c.shard, shard_table.c.stock)
+        .where(*_shards_of(model, item_id))
+        .order_by(shard_table.c.shard)
+        .with_for_update()).all()
+    if own_stock is None or own_stock + sum(stock for _, stock in shards) < amount:
+        logging.error('Not enough stock of sharded {} with ID {}, needed: {}'.format(
+            model.__tablename__, item_id, amount))
+        return False
+
+    takes, missing = {}, amount
+    for shard, stock in sorted(shards, key=lambda row: row.stock, reverse=True):
+        if missing and stock:
+            takes[shard] = min(stock, missing)
+            missing -= takes[shard]
+    if takes:
+        _take_from_shards(model, item_id, takes, db, order_id)
+    return not missing or stock_crud.take_stock(model, {item_id: missing}, db, order_id)
+
+
+def take_sharded_stock(model, demand: Dict[uuid.UUID, int], db: Session, order_id: Optional[uuid.UUID] = None):
+    """Takes the demanded amount of every sharded item from its shards, without committing.
+
+    Usually one shard that no other order holds right now suffices, so concurrent orders of a hot item don't wait
+    for each other. If every shard with enough stock is locked, the order waits for one of them; only if no single
+    shard has enough, it waits for all shards of the item. Items are taken in id order, so waiting orders can't
+    deadlock. Returns False if any item is short; the caller has to roll back then.
+    """
+    for item_id, amount in sorted(demand.items()):
+        if amount <= 0:
+            continue
+        if not _take_from_one_shard(model, item_id, amount, db, order_id, skip_locked=True) \
+                and not _take_from_one_shard(model, item_id, amount, db, order_id, skip_locked=False) \
+                and not _take_from_all_shards(model, item_id, amount, db, order_id):
+            return False
+    logging.info('Took stock of sharded {}: {}'.format(
+        model.__tablename__, {str(item_id): amount for item_id, amount in demand.items()}))
+    return True
+
+
+def set_stock_shards(model, item, shards: int, db: Session):
+    """Spreads the stock of the item over the given number of shards (1 stops sharding) and commits."""
+    table = model.__table__
+    own_stock = db.execute(select(table.c.stock).where(table.c.id == item.id).with_for_update()).scalar_one()
+    shard_stock = db.scalars(
+        delete(StockShard)
+        .where(StockShard.item_type == model.__tablename__, StockShard.item_id == item.id)
+        .returning(StockShard.stock)
+        .execution_options(synchronize_session=False)).all()
+    stock = own_stock + sum(shard_stock)
+
+    if shards > 1:
+        db.execute(insert(StockShard).values([
+            {'item_type': model.__tablename__, 'item_id': item.id, 'shard': shard, 'stock': shard_stock}
+            for shard, shard_stock in enumerate(_split(stock, shards))
+        ]))
+        own_stock = 0
+    else:
+        own_stock = stock
+    # Core update, the total stock doesn't change: no movement and no refresh of max_makeable
+    db.execute(update(table).where(table.c.id == item.id).values(stock=own_stock, stock_shards=shards))
+    db.commit()
+    db.refresh(item)
+    logging.info('Stock of {} {} split into {} shards'.format(model.__tablename__, item.id, shards))
+    return item
+
+
+def _rebalance(model, item_id: uuid.UUID, shards: int, db: Session):
+    # Skips items whose shards or row are held by an order, the next run catches up
+    table = model.__table__
+    rows = db.execute(
+        select(shard_table.c.shard, shard_table.c.stock)
+        .where(*_shards_of(model, item_id))
+        .order_by(shard_table.c.shard)
+        .with_for_update(skip_locked=True)).all()
+    own_stock = db.execute(
+        select(table.c.stock).where(table.c.id == item_id).with_for_update(skip_locked=True)).scalar()
+    if len(rows) < shards or own_stock is None:
+        db.rollback()
+        return False
+
+    stock = own_stock + sum(row.stock for row in rows)
+    if not own_stock and min(row.stock for row in rows) >= stock / shards * STOCK_SHARD_REBALANCE_THRESHOLD:
+        db.rollback()
+        return False
+
+    shares = func.unnest(cast(list(range(shards)), ARRAY(Integer)), cast(_split(stock, shards), ARRAY(Integer))) \
+        .table_valued('shard', 'stock') \
+        .render_derived(name='shares')
+    db.execute(
+        update(shard_table)
+        .where(*_shards_of(model, item_id), shard_table.c.shard == shares.c.shard)
+        .values(stock=shares.c.stock))
+    db.execute(update(table).where(table.c.id == item_id).values(stock=0))
+    db.commit()
+    return True
+
+
+def rebalance_stock_shards(db: Session):
+    """Spreads the stock of every sharded item evenly over its shards again and commits.
+
+    Orders take from random shards and put stock back to own_stock, so shards drain unevenly. The total stock
+    doesn't change, so max_makeable stays as the orders left it. Returns the number of rebalanced items.
+    """
+    rebalanced = 0
+    for model in SHARDED_MODELS:
+        table = model.__table__
+        items = db.execute(select(table.c.id, table.c.stock_shards).where(table.c.stock_shards > 1)).all()
+        db.rollback()
+        for item in items:
+            rebalanced += _rebalance(model, item.id, item.stock_shards, db)
+
+    if rebalanced:
+        logging.info('Rebalanced the stock shards of {} items'.format(rebalanced))
+    return rebalanced
+
+
+@event.listens_for(SessionLocal, 'before_flush')
+def _replace_stock_of_shards(session, flush_context, instances):
+    # Stock set on a sharded item replaces the stock of its shards; deleted items lose their shards
+    for item in session.dirty:
+        if isinstance(item, SHARDED_MODELS) and item.stock_shards > 1 and stock_ledger_crud.stock_changed(item):
+            table = type(item).__table__
+            session.connection().execute(select(table.c.id).where(table.c.id == item.id).with_for_update())
+            session.connection().execute(update(shard_table).where(*_shards_of(type(item), item.id)).values(stock=0))
+    for item in session.deleted:
+        if isinstance(item, SHARDED_MODELS):
+            session.connection().execute(delete(shard_table).where(*_shards_of(type(item), item.id)))
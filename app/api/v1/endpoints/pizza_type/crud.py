@@ -1,13 +1,21 @@
 import logging
 import uuid
 from decimal import Decimal
+from typing import Set
 
+from sqlalchemy import delete, func, lambda_stmt, select
 from sqlalchemy.orm import Session
 
+# Also keeps PizzaType.max_makeable up to date when pizza types or their toppings change
+import app.api.v1.endpoints.order.stock_logic.stock_availability_crud as stock_availability_crud
 from app.api.v1.endpoints.pizza_type.schemas import (
     PizzaTypeCreateSchema,
+    PizzaTypeListItemSchema,
+    PizzaTypeSchema,
     PizzaTypeToppingQuantityCreateSchema,
 )
+from app.api.v1.etag import entity_tag
+from app.database.catalog_cache import CatalogList, catalog_cache, invalidate_on_commit
 from app.database.models import PizzaType, PizzaTypeToppingQuantity, PizzaTypeSauce
 
 
@@ -25,6 +33,7 @@ def create_pizza_type(schema: PizzaTypeCreateSchema, db: Session):
         .format(entity.id, entity.name, entity.description))
     try:
         db.add(entity)
+        invalidate_on_commit(db, PizzaType)
         db.commit()
 
         logging.info(
@@ -36,6 +45,7 @@ def create_pizza_type(schema: PizzaTypeCreateSchema, db: Session):
             pizza_type_sauce = PizzaTypeSauce(pizza_type_id=entity.id, sauce_id=sauce_id)
             db.add(pizza_type_sauce)
 
+        invalidate_on_commit(db, PizzaTypeSauce)
         db.commit()
     except Exception as e:
         logging.error(
@@ -47,22 +57,40 @@ def create_pizza_type(schema: PizzaTypeCreateSchema, db: Session):
     return entity
 
 
-def get_pizza_type_by_id(pizza_type_id: uuid.UUID, db: Session):
-    entity = db.query(PizzaType).filter(PizzaType.id == pizza_type_id).first()
+def get_pizza_type_by_id(pizza_type_id: uuid.UUID, db: Session, *options):
+    # Only the relationships of the given loader options are loaded, e.g. selectinload(PizzaType.sauces)
+    entity = db.get(PizzaType, pizza_type_id, options=options)
     if not entity:
         logging.error('PizzaType with ID {} not found'.format(pizza_type_id))
     return entity
 
 
 def get_pizza_type_by_name(pizza_type_name: str, db: Session):
-    entity = db.query(PizzaType).filter(PizzaType.name == pizza_type_name).first()
+    entity = db.scalars(lambda_stmt(lambda: select(PizzaType).where(PizzaType.name == pizza_type_name))).first()
     if not entity:
         logging.error('PizzaType with name {} not found'.format(pizza_type_name))
     return entity
 
 
-def get_all_pizza_types(db: Session):
-    return db.query(PizzaType).all()
+def pizza_types_exist(pizza_type_ids: Set[uuid.UUID], db: Session):
+    """Whether all given pizza types exist, with one query."""
+    found = db.scalar(select(func.count()).select_from(PizzaType).where(PizzaType.id.in_(pizza_type_ids)))
+    if found < len(pizza_type_ids):
+        logging.error('{} of the PizzaTypes with IDs {} not found'.format(
+            len(pizza_type_ids) - found, [str(pizza_type_id) for pizza_type_id in pizza_type_ids]))
+        return False
+    return True
+
+
+def get_all_pizza_types(db: Session) -> CatalogList:
+    # The cached pizza types don't change with the stock, max_makeable is merged in from the availability map
+    pizza_types = catalog_cache.get(PizzaType, lambda session: [
+        PizzaTypeSchema.from_orm(entity) for entity in session.query(PizzaType).order_by(PizzaType.id).all()], db)
+    availability = stock_availability_crud.get_pizza_type_availability(db)
+    return CatalogList([
+        PizzaTypeListItemSchema(**pizza_type.dict(), max_makeable=availability.get(pizza_type.id, 0))
+        for pizza_type in pizza_types
+    ], etag=entity_tag(pizza_types.etag, availability.etag))
 
 
 def update_pizza_type(pizza_type: PizzaType, changed_pizza_type: PizzaTypeCreateSchema, db: Session):
@@ -70,6 +98,7 @@ def update_pizza_type(pizza_type: PizzaType, changed_pizza_type: PizzaTypeCreate
         setattr(pizza_type, key, value)
 
     try:
+        invalidate_on_commit(db, PizzaType)
         db.commit()
         db.refresh(pizza_type)
     except Exception as e:
@@ -79,12 +108,28 @@ def update_pizza_type(pizza_type: PizzaType, changed_pizza_type: PizzaTypeCreate
 
 
 def delete_pizza_type_by_id(pizza_type_id: uuid.UUID, db: Session):
-    entity = get_pizza_type_by_id(pizza_type_id, db)
-    if entity:
-        db.delete(entity)
+    # One statement deletes the pizza type with its sauces and topping quantities, without loading them
+    sauces, toppings, pizza_types = PizzaTypeSauce.__table__, PizzaTypeToppingQuantity.__table__, PizzaType.__table__
+    deleted = db.execute(
+        delete(pizza_types)
+        .where(pizza_types.c.id == pizza_type_id)
+        .add_cte(delete(sauces).where(sauces.c.pizza_type_id == pizza_type_id).cte('deleted_sauces'),
+                 delete(toppings).where(toppings.c.pizza_type_id == pizza_type_id).cte('deleted_toppings'))
+        .returning(pizza_types.c.id),
+    ).scalar()
+    if deleted:
+        # The statement bypasses the session, detach loaded rows like a delete through the session would
+        for key in list(db.identity_map.keys()):
+            if key[0] is PizzaType and key[1] == (pizza_type_id,) \
+                    or key[0] in (PizzaTypeSauce, PizzaTypeToppingQuantity) and key[1][0] == pizza_type_id:
+                loaded = db.identity_map.get(key)
+                if loaded is not None:
+                    db.expunge(loaded)
+        invalidate_on_commit(db, PizzaType)
         db.commit()
         logging.info('PizzaType with ID {} deleted'.format(pizza_type_id))
     else:
+        db.rollback()
         logging.error('Failed to delete PizzaType with ID {}: not found'.format(pizza_type_id))
 
 
@@ -95,7 +140,9 @@ def create_topping_quantity(
 ):
     entity = PizzaTypeToppingQuantity(**schema.dict())
     logging.info('Trying to create PizzaTypeToppingQuantity created for PizzaType ID {}'.format(pizza_type.id))
-    pizza_type.toppings.append(entity)
+    entity.pizza_type_id = pizza_type.id
+    db.add(entity)
+    invalidate_on_commit(db, PizzaTypeToppingQuantity)
     db.commit()
     db.refresh(pizza_type)
     logging.info('PizzaTypeToppingQuantity created for PizzaType ID {}'.format(pizza_type.id))
@@ -107,10 +154,7 @@ def get_topping_quantity_by_id(
         topping_id: uuid.UUID,
         db: Session,
 ):
-    entity = db.query(PizzaTypeToppingQuantity) \
-        .filter(PizzaTypeToppingQuantity.topping_id == topping_id,
-                PizzaTypeToppingQuantity.pizza_type_id == pizza_type_id) \
-        .first()
+    entity = db.get(PizzaTypeToppingQuantity, (pizza_type_id, topping_id))
     if not entity:
         logging.error(
             'Topping quantity with topping ID {} and PizzaType ID {} not found'.format(
@@ -3,7 +3,7 @@ from typing import List, TypeVar
 
 from fastapi import APIRouter, Depends, Request, Response, status, HTTPException
 from fastapi.responses import RedirectResponse
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, selectinload
 
 import app.api.v1.endpoints.dough.crud as dough_crud
 import app.api.v1.endpoints.pizza_type.crud as pizza_type_crud
@@ -12,25 +12,32 @@ from app.api.v1.endpoints.dough.schemas import DoughSchema
 from app.api.v1.endpoints.pizza_type.schemas import \
     JoinedPizzaTypeQuantitySchema, \
     PizzaTypeSchema, \
+    PizzaTypeListItemSchema, \
     PizzaTypeCreateSchema, \
     PizzaTypeToppingQuantityCreateSchema, PizzaTypeSauceSchema
-from app.database.connection import SessionLocal
+from app.api.v1.etag import entity_tag, is_not_modified, not_modified
+from app.api.v1.pagination import PageParams, page_of_list, paginate
+from app.database.models import PizzaType
+from app.database.session import get_db, get_replica_db
 
 router = APIRouter()
 
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-
-@router.get('', response_model=List[PizzaTypeSchema], tags=['pizza_type'])
-def get_all_pizza_types(db: Session = Depends(get_db)):
+@router.get('', response_model=List[PizzaTypeListItemSchema], tags=['pizza_type'])
+def get_all_pizza_types(
+        request: Request,
+        response: Response,
+        page: PageParams = Depends(),
+        db: Session = Depends(get_replica_db),
+):
+    after = page.after(uuid.UUID)
     pizza_types = pizza_type_crud.get_all_pizza_types(db)
-    return pizza_types
+    etag = entity_tag(pizza_types.etag, page.cursor, page.limit)
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+    response.headers['ETag'] = etag
+    return paginate(
+        request, response, page_of_list(pizza_types, after, page.limit), page.limit, lambda item: (item.id,))
 
 
 @router.post('', response_model=PizzaTypeSchema, tags=['pizza_type'])
@@ -131,16 +138,16 @@ def get_pizza_type_toppings(
         db: Session = Depends(get_db),
         join: bool = False,
 ):
-    pizza_type = pizza_type_crud.get_pizza_type_by_id(pizza_type_id, db)
+    # The Toppings are loaded with the Pizza Type unless the joined Query loads them
+    pizza_type = pizza_type_crud.get_pizza_type_by_id(
+        pizza_type_id, db, *([] if join else [selectinload(PizzaType.toppings)]))
 
     if not pizza_type:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
 
-    toppings = pizza_type.toppings
     if join:
-        toppings = pizza_type_crud.get_joined_topping_quantities_by_pizza_type(pizza_type.id, db)
-
-    return toppings
+        return pizza_type_crud.get_joined_topping_quantities_by_pizza_type(pizza_type.id, db)
+    return pizza_type.toppings
 
 
 @router.get(
@@ -153,7 +160,7 @@ def get_pizza_type_sauces(
         response: Response,
         db: Session = Depends(get_db),
 ):
-    pizza_type = pizza_type_crud.get_pizza_type_by_id(pizza_type_id, db)
+    pizza_type = pizza_type_crud.get_pizza_type_by_id(pizza_type_id, db, selectinload(PizzaType.sauces))
 
     if not pizza_type:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
@@ -205,6 +212,6 @@ def get_pizza_type_dough(
     if not pizza_type:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
 
-    dough = pizza_type.dough
+    dough = dough_crud.get_dough_by_id(pizza_type.dough_id, db)
 
     return dough
@@ -24,6 +24,11 @@ class PizzaTypeSchema(PizzaTypeBaseSchema):
     id: uuid.UUID
 
 
+class PizzaTypeListItemSchema(PizzaTypeSchema):
+    # Number of pizzas of this type that can still be made from the stock, 0 means sold out
+    max_makeable: int
+
+
 class PizzaTypeToppingQuantityBaseSchema(BaseModel):
     quantity: int
 
@@ -1,15 +1,18 @@
 import logging
 import uuid
 
+from sqlalchemy import lambda_stmt, select
 from sqlalchemy.orm import Session
 
-from app.api.v1.endpoints.sauce.schemas import SauceCreateSchema
+from app.api.v1.endpoints.sauce.schemas import SauceCreateSchema, SauceListItemSchema
+from app.database.catalog_cache import catalog_cache, invalidate_on_commit
 from app.database.models import Sauce
 
 
 def create_sauce(schema: SauceCreateSchema, db: Session):
     entity = Sauce(**schema.dict())
     db.add(entity)
+    invalidate_on_commit(db, Sauce)
     db.commit()
     logging.info('Sauce created with name {}; stock {}; description {}; price {}; spice {}'.format(
         entity.name, entity.stock, entity.description, entity.price, entity.spice))
@@ -17,27 +20,29 @@ def create_sauce(schema: SauceCreateSchema, db: Session):
 
 
 def get_sauce_by_id(sauce_id: uuid.UUID, db: Session):
-    entity = db.query(Sauce).filter(Sauce.id == sauce_id).first()
+    entity = db.get(Sauce, sauce_id)
     if not entity:
         logging.error('Sauce with ID {} not found'.format(sauce_id))
     return entity
 
 
 def get_sauce_by_name(sauce_name: str, db: Session):
-    entity = db.query(Sauce).filter(Sauce.name == sauce_name).first()
+    entity = db.scalars(lambda_stmt(lambda: select(Sauce).where(Sauce.name == sauce_name))).first()
     if not entity:
         logging.error('Sauce with name {} not found'.format(sauce_name))
     return entity
 
 
 def get_all_sauces(db: Session):
-    return db.query(Sauce).all()
+    return catalog_cache.get(Sauce, lambda session: [
+        SauceListItemSchema.from_orm(entity) for entity in session.query(Sauce).order_by(Sauce.id).all()], db)
 
 
 def delete_sauce_by_id(sauce_id: uuid.UUID, db: Session):
     entity = get_sauce_by_id(sauce_id, db)
     if entity:
         db.delete(entity)
+        invalidate_on_commit(db, Sauce)
         db.commit()
         logging.info('Sauce {} with ID {} deleted'.format(entity.name, sauce_id))
     else:
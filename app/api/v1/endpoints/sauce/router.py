@@ -8,22 +8,27 @@ from starlette.responses import Response
 
 import app.api.v1.endpoints.sauce.crud as sauce_crud
 from app.api.v1.endpoints.sauce.schemas import SauceSchema, SauceCreateSchema, SauceListItemSchema
-from app.database.connection import SessionLocal
+from app.api.v1.etag import entity_tag, is_not_modified, not_modified
+from app.api.v1.pagination import PageParams, page_of_list, paginate
+from app.database.session import get_db, get_replica_db
 
 router = APIRouter()
 
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-
 @router.get('', response_model=List[SauceListItemSchema], tags=['sauce'])
-def get_all_sauces(db: Session = Depends(get_db)):
-    return sauce_crud.get_all_sauces(db)
+def get_all_sauces(
+        request: Request,
+        response: Response,
+        page: PageParams = Depends(),
+        db: Session = Depends(get_replica_db),
+):
+    after = page.after(uuid.UUID)
+    sauces = sauce_crud.get_all_sauces(db)
+    etag = entity_tag(sauces.etag, page.cursor, page.limit)
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+    response.headers['ETag'] = etag
+    return paginate(request, response, page_of_list(sauces, after, page.limit), page.limit, lambda item: (item.id,))
 
 
 @router.get('/{sauce_id}', response_model=SauceSchema, tags=['sauce'])
@@ -1,13 +1,16 @@
 import logging
 import uuid
+from sqlalchemy import lambda_stmt, select
 from sqlalchemy.orm import Session
 from app.api.v1.endpoints.topping.schemas import ToppingCreateSchema, ToppingListItemSchema
+from app.database.catalog_cache import catalog_cache, invalidate_on_commit
 from app.database.models import Topping
 
 
 def create_topping(schema: ToppingCreateSchema, db: Session):
     entity = Topping(**schema.dict())
     db.add(entity)
+    invalidate_on_commit(db, Topping)
     db.commit()
     logging.info('Topping created with ID: {}; name: {}; price: {}; description: {}'.format(
         entity.id, entity.name, entity.price, entity.description))
@@ -15,7 +18,7 @@ def create_topping(schema: ToppingCreateSchema, db: Session):
 
 
 def get_topping_by_id(topping_id: uuid.UUID, db: Session):
-    entity = db.query(Topping).filter(Topping.id == topping_id).first()
+    entity = db.get(Topping, topping_id)
     if entity:
         logging.info('Topping retrieved with ID: {}'.format(topping_id))
     else:
@@ -24,7 +27,7 @@ def get_topping_by_id(topping_id: uuid.UUID, db: Session):
 
 
 def get_topping_by_name(topping_name: str, db: Session):
-    entity = db.query(Topping).filter(Topping.name == topping_name).first()
+    entity = db.scalars(lambda_stmt(lambda: select(Topping).where(Topping.name == topping_name))).first()
     if entity:
         logging.info('Topping retrieved with name: {}'.format(topping_name))
     else:
@@ -32,8 +35,8 @@ def get_topping_by_name(topping_name: str, db: Session):
     return entity
 
 
-def get_all_toppings(db: Session):
-    entities = db.query(Topping).all()
+def _load_all_toppings(db: Session):
+    entities = db.query(Topping).order_by(Topping.id).all()
     if entities:
         logging.info('All toppings retrieved, count: {}'.format(len(entities)))
         return_entities = []
@@ -46,9 +49,14 @@ def get_all_toppings(db: Session):
     return entities
 
 
+def get_all_toppings(db: Session):
+    return catalog_cache.get(Topping, _load_all_toppings, db)
+
+
 def update_topping(topping: Topping, changed_topping: ToppingCreateSchema, db: Session):
     for key, value in changed_topping.dict().items():
         setattr(topping, key, value)
+    invalidate_on_commit(db, Topping)
     db.commit()
     db.refresh(topping)
     logging.info('Topping {} updated with name: {}; price: {}; description: {}'.format(
@@ -60,6 +68,7 @@ def delete_topping_by_id(topping_id: uuid.UUID, db: Session):
     entity = get_topping_by_id(topping_id, db)
     if entity:
         db.delete(entity)
+        invalidate_on_commit(db, Topping)
         db.commit()
         logging.info('Topping {} with ID {} deleted'.format(entity.name, topping_id))
     else:
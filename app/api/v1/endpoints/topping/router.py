@@ -6,24 +6,31 @@ from fastapi.responses import RedirectResponse
 from sqlalchemy.orm import Session
 
 import app.api.v1.endpoints.topping.crud as topping_crud
-from app.api.v1.endpoints.topping.schemas import ToppingSchema, ToppingCreateSchema, ToppingListItemSchema
-from app.database.connection import SessionLocal
+import app.api.v1.endpoints.order.stock_logic.stock_shard_crud as stock_shard_crud
+from app.api.v1.endpoints.topping.schemas import ToppingSchema, ToppingCreateSchema, ToppingListItemSchema, \
+    ToppingStockShardsSchema, ToppingStockShardsUpdateSchema
+from app.database.models import Topping
+from app.api.v1.etag import entity_tag, is_not_modified, not_modified
+from app.api.v1.pagination import PageParams, page_of_list, paginate
+from app.database.session import get_db, get_replica_db
 
 router = APIRouter()
 
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-
 @router.get('', response_model=List[ToppingListItemSchema], tags=['topping'])
-def get_all_toppings(db: Session = Depends(get_db)):
+def get_all_toppings(
+        request: Request,
+        response: Response,
+        page: PageParams = Depends(),
+        db: Session = Depends(get_replica_db),
+):
+    after = page.after(uuid.UUID)
     toppings = topping_crud.get_all_toppings(db)
-    return toppings
+    etag = entity_tag(toppings.etag, page.cursor, page.limit)
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+    response.headers['ETag'] = etag
+    return paginate(request, response, page_of_list(toppings, after, page.limit), page.limit, lambda item: (item.id,))
 
 
 @router.post('', response_model=ToppingSchema, status_code=status.HTTP_201_CREATED, tags=['topping'])
@@ -92,3 +99,35 @@ def delete_topping(topping_id: uuid.UUID, db: Session = Depends(get_db)):
 
     topping_crud.delete_topping_by_id(topping_id, db)
     return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+
+def _stock_shards_of(topping: Topping, db: Session):
+    return ToppingStockShardsSchema(
+        shards=topping.stock_shards, stock=topping.stock,
+        shard_stock=stock_shard_crud.get_stock_of_shards(Topping, topping.id, db),
+    )
+
+
+@router.get('/{topping_id}/stock-shards', response_model=ToppingStockShardsSchema, tags=['topping'])
+def get_topping_stock_shards(topping_id: uuid.UUID, db: Session = Depends(get_db)):
+    topping = topping_crud.get_topping_by_id(topping_id, db)
+
+    if not topping:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+
+    return _stock_shards_of(topping, db)
+
+
+@router.put('/{topping_id}/stock-shards', response_model=ToppingStockShardsSchema, tags=['topping'])
+def update_topping_stock_shards(
+        topping_id: uuid.UUID,
+        stock_shards: ToppingStockShardsUpdateSchema,
+        db: Session = Depends(get_db),
+):
+    topping = topping_crud.get_topping_by_id(topping_id, db)
+
+    if not topping:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+
+    stock_shard_crud.set_stock_shards(Topping, topping, stock_shards.shards, db)
+    return _stock_shards_of(topping, db)
@@ -1,6 +1,7 @@
 import uuid
+from typing import List
 
-from pydantic import BaseModel
+from pydantic import BaseModel, conint
 
 
 class ToppingBaseSchema(BaseModel):
@@ -35,3 +36,15 @@ class ToppingListItemSchema(BaseModel):
 
     class Config:
         orm_mode = True
+
+
+class ToppingStockShardsUpdateSchema(BaseModel):
+    # 1 stops sharding
+    shards: conint(ge=1, le=64)
+
+
+class ToppingStockShardsSchema(BaseModel):
+    shards: int
+    stock: int
+    # Stock of every shard, empty if the topping is not sharded; stock minus their sum is not taken from shards yet
+    shard_stock: List[int]
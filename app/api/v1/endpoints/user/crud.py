@@ -1,7 +1,11 @@
 import logging
 import uuid
-from sqlalchemy.orm import Session
+from typing import Optional, Tuple
+from sqlalchemy import delete, lambda_stmt, select
+from sqlalchemy.orm import Session, selectinload
+import app.api.v1.endpoints.order.stock_logic.stock_reservation_crud as stock_reservation_crud
 from app.api.v1.endpoints.user.schemas import UserCreateSchema
+from app.api.v1.pagination import keyset
 from app.database.models import Order
 from app.database.models import User
 
@@ -15,7 +19,7 @@ def create_user(schema: UserCreateSchema, db: Session):
 
 
 def get_user_by_username(username: str, db: Session):
-    entity = db.query(User).filter(User.username == username).first()
+    entity = db.scalars(lambda_stmt(lambda: select(User).where(User.username == username))).first()
     if entity:
         logging.info('User retrieved with username: {}'.format(username))
     else:
@@ -24,7 +28,7 @@ def get_user_by_username(username: str, db: Session):
 
 
 def get_user_by_id(user_id: uuid.UUID, db: Session):
-    entity = db.query(User).filter(User.id == user_id).first()
+    entity = db.get(User, user_id)
     if entity:
         logging.info('User retrieved with ID: {}'.format(user_id))
     else:
@@ -32,8 +36,8 @@ def get_user_by_id(user_id: uuid.UUID, db: Session):
     return entity
 
 
-def get_all_users(db: Session):
-    entities = db.query(User).all()
+def get_all_users(db: Session, after: Optional[Tuple] = None, limit: Optional[int] = None):
+    entities = db.scalars(keyset(select(User), (User.id,), after, limit)).all()
     logging.info('All users retrieved, count: {}'.format(len(entities)))
     return entities
 
@@ -48,17 +52,24 @@ def update_user(user: User, changed_user: UserCreateSchema, db: Session):
 
 
 def delete_user_by_id(user_id: uuid.UUID, db: Session):
-    entity = get_user_by_id(user_id, db)
-    if entity:
-        db.delete(entity)
+    # The orders go with their items and addresses, and their stock back, in one statement instead of loading them
+    stock_reservation_crud.delete_orders(db, Order.user_id == user_id)
+    users = User.__table__
+    deleted = db.execute(delete(users).where(users.c.id == user_id).returning(users.c.id)).scalar()
+    if deleted:
+        loaded = db.identity_map.get(db.identity_key(User, user_id))
+        if loaded is not None:
+            db.expunge(loaded)
         db.commit()
         logging.info('User with ID {} deleted'.format(user_id))
     else:
+        db.rollback()
         logging.error('User with ID {} not found'.format(user_id))
 
 
 def get_order_history_of_user(user_id: uuid.UUID, db: Session):
     entities = db.query(Order) \
+        .options(selectinload(Order.address)) \
         .filter(Order.user_id == user_id) \
         .filter(Order.order_status == 'COMPLETED').all()
     logging.info('Order history retrieved for user ID {}, count: {}'.format(user_id, len(entities)))
@@ -67,6 +78,7 @@ def get_order_history_of_user(user_id: uuid.UUID, db: Session):
 
 def get_open_orders_of_user(user_id: uuid.UUID, db: Session):
     entities = db.query(Order) \
+        .options(selectinload(Order.address)) \
         .filter(Order.user_id == user_id) \
         .filter(Order.order_status != 'COMPLETED').all()
     logging.info('Open orders retrieved for user ID {}, count: {}'.format(user_id, len(entities)))
@@ -75,6 +87,7 @@ def get_open_orders_of_user(user_id: uuid.UUID, db: Session):
 
 def get_all_not_completed_orders(db: Session):
     entities = db.query(Order) \
+        .options(selectinload(Order.address)) \
         .filter(Order.order_status != 'COMPLETED').all()
     logging.info('All not completed orders retrieved, count: {}'.format(len(entities)))
     return entities
@@ -2,31 +2,27 @@ import logging
 import uuid
 from typing import List
 
-from fastapi import APIRouter, Depends, status, HTTPException
+from fastapi import APIRouter, Depends, Request, status, HTTPException
 from sqlalchemy.orm import Session
 from starlette.responses import Response
 
 import app.api.v1.endpoints.user.crud as user_crud
 from app.api.v1.endpoints.user.schemas import UserSchema, UserCreateSchema
-from app.database.connection import SessionLocal
+from app.api.v1.pagination import PageParams, paginate
+from app.database.session import get_db, get_replica_db
 
 router = APIRouter()
 
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-
 @router.get('', response_model=List[UserSchema], tags=['user'])
 def get_all_users(
-        db: Session = Depends(get_db),
+        request: Request,
+        response: Response,
+        page: PageParams = Depends(),
+        db: Session = Depends(get_replica_db),
 ):
-    users = user_crud.get_all_users(db)
-    return users
+    users = user_crud.get_all_users(db, page.after(uuid.UUID), page.limit)
+    return paginate(request, response, users, page.limit, lambda user: (user.id,))
 
 
 @router.post('', response_model=UserSchema, status_code=status.HTTP_201_CREATED, tags=['user'])
@@ -0,0 +1,28 @@
+import datetime
+import hashlib
+from email.utils import format_datetime
+
+from fastapi import Request, Response, status
+
+
+def entity_tag(*parts) -> str:
+    """Strong ETag of the given version parts, e.g. the id and updated_at of a row."""
+    return '"{}"'.format(hashlib.sha1('|'.join(str(part) for part in parts).encode()).hexdigest())
+
+
+def http_date(value: datetime.datetime) -> str:
+    return format_datetime(value.astimezone(datetime.timezone.utc), usegmt=True)
+
+
+def is_not_modified(request: Request, etag: str) -> bool:
+    """Whether If-None-Match of the request matches etag, compared weakly like RFC 9110 does for GET."""
+    if_none_match = request.headers.get('if-none-match')
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    return etag in (tag.strip().removeprefix('W/') for tag in if_none_match.split(','))
+
+
+def not_modified(etag: str, **headers) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag, **headers})
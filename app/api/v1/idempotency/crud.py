@@ -0,0 +1,66 @@
+import datetime
+import logging
+import uuid
+from typing import Optional
+
+from sqlalchemy import delete, func, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from app.database.models import IdempotencyKey
+
+
+def claim_idempotency_key(
+        key: str, request: str, owner: uuid.UUID, lease: float, db: Session) -> Optional[IdempotencyKey]:
+    """Claims the key for a request of owner, for lease seconds.
+
+    Returns None if owner now owns the key and has to run the request. Otherwise returns the stored key, which
+    either holds the response of the first request or is still in progress. An expired key is taken over, after
+    which the previous owner can no longer store its response.
+    """
+    statement = insert(IdempotencyKey).values(
+        key=key, request=request, owner=owner, expires_at=func.now() + datetime.timedelta(seconds=lease))
+    statement = statement.on_conflict_do_update(
+        index_elements=[IdempotencyKey.key],
+        set_={
+            'request': statement.excluded.request,
+            'owner': statement.excluded.owner,
+            'status_code': None,
+            'headers': None,
+            'body': None,
+            'expires_at': statement.excluded.expires_at,
+        },
+        where=IdempotencyKey.expires_at < func.now(),
+    ).returning(IdempotencyKey.key)
+    claimed = db.execute(statement).first() is not None
+    db.commit()
+    if claimed:
+        return None
+    return db.get(IdempotencyKey, key, populate_existing=True)
+
+
+def store_idempotent_response(
+        key: str, owner: uuid.UUID, status_code: int, headers: dict, body: bytes, ttl: float, db: Session) -> bool:
+    """Stores the response of the request of owner. Returns False if the key was taken over meanwhile."""
+    result = db.execute(
+        update(IdempotencyKey)
+        .where(IdempotencyKey.key == key, IdempotencyKey.owner == owner, IdempotencyKey.status_code.is_(None))
+        .values(status_code=status_code, headers=headers, body=body,
+                expires_at=func.now() + datetime.timedelta(seconds=ttl)))
+    db.commit()
+    return result.rowcount > 0
+
+
+def release_idempotency_key(key: str, owner: uuid.UUID, db: Session):
+    # Only a key of owner without response can be released, so a retry runs the request again
+    db.execute(delete(IdempotencyKey).where(
+        IdempotencyKey.key == key, IdempotencyKey.owner == owner, IdempotencyKey.status_code.is_(None)))
+    db.commit()
+
+
+def delete_expired_idempotency_keys(db: Session):
+    result = db.execute(delete(IdempotencyKey).where(IdempotencyKey.expires_at < func.now()))
+    db.commit()
+    if result.rowcount:
+        logging.info('Deleted {} expired idempotency keys'.format(result.rowcount))
+    return result.rowcount
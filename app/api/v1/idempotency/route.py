@@ -0,0 +1,123 @@
+import hashlib
+import json
+import logging
+import os
+import time
+import uuid
+from typing import Callable
+
+from fastapi import Request, Response
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute
+from sqlalchemy.orm import Session
+
+import app.api.v1.idempotency.crud as idempotency_crud
+from app.database.connection import DATABASE_POOL_TIMEOUT
+from app.database.session import run_with_session
+
+IDEMPOTENCY_KEY_HEADER = 'Idempotency-Key'
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+# How long a stored response is replayed
+IDEMPOTENCY_KEY_TTL = float(os.getenv('IDEMPOTENCY_KEY_TTL', '86400'))
+# How long a request in progress holds its key. Retries meanwhile get a 409; if the request never finishes
+# (e.g. the server was stopped), a retry takes the key over afterwards. The lease covers waiting for a pooled
+# connection plus IDEMPOTENCY_KEY_REQUEST_TIME for the request itself; a request that still takes longer loses
+# its key and its response is not stored
+IDEMPOTENCY_KEY_REQUEST_TIME = 60
+IDEMPOTENCY_KEY_LEASE = float(
+    os.getenv('IDEMPOTENCY_KEY_LEASE', str(DATABASE_POOL_TIMEOUT + IDEMPOTENCY_KEY_REQUEST_TIME)))
+IDEMPOTENCY_KEY_CLEANUP_INTERVAL = 60
+# Seconds a retry of a request in progress is asked to wait
+IDEMPOTENCY_KEY_RETRY_AFTER = 1
+
+# Headers of the stored response that are replayed, the others are derived from the body
+REPLAYED_HEADERS = ('content-type', 'location')
+
+_last_cleanup = 0.0
+
+
+def _client_of(request: Request, body: bytes) -> str:
+    # There is no authentication, so the client is the user the request acts for: the user_id of the body, or the
+    # order in the path, which belongs to one user
+    try:
+        user_id = json.loads(body).get('user_id')
+    except (ValueError, AttributeError):
+        user_id = None
+    if isinstance(user_id, str):
+        return 'user:{}'.format(user_id)
+    return 'path:{}'.format(request.url.path)
+
+
+def _fingerprint(request: Request, body: bytes) -> str:
+    # The query string is part of the request, e.g. copy_order_id of POST /v1/order
+    return '{} {}?{} {}'.format(
+        request.method, request.url.path, request.url.query, hashlib.sha256(body).hexdigest())
+
+
+def _claim(key: str, request: str, owner: uuid.UUID, db: Session):
+    global _last_cleanup
+    if time.monotonic() - _last_cleanup > IDEMPOTENCY_KEY_CLEANUP_INTERVAL:
+        _last_cleanup = time.monotonic()
+        idempotency_crud.delete_expired_idempotency_keys(db)
+    return idempotency_crud.claim_idempotency_key(key, request, owner, IDEMPOTENCY_KEY_LEASE, db)
+
+
+def _store(key: str, owner: uuid.UUID, response: Response, db: Session):
+    headers = {name: value for name, value in response.headers.items() if name in REPLAYED_HEADERS}
+    if not idempotency_crud.store_idempotent_response(
+            key, owner, response.status_code, headers, bytes(response.body), IDEMPOTENCY_KEY_TTL, db):
+        logging.warning('The lease of {} expired before its response was stored'.format(key))
+
+
+class IdempotentRoute(APIRoute):
+    """Route whose POST requests may carry an Idempotency-Key header.
+
+    Keys are scoped per client. The first request with a key runs and its response is stored. Retries with the same
+    key and the same method, path, query and body get the stored response instead of running the request again; a
+    key reused for a different request is rejected with 422, and a retry arriving while the first request is still
+    running gets a 409 with Retry-After instead of waiting for it. Error responses are not stored (the endpoints
+    roll back on errors), so a retry after an error runs again.
+    """
+
+    def get_route_handler(self) -> Callable:
+        route_handler = super().get_route_handler()
+
+        async def idempotent_route_handler(request: Request) -> Response:
+            key = request.headers.get(IDEMPOTENCY_KEY_HEADER)
+            if request.method != 'POST' or key is None:
+                return await route_handler(request)
+            if not key or len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+                return JSONResponse(status_code=422, content={
+                    'detail': '{} must have 1 to {} characters'.format(
+                        IDEMPOTENCY_KEY_HEADER, IDEMPOTENCY_KEY_MAX_LENGTH)})
+
+            # The body is cached on the request, the route handler reads it again
+            body = await request.body()
+            key = '{} {}'.format(_client_of(request, body), key)
+            fingerprint = _fingerprint(request, body)
+            owner = uuid.uuid4()
+            stored = await run_with_session(_claim, key, fingerprint, owner)
+            if stored is not None:
+                if stored.request != fingerprint:
+                    return JSONResponse(status_code=422, content={
+                        'detail': '{} was already used for another request'.format(IDEMPOTENCY_KEY_HEADER)})
+                if stored.status_code is None:
+                    return JSONResponse(
+                        status_code=409, headers={'Retry-After': str(IDEMPOTENCY_KEY_RETRY_AFTER)}, content={
+                            'detail': 'A request with this {} is still in progress'.format(IDEMPOTENCY_KEY_HEADER)})
+                logging.info('Replaying the response of {} {} for {}'.format(request.method, request.url.path, key))
+                headers = dict(stored.headers or {}, **{'Idempotent-Replayed': 'true'})
+                return Response(content=stored.body, status_code=stored.status_code, headers=headers)
+
+            try:
+                response = await route_handler(request)
+            except BaseException:
+                await run_with_session(idempotency_crud.release_idempotency_key, key, owner)
+                raise
+            if response.status_code < 400 and hasattr(response, 'body'):
+                await run_with_session(_store, key, owner, response)
+            else:
+                await run_with_session(idempotency_crud.release_idempotency_key, key, owner)
+            return response
+
+        return idempotent_route_handler
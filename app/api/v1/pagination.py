@@ -0,0 +1,72 @@
+import base64
+import binascii
+import bisect
+import json
+import os
+from typing import Callable, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException, Query, Request, Response, status
+from sqlalchemy import Select, literal, tuple_
+
+# Page size of the list endpoints if the request doesn't give a limit, and the largest limit accepted
+DEFAULT_PAGE_SIZE = int(os.getenv('DEFAULT_PAGE_SIZE', '100'))
+MAX_PAGE_SIZE = int(os.getenv('MAX_PAGE_SIZE', '1000'))
+
+NEXT_CURSOR_HEADER = 'X-Next-Cursor'
+
+
+class PageParams:
+    """Query parameters of a list endpoint: the opaque cursor of the X-Next-Cursor header and the page size."""
+
+    def __init__(
+            self,
+            cursor: Optional[str] = Query(default=None, description='X-Next-Cursor of the previous page'),
+            limit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    ):
+        self.cursor = cursor
+        self.limit = limit
+
+    def after(self, *parsers: Callable[[str], object]) -> Optional[Tuple]:
+        """Key of the last item of the previous page, parsed by one parser per key column. None on the first page."""
+        if self.cursor is None:
+            return None
+        try:
+            values = json.loads(base64.urlsafe_b64decode(self.cursor.encode()))
+            if not isinstance(values, list) or len(values) != len(parsers):
+                raise ValueError(values)
+            return tuple(parse(value) for parse, value in zip(parsers, values))
+        except (binascii.Error, UnicodeDecodeError, TypeError, ValueError):
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail='Invalid cursor')
+
+
+def encode_cursor(*values) -> str:
+    return base64.urlsafe_b64encode(json.dumps([str(value) for value in values]).encode()).decode()
+
+
+def keyset(statement: Select, keys: Sequence, after: Optional[Tuple], limit: Optional[int]) -> Select:
+    """statement ordered by the key columns, starting after the given key.
+
+    Selects one row more than limit, which tells whether there is a next page. Without a limit all rows are selected.
+    """
+    if after is not None:
+        statement = statement.where(
+            tuple_(*keys) > tuple_(*(literal(value, key.type) for key, value in zip(keys, after))))
+    statement = statement.order_by(*keys)
+    return statement if limit is None else statement.limit(limit + 1)
+
+
+def page_of_list(entities: List, after: Optional[Tuple], limit: int) -> List:
+    """Page of a list sorted by id, like keyset does in SQL."""
+    start = 0 if after is None else bisect.bisect_right(entities, after[0], key=lambda entity: entity.id)
+    return entities[start:start + limit + 1]
+
+
+def paginate(request: Request, response: Response, rows: List, limit: int, key: Callable[[object], Tuple]) -> List:
+    """The first limit of rows (from keyset or page_of_list). Sets the cursor of the next page if there is one."""
+    if len(rows) <= limit:
+        return rows
+    rows = rows[:limit]
+    cursor = encode_cursor(*key(rows[-1]))
+    response.headers[NEXT_CURSOR_HEADER] = cursor
+    response.headers['Link'] = '<{}>; rel="next"'.format(request.url.include_query_params(cursor=cursor))
+    return rows
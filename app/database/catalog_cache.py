@@ -0,0 +1,172 @@
+import hashlib
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, TypeVar
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.database.connection import SessionLocal, get_primary_engine
+
+# Seconds a cached catalog list is served without an invalidation, 0 disables the cache. Bounds the staleness of
+# writes this process doesn't see: other workers and writes outside the crud modules
+CATALOG_CACHE_TTL = float(os.getenv('CATALOG_CACHE_TTL', '60'))
+
+T = TypeVar('T')
+
+
+def _etag_of(content) -> str:
+    return '"{}"'.format(hashlib.sha1(repr(content).encode()).hexdigest())
+
+
+class CatalogList(list):
+    """Catalog list with the ETag of its content, computed once when the list is loaded."""
+
+    def __init__(self, entities: List, etag: Optional[str] = None):
+        super().__init__(entities)
+        self.etag = etag or _etag_of(entities)
+
+
+class CatalogMap(dict):
+    """Catalog map with the ETag of its content, computed once when the map is loaded."""
+
+    def __init__(self, items: Dict):
+        super().__init__(items)
+        self.etag = _etag_of(sorted(items.items()))
+
+
+class CatalogCache:
+    """In-process cache of the catalog lists, one versioned entry per entity type, and of snapshots built from several.
+
+    Writes bump the version of their entity type when they commit. An entry is only served while the versions of
+    the entity types it was built from are current and its TTL has not run out, and an entry loaded while a write
+    committed is stored under the versions it was loaded with, so it is never served after the bump. Concurrent
+    misses of the same entry load it once (on the event loop of DATABASE_ASYNC they don't wait and load it
+    themselves), from the primary: a replica that lags behind a bump would otherwise fill the new version with the
+    old rows for a whole TTL.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._versions: Dict[str, int] = {}
+        # Entry -> entity types it is built from, if not only its own
+        self._sources: Dict[str, Tuple[str, ...]] = {}
+        # Entry -> (version, expiry, value)
+        self._entries: Dict[str, Tuple[int, float, object]] = {}
+        self._load_locks: Dict[str, threading.Lock] = {}
+        self._hits: Dict[str, int] = {}
+        self._misses: Dict[str, int] = {}
+
+    def get(self, model, load: Callable[[Session], List], db: Session) -> CatalogList:
+        """The cached list of model, load(session) on a miss."""
+        return self._get(model.__tablename__, (model.__tablename__,), lambda session: CatalogList(load(session)), db)
+
+    def get_map(self, name: str, load: Callable[[Session], Dict], db: Session) -> CatalogMap:
+        """The cached map name, load(session) on a miss. It has a version of its own, bumped by
+        invalidate_on_commit(db, name), so it can change often without invalidating the lists it is merged into."""
+        return self._get(name, (name,), lambda session: CatalogMap(load(session)), db)
+
+    def get_snapshot(self, name: str, models: Sequence, build: Callable[[Session], T], db: Session) -> T:
+        """The cached result of build(session), which reads the given entity types or maps. Writes to them invalidate
+        it."""
+        return self._get(name, tuple(getattr(model, '__tablename__', model) for model in models), build, db)
+
+    def _version(self, sources: Tuple[str, ...]) -> int:
+        # Versions only grow, so their sum changes with every bump of any of them
+        return sum(self._versions.get(source, 0) for source in sources)
+
+    def _cached(self, name: str, version: int):
+        entry = self._entries.get(name)
+        if entry is not None and entry[0] == version and entry[1] > time.monotonic():
+            return entry
+        return None
+
+    def _get(self, name: str, sources: Tuple[str, ...], load: Callable[[Session], T], db: Session) -> T:
+        with self._lock:
+            if sources != (name,):
+                self._sources[name] = sources
+            entry = self._cached(name, self._version(sources))
+            if entry is not None:
+                self._hits[name] = self._hits.get(name, 0) + 1
+                return entry[2]
+            self._misses[name] = self._misses.get(name, 0) + 1
+            load_lock = self._load_locks.setdefault(name, threading.Lock())
+
+        if self.ttl <= 0:
+            return load(db)
+        # With DATABASE_ASYNC the holder of the lock loads on the same event loop, waiting for it would block the loop
+        if not load_lock.acquire(blocking=not db.get_bind().dialect.is_async):
+            with primary_session(db) as primary:
+                return load(primary)
+        try:
+            with self._lock:
+                version = self._version(sources)
+                entry = self._cached(name, version)
+            if entry is not None:
+                return entry[2]
+            with primary_session(db) as primary:
+                value = load(primary)
+            with self._lock:
+                if self._version(sources) == version:
+                    self._entries[name] = (version, time.monotonic() + self.ttl, value)
+            return value
+        finally:
+            load_lock.release()
+
+    def invalidate(self, *names: str):
+        with self._lock:
+            for name in names:
+                self._versions[name] = self._versions.get(name, 0) + 1
+                self._entries.pop(name, None)
+
+    def get_statistics(self):
+        with self._lock:
+            return [
+                {
+                    'entity_type': name,
+                    'version': self._version(self._sources.get(name, (name,))),
+                    'cached': self._cached(name, self._version(self._sources.get(name, (name,)))) is not None,
+                    'hits': self._hits.get(name, 0),
+                    'misses': self._misses.get(name, 0),
+                }
+                for name in sorted(set(self._versions) | set(self._hits) | set(self._misses))
+            ]
+
+
+catalog_cache = CatalogCache(CATALOG_CACHE_TTL)
+
+
+@contextmanager
+def primary_session(db: Session):
+    """db if it uses the primary, otherwise a read-only session on the primary that is closed afterwards."""
+    primary_engine = get_primary_engine(db)
+    if db.get_bind() is primary_engine:
+        yield db
+        return
+    primary = SessionLocal(bind=primary_engine)
+    primary.info['read_only'] = True
+    try:
+        yield primary
+    finally:
+        primary.close()
+
+
+def invalidate_on_commit(db: Session, *models):
+    """Bumps the cache version of the given entity types, or maps by name, when the transaction of db commits."""
+    db.info.setdefault('catalog_invalidations', set()).update(
+        getattr(model, '__tablename__', model) for model in models)
+
+
+@event.listens_for(SessionLocal, 'after_commit')
+def _invalidate_after_commit(session):
+    names = session.info.pop('catalog_invalidations', None)
+    if names:
+        catalog_cache.invalidate(*names)
+
+
+@event.listens_for(SessionLocal, 'after_rollback')
+def _discard_after_rollback(session):
+    session.info.pop('catalog_invalidations', None)
@@ -1,13 +1,157 @@
 import os
+import threading
 
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
+from sqlalchemy.sql.lambdas import StatementLambdaElement
+from sqlalchemy.orm import ORMExecuteState, Session, raiseload, sessionmaker
 
-DATABASE_URL = 'postgresql://' \
-               + os.environ['DATABASE_USERNAME'] + ':' \
-               + os.environ['DATABASE_PASSWORD'] + '@' \
-               + os.environ['DATABASE_HOST'] + '/' \
-               + os.environ['DATABASE_NAME']
-db_engine = create_engine(DATABASE_URL)
+from app.database.pool_statistics import InstrumentedAsyncQueuePool, InstrumentedQueuePool
+from app.database.replicas import ReplicaRouter
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=db_engine)
+# Pool settings, see doc/database/README.md for sizing them against the worker threadpool
+DATABASE_POOL_SIZE = int(os.getenv('DATABASE_POOL_SIZE', '5'))
+DATABASE_POOL_MAX_OVERFLOW = int(os.getenv('DATABASE_POOL_MAX_OVERFLOW', '10'))
+DATABASE_POOL_TIMEOUT = float(os.getenv('DATABASE_POOL_TIMEOUT', '30'))
+DATABASE_POOL_RECYCLE = int(os.getenv('DATABASE_POOL_RECYCLE', '1800'))
+DATABASE_POOL_PRE_PING = os.getenv('DATABASE_POOL_PRE_PING', 'true').lower() in ('1', 'true', 'yes')
+
+# Comma separated hosts (host or host:port) of read replicas, same credentials and database name as the primary
+DATABASE_REPLICA_HOSTS = [host.strip() for host in os.getenv('DATABASE_REPLICA_HOSTS', '').split(',') if host.strip()]
+DATABASE_REPLICA_MAX_STALENESS = float(os.getenv('DATABASE_REPLICA_MAX_STALENESS', '5'))
+DATABASE_REPLICA_LAG_CHECK_INTERVAL = float(os.getenv('DATABASE_REPLICA_LAG_CHECK_INTERVAL', '1'))
+
+# Run the endpoints on the event loop with asyncpg instead of on the worker threadpool with psycopg2
+DATABASE_ASYNC = os.getenv('DATABASE_ASYNC', 'false').lower() in ('1', 'true', 'yes')
+
+# Development and test setting: relationships that queries don't load explicitly raise instead of lazy loading
+DATABASE_RAISE_ON_LAZY_LOAD = os.getenv('DATABASE_RAISE_ON_LAZY_LOAD', 'false').lower() in ('1', 'true', 'yes')
+
+_engine_lock = threading.Lock()
+_db_engine = None
+_async_engine = None
+_replica_router = None
+# Sync replica engine -> async engine of the same replica
+_async_replica_engines = {}
+
+
+def get_database_url(host: str):
+    return 'postgresql://' \
+        + os.environ['DATABASE_USERNAME'] + ':' \
+        + os.environ['DATABASE_PASSWORD'] + '@' \
+        + host + '/' \
+        + os.environ['DATABASE_NAME']
+
+
+def _pool_options():
+    return {
+        'pool_size': DATABASE_POOL_SIZE,
+        'max_overflow': DATABASE_POOL_MAX_OVERFLOW,
+        'pool_timeout': DATABASE_POOL_TIMEOUT,
+        'pool_recycle': DATABASE_POOL_RECYCLE,
+        'pool_pre_ping': DATABASE_POOL_PRE_PING,
+    }
+
+
+def create_pooled_engine(url: str):
+    return create_engine(url, poolclass=InstrumentedQueuePool, **_pool_options())
+
+
+def create_async_pooled_engine(url: str) -> AsyncEngine:
+    return create_async_engine(
+        url.replace('postgresql://', 'postgresql+asyncpg://', 1), poolclass=InstrumentedAsyncQueuePool,
+        **_pool_options())
+
+
+def get_engine() -> Engine:
+    """Engine of the primary database, created on first use (or by the startup hook of the app)."""
+    global _db_engine
+    if _db_engine is None:
+        with _engine_lock:
+            if _db_engine is None:
+                _db_engine = create_pooled_engine(get_database_url(os.environ['DATABASE_HOST']))
+    return _db_engine
+
+
+def get_async_engine() -> AsyncEngine:
+    """Async engine of the primary database for DATABASE_ASYNC, created on first use."""
+    global _async_engine
+    if _async_engine is None:
+        with _engine_lock:
+            if _async_engine is None:
+                _async_engine = create_async_pooled_engine(get_database_url(os.environ['DATABASE_HOST']))
+    return _async_engine
+
+
+def get_async_replica_engine(engine: Engine) -> AsyncEngine:
+    """Async engine of the replica of a sync engine chosen by the replica router."""
+    if engine not in _async_replica_engines:
+        with _engine_lock:
+            if engine not in _async_replica_engines:
+                _async_replica_engines[engine] = create_async_pooled_engine(str(engine.url))
+    return _async_replica_engines[engine]
+
+
+def get_primary_engine(db: Session) -> Engine:
+    """Primary engine of the mode db runs in: the sync engine, or the sync facade of the async engine."""
+    if db.bind is not None and db.bind.dialect.is_async:
+        return get_async_engine().sync_engine
+    return get_engine()
+
+
+def get_replica_router() -> ReplicaRouter:
+    global _replica_router
+    if _replica_router is None:
+        with _engine_lock:
+            if _replica_router is None:
+                _replica_router = ReplicaRouter(
+                    {host: create_pooled_engine(get_database_url(host)) for host in DATABASE_REPLICA_HOSTS},
+                    lag_check_interval=DATABASE_REPLICA_LAG_CHECK_INTERVAL,
+                )
+    return _replica_router
+
+
+class DatabaseSession(Session):
+    """Session that binds to the primary engine when it is first used and no other bind was given."""
+
+    def get_bind(self, *args, **kwargs):
+        if self.bind is None:
+            self.bind = get_engine()
+        return super().get_bind(*args, **kwargs)
+
+
+SessionLocal = sessionmaker(class_=DatabaseSession, autocommit=False, autoflush=False)
+# Sessions of DATABASE_ASYNC. The AsyncSession wraps a session of the class of SessionLocal, so the listeners of
+# SessionLocal below and in the other modules fire for it as well
+AsyncSessionLocal = async_sessionmaker(sync_session_class=SessionLocal.class_, autoflush=False)
+
+
+@event.listens_for(SessionLocal, 'do_orm_execute')
+def _raise_on_lazy_load(orm_execute_state: ORMExecuteState):
+    # Loader options of a query win over the wildcard, so only unplanned loads that would emit SQL raise.
+    # Relationship and column loads of already loaded objects are the lazy loads themselves
+    if DATABASE_RAISE_ON_LAZY_LOAD and orm_execute_state.is_select \
+            and not orm_execute_state.is_relationship_load and not orm_execute_state.is_column_load:
+        statement = orm_execute_state.statement
+        if isinstance(statement, StatementLambdaElement):
+            # Options on the resolved statement would drop the bound values of the lambda, extend the lambda instead
+            orm_execute_state.statement = statement + (lambda s: s.options(raiseload('*', sql_only=True)))
+        else:
+            orm_execute_state.statement = statement.options(raiseload('*', sql_only=True))
+
+
+def get_pool_statistics():
+    return (get_async_engine() if DATABASE_ASYNC else get_engine()).pool.get_statistics()
+
+
+def get_replica_statistics():
+    replica_router = get_replica_router()
+    return [
+        {
+            'host': host,
+            'replication_lag': replica_router.get_replication_lag(engine),
+            'pool': (get_async_replica_engine(engine) if DATABASE_ASYNC else engine).pool.get_statistics(),
+        }
+        for host, engine in replica_router.engines.items()
+    ]
@@ -0,0 +1,29 @@
+"""order_status_expired
+
+Revision ID: f3a9c1d7e254
+Revises: b6e1f4a8c027
+Create Date: 2026-10-19 00:31:12.640357
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3a9c1d7e254'
+down_revision = 'b6e1f4a8c027'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("ALTER TYPE orderstatus ADD VALUE IF NOT EXISTS 'EXPIRED'")
+
+
+def downgrade():
+    # Postgres can't drop an enum value; expired orders go back to TRANSMITTED without reservation
+    op.execute("UPDATE customer_order SET order_status = 'TRANSMITTED' WHERE order_status = 'EXPIRED'")
+    op.execute("ALTER TYPE orderstatus RENAME TO orderstatus_old")
+    op.execute("CREATE TYPE orderstatus AS ENUM ('TRANSMITTED', 'PREPARING', 'IN_DELIVERY', 'COMPLETED')")
+    op.execute("ALTER TABLE customer_order ALTER COLUMN order_status TYPE orderstatus "
+               "USING order_status::text::orderstatus")
+    op.execute("DROP TYPE orderstatus_old")
@@ -4,9 +4,12 @@ import enum
 import uuid
 from typing import List
 
-from sqlalchemy import CheckConstraint, ForeignKey, Integer, Numeric, DateTime, Text
-from sqlalchemy.orm import relationship, mapped_column, Mapped, DeclarativeBase
-from sqlalchemy.sql import func
+from sqlalchemy import BigInteger, CheckConstraint, ForeignKey, Index, Integer, JSON, LargeBinary, Numeric, DateTime, \
+    Text
+from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.orm import relationship, mapped_column, Mapped, DeclarativeBase, object_session
+from sqlalchemy.orm.attributes import flag_modified
+from sqlalchemy.sql import func, select
 
 PIZZA_TYPE_ID = 'pizza_type.id'
 
@@ -24,6 +27,8 @@ class OrderStatus(str, enum.Enum):
     PREPARING = 'PREPARING'
     IN_DELIVERY = 'IN_DELIVERY'
     COMPLETED = 'COMPLETED'
+    # TRANSMITTED order whose reservation expired, its stock is back in stock
+    EXPIRED = 'EXPIRED'
 
 
 class SpiceLevel(str, enum.Enum):
@@ -32,6 +37,51 @@ class SpiceLevel(str, enum.Enum):
     HOT = 'HOT'
 
 
+class StockMovementReason(str, enum.Enum):
+    # Taken from stock for an order
+    RESERVE = 'RESERVE'
+    # Put back to stock from an order
+    RELEASE = 'RELEASE'
+    # Stock set when creating or updating the item
+    RESTOCK = 'RESTOCK'
+
+
+class ShardedStockMixin:
+    """Stock of a hot item that can be split across the rows of stock_shard, see stock_logic/stock_shard_crud.py.
+
+    stock is the total: the stock column of the item (own_stock) plus the stock of its shards. Orders take from the
+    shards of a sharded item, stock put back or set lands in own_stock until the rebalancer spreads it.
+    """
+    own_stock: Mapped[int] = mapped_column(
+        'stock', CheckConstraint(STOCK_NON_NEGATIVE_CONSTRAINT), key='stock', nullable=False)
+    # Number of shards, 1 for items that are not sharded
+    stock_shards: Mapped[int] = mapped_column(nullable=False, default=1, server_default='1')
+
+    @hybrid_property
+    def stock(self) -> int:
+        if not self.stock_shards or self.stock_shards <= 1 or object_session(self) is None:
+            return self.own_stock
+        return self.own_stock + object_session(self).scalar(
+            select(func.coalesce(func.sum(StockShard.stock), 0))
+            .where(StockShard.item_type == self.__tablename__, StockShard.item_id == self.id))
+
+    @stock.inplace.setter
+    def _stock_setter(self, stock: int):
+        self.own_stock = stock
+        if self.stock_shards and self.stock_shards > 1:
+            # The stock of the shards is replaced on flush, even if own_stock keeps its value
+            flag_modified(self, 'own_stock')
+
+    @stock.inplace.expression
+    @classmethod
+    def _stock_expression(cls):
+        return cls.own_stock + func.coalesce(
+            select(func.sum(StockShard.stock))
+            .where(StockShard.item_type == cls.__tablename__, StockShard.item_id == cls.id)
+            .correlate_except(StockShard)
+            .scalar_subquery(), 0)
+
+
 # models
 class PizzaType(Base):
     __tablename__ = 'pizza_type'
@@ -51,6 +101,8 @@ class PizzaType(Base):
     toppings: Mapped[List['PizzaTypeToppingQuantity']] = relationship(
         cascade=CASCADE_ALL_DELETE_ORPHAN, back_populates='pizza_type')
     type: Mapped[str] = mapped_column(nullable=True)
+    # How many pizzas of this type the stock of dough and toppings suffices for, kept up to date on every stock change
+    max_makeable: Mapped[int] = mapped_column(nullable=False, default=0, server_default='0')
 
     __mapper_args__ = {
         'polymorphic_identity': 'PizzaType',
@@ -89,28 +141,26 @@ class PizzaTypeSauce(Base):
             % (self.pizza_type_id, self.sauce_id)
 
 
-class Topping(Base):
+class Topping(ShardedStockMixin, Base):
     __tablename__ = 'topping'
 
     id: Mapped[uuid.UUID] = mapped_column(primary_key=True, default=uuid.uuid4)
     name: Mapped[str] = mapped_column(unique=True, nullable=False)
     price: Mapped[decimal.Decimal] = mapped_column(Numeric(10, 2), nullable=False)
     description: Mapped[str] = mapped_column(nullable=False, default='')
-    stock: Mapped[int] = mapped_column(CheckConstraint(STOCK_NON_NEGATIVE_CONSTRAINT), nullable=False)
 
     def __repr__(self):
         return "Topping(id='%s', name='%s', price='%s', description='%s', stock='%s')" \
             % (self.id, self.name, self.price, self.description, self.stock)
 
 
-class Dough(Base):
+class Dough(ShardedStockMixin, Base):
     __tablename__ = 'dough'
 
     id: Mapped[uuid.UUID] = mapped_column(primary_key=True, default=uuid.uuid4)
     name: Mapped[str] = mapped_column(unique=True, nullable=False)
     price: Mapped[decimal.Decimal] = mapped_column(Numeric(10, 2), nullable=False)
     description: Mapped[str] = mapped_column(nullable=False, default='')
-    stock: Mapped[int] = mapped_column(CheckConstraint(STOCK_NON_NEGATIVE_CONSTRAINT), nullable=False)
 
     def __repr__(self):
         return "Dough(id='%s', name='%s', price='%s', description='%s', stock='%s')" \
@@ -149,7 +199,7 @@ class Order(Base):
 
     id: Mapped[uuid.UUID] = mapped_column(primary_key=True, default=uuid.uuid4)
     order_datetime: Mapped[datetime.datetime] = mapped_column(DateTime(timezone=True), default=func.now(),
-                                                              nullable=True)
+                                                              nullable=False)
     beverages: Mapped[List['OrderBeverageQuantity']] = relationship(cascade=CASCADE_ALL_DELETE_ORPHAN,
                                                                     backref='customer_order')
     address_id: Mapped[uuid.UUID] = mapped_column(ForeignKey('address.id'), unique=True, nullable=False)
@@ -158,6 +208,23 @@ class Order(Base):
     user: Mapped['User'] = relationship(back_populates='customer_orders')
     user_id: Mapped[uuid.UUID] = mapped_column(ForeignKey('user.id'), nullable=False)
     order_status: Mapped[OrderStatus] = mapped_column(default=OrderStatus.TRANSMITTED, nullable=False)
+    # Maintained with every change of the pizzas and beverages of the order, see order/crud.py
+    total_price: Mapped[decimal.Decimal] = mapped_column(Numeric(10, 2), nullable=False, default=0, server_default='0')
+    pizza_count: Mapped[int] = mapped_column(nullable=False, default=0, server_default='0')
+    # Sum of the quantities of the beverages
+    beverage_count: Mapped[int] = mapped_column(nullable=False, default=0, server_default='0')
+    # Stock of a TRANSMITTED order is released when its reservation expires, NULL never expires
+    reserved_until: Mapped[datetime.datetime] = mapped_column(DateTime(timezone=True), nullable=True)
+    # Set by every UPDATE of the row, also the set-based ones, and so by every change of its items. Source of the ETag
+    updated_at: Mapped[datetime.datetime] = mapped_column(DateTime(timezone=True), nullable=False,
+                                                          server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        Index('ix_customer_order_reserved_until', 'reserved_until', postgresql_where=reserved_until.isnot(None)),
+        # Keyset pagination of the order list, with and without status filter
+        Index('ix_customer_order_order_datetime_id', 'order_datetime', 'id'),
+        Index('ix_customer_order_order_status_order_datetime_id', 'order_status', 'order_datetime', 'id'),
+    )
 
     def __repr__(self):
         return "Order(id='%s', order_datetime='%s' beverages='%s', pizzas='%s', user='%s', \
@@ -172,10 +239,12 @@ class Pizza(Base):
     pizza_type_id: Mapped[uuid.UUID] = mapped_column(ForeignKey(PIZZA_TYPE_ID), nullable=False)
     pizza_type: Mapped['PizzaType'] = relationship()
     order_id: Mapped[uuid.UUID] = mapped_column(ForeignKey('customer_order.id'), nullable=True)
+    # Price of the pizza type when the pizza was ordered
+    unit_price: Mapped[decimal.Decimal] = mapped_column(Numeric(10, 2), nullable=False)
 
     def __repr__(self):
-        return "Pizza(id='%s', pizza_type_id='%s', order_id='%s')" \
-            % (self.id, self.pizza_type_id, self.order_id)
+        return "Pizza(id='%s', pizza_type_id='%s', order_id='%s', unit_price='%s')" \
+            % (self.id, self.pizza_type_id, self.order_id, self.unit_price)
 
 
 class Beverage(Base):
@@ -199,10 +268,12 @@ class OrderBeverageQuantity(Base):
     beverage_id: Mapped[uuid.UUID] = mapped_column(ForeignKey('beverage.id'), primary_key=True)
     beverage: Mapped['Beverage'] = relationship()
     quantity: Mapped[int] = mapped_column(CheckConstraint('quantity > 0'), nullable=False)
+    # Price of one beverage when it was added to the order
+    unit_price: Mapped[decimal.Decimal] = mapped_column(Numeric(10, 2), nullable=False)
 
     def __repr__(self):
-        return "OrderBeverageQuantity(order_id='%s', beverage_id='%s', quantity='%s')" \
-            % (self.order_id, self.beverage_id, self.quantity)
+        return "OrderBeverageQuantity(order_id='%s', beverage_id='%s', quantity='%s', unit_price='%s')" \
+            % (self.order_id, self.beverage_id, self.quantity, self.unit_price)
 
 
 class Address(Base):
@@ -225,3 +296,81 @@ class Address(Base):
                " first_name='%s', last_name='%s')" \
             % (self.id, self.post_code, self.street, self.country, self.house_number,
                self.town, self.first_name, self.last_name)
+
+
+class IdempotencyKey(Base):
+    __tablename__ = 'idempotency_key'
+
+    # Client and Idempotency-Key header
+    key: Mapped[str] = mapped_column(primary_key=True)
+    # Method, path, query and body digest of the request the key was first used for
+    request: Mapped[str] = mapped_column(nullable=False)
+    # Token of the request that claimed the key; only that request may store its response
+    owner: Mapped[uuid.UUID] = mapped_column(nullable=False)
+    # Stored response, empty while the request is in progress
+    status_code: Mapped[int] = mapped_column(nullable=True)
+    headers: Mapped[dict] = mapped_column(JSON, nullable=True)
+    body: Mapped[bytes] = mapped_column(LargeBinary, nullable=True)
+    expires_at: Mapped[datetime.datetime] = mapped_column(DateTime(timezone=True), nullable=False, index=True)
+
+    def __repr__(self):
+        return "IdempotencyKey(key='%s', request='%s', status_code='%s', expires_at='%s')" \
+            % (self.key, self.request, self.status_code, self.expires_at)
+
+
+class StockMovement(Base):
+    __tablename__ = 'stock_movement'
+
+    # Ascending in insert order; movements may commit out of this order
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=True)
+    # Table of the item (dough, topping, sauce or beverage), no foreign key so the movements outlive the item
+    item_type: Mapped[str] = mapped_column(nullable=False)
+    item_id: Mapped[uuid.UUID] = mapped_column(nullable=False)
+    change: Mapped[int] = mapped_column(nullable=False)
+    # Stock right after the movement of the row that changed: the item, or the shard of a sharded item
+    stock_after: Mapped[int] = mapped_column(nullable=False)
+    reason: Mapped[StockMovementReason] = mapped_column(nullable=False)
+    order_id: Mapped[uuid.UUID] = mapped_column(nullable=True)
+    created_at: Mapped[datetime.datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(),
+                                                          nullable=False)
+    # Set once the change is folded into the snapshot of the item, the movement itself is kept
+    compacted: Mapped[bool] = mapped_column(nullable=False, server_default='false')
+
+    __table_args__ = (
+        Index('ix_stock_movement_item', 'item_type', 'item_id', 'id'),
+        Index('ix_stock_movement_pending', 'item_type', 'item_id', postgresql_where=compacted.is_(False)),
+    )
+
+    def __repr__(self):
+        return "StockMovement(id='%s', item_type='%s', item_id='%s', change='%s', stock_after='%s', reason='%s', " \
+               "order_id='%s')" \
+            % (self.id, self.item_type, self.item_id, self.change, self.stock_after, self.reason, self.order_id)
+
+
+class StockSnapshot(Base):
+    __tablename__ = 'stock_snapshot'
+
+    item_type: Mapped[str] = mapped_column(primary_key=True)
+    item_id: Mapped[uuid.UUID] = mapped_column(primary_key=True)
+    # Sum of all compacted movements of the item, last_movement_id is the largest of them
+    stock: Mapped[int] = mapped_column(nullable=False)
+    last_movement_id: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    created_at: Mapped[datetime.datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+
+    def __repr__(self):
+        return "StockSnapshot(item_type='%s', item_id='%s', stock='%s', last_movement_id='%s')" \
+            % (self.item_type, self.item_id, self.stock, self.last_movement_id)
+
+
+class StockShard(Base):
+    __tablename__ = 'stock_shard'
+
+    # Table of the item (dough or topping), no foreign key like stock_movement
+    item_type: Mapped[str] = mapped_column(primary_key=True)
+    item_id: Mapped[uuid.UUID] = mapped_column(primary_key=True)
+    shard: Mapped[int] = mapped_column(primary_key=True)
+    stock: Mapped[int] = mapped_column(CheckConstraint(STOCK_NON_NEGATIVE_CONSTRAINT), nullable=False)
+
+    def __repr__(self):
+        return "StockShard(item_type='%s', item_id='%s', shard='%s', stock='%s')" \
+            % (self.item_type, self.item_id, self.shard, self.stock)
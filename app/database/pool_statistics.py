@@ -0,0 +1,130 @@
+import threading
+import time
+from typing import List, Optional, Tuple
+
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+# Upper bounds (in seconds) of the latency histogram buckets
+LATENCY_BUCKETS: Tuple[float, ...] = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class DurationHistogram:
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS, lock: Optional[threading.RLock] = None):
+        self._lock = lock or threading.RLock()
+        self.buckets = buckets
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.count = 0
+            self.total = 0.0
+            self.max = 0.0
+            # One counter per bucket plus the overflow bucket (+Inf)
+            self.counts: List[int] = [0] * (len(self.buckets) + 1)
+
+    def observe(self, duration: float):
+        with self._lock:
+            self.count += 1
+            self.total += duration
+            self.max = max(self.max, duration)
+            for index, upper_bound in enumerate(self.buckets):
+                if duration <= upper_bound:
+                    self.counts[index] += 1
+                    return
+            self.counts[-1] += 1
+
+    def snapshot(self):
+        with self._lock:
+            # Buckets are reported cumulative, like a Prometheus histogram. The last bucket (+Inf) has no bound
+            cumulative = 0
+            histogram = []
+            bounds: Tuple[Optional[float], ...] = self.buckets + (None,)
+            for upper_bound, count in zip(bounds, self.counts):
+                cumulative += count
+                histogram.append({'le': upper_bound, 'count': cumulative})
+
+            return {
+                'count': self.count,
+                'total': self.total,
+                'max': self.max,
+                'avg': self.total / self.count if self.count else 0.0,
+                'histogram': histogram,
+            }
+
+
+class PoolStatistics:
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        # Checkouts run in many threads; the timeout counter shares the lock of the histogram
+        self._lock = threading.RLock()
+        self.wait_times = DurationHistogram(buckets, lock=self._lock)
+        self.timeouts = 0
+
+    def reset(self):
+        with self._lock:
+            self.wait_times.reset()
+            self.timeouts = 0
+
+    def record_checkout(self, wait_time: float):
+        self.wait_times.observe(wait_time)
+
+    def record_timeout(self, wait_time: float):
+        with self._lock:
+            self.timeouts += 1
+            self.wait_times.observe(wait_time)
+
+    def snapshot(self):
+        with self._lock:
+            wait_times = self.wait_times.snapshot()
+            timeouts = self.timeouts
+        return {
+            'checkouts': wait_times['count'] - timeouts,
+            'timeouts': timeouts,
+            'wait_time_total': wait_times['total'],
+            'wait_time_max': wait_times['max'],
+            'wait_time_avg': wait_times['avg'],
+            'checkout_latency_histogram': wait_times['histogram'],
+        }
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that measures how long each checkout waits for a connection."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.statistics = PoolStatistics()
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            self.statistics.record_timeout(time.perf_counter() - start)
+            raise
+        self.statistics.record_checkout(time.perf_counter() - start)
+        return connection
+
+    def recreate(self):
+        # Keep the collected statistics when the engine disposes and recreates the pool
+        pool = super().recreate()
+        pool.statistics = self.statistics
+        return pool
+
+    def get_statistics(self):
+        statistics = self.statistics.snapshot()
+        statistics.update({
+            'size': self.size(),
+            'max_overflow': self._max_overflow,
+            'timeout': self.timeout(),
+            'checked_in': self.checkedin(),
+            'checked_out': self.checkedout(),
+            # QueuePool counts overflow from -pool_size upwards; only connections beyond pool_size are overflow
+            'overflow': max(self.overflow(), 0),
+        })
+        return statistics
+
+
+class InstrumentedAsyncQueuePool(InstrumentedQueuePool, AsyncAdaptedQueuePool):
+    """InstrumentedQueuePool of an async engine, checkouts wait on the event loop instead of blocking a thread."""
@@ -0,0 +1,51 @@
+import itertools
+import logging
+import threading
+import time
+from typing import Dict, Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+# Seconds the replica is behind the primary. A replica that replayed everything it received is not behind,
+# even if the last replayed transaction is old (idle primary). On a primary both LSN functions return NULL.
+REPLICATION_LAG_QUERY = text(
+    'SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 '
+    'ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END',
+)
+
+
+class ReplicaRouter:
+    """Round-robin selection of read replicas that are within a staleness bound."""
+
+    def __init__(self, engines: Dict[str, Engine], lag_check_interval: float = 1.0):
+        self.engines = engines
+        self.lag_check_interval = lag_check_interval
+        self._lock = threading.Lock()
+        self._cycle = itertools.cycle(list(engines.values()))
+        # engine -> (replication lag in seconds or None if unreachable, time of the check)
+        self._lags: Dict[Engine, tuple] = {}
+
+    def choose(self, max_staleness: float) -> Optional[Engine]:
+        """Next replica whose replication lag is at most max_staleness seconds, None if there is none."""
+        for _ in range(len(self.engines)):
+            with self._lock:
+                engine = next(self._cycle)
+            lag = self.get_replication_lag(engine)
+            if lag is not None and lag <= max_staleness:
+                return engine
+        return None
+
+    def get_replication_lag(self, engine: Engine) -> Optional[float]:
+        lag, checked_at = self._lags.get(engine, (None, None))
+        if checked_at is not None and time.monotonic() - checked_at < self.lag_check_interval:
+            return lag
+
+        try:
+            with engine.connect() as connection:
+                lag = float(connection.execute(REPLICATION_LAG_QUERY).scalar_one())
+        except Exception as e:
+            logging.error('Replication lag of replica {} could not be determined: {}'.format(engine.url, e))
+            lag = None
+        self._lags[engine] = (lag, time.monotonic())
+        return lag
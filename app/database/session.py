@@ -0,0 +1,136 @@
+import logging
+import time
+from contextlib import asynccontextmanager
+
+from fastapi import Request
+from sqlalchemy import event
+from starlette.concurrency import run_in_threadpool
+
+from app.database.connection import (
+    DATABASE_ASYNC, DATABASE_REPLICA_MAX_STALENESS, AsyncSessionLocal, SessionLocal, get_async_engine,
+    get_async_replica_engine, get_replica_router,
+)
+from app.database.pool_statistics import DurationHistogram
+
+READ_ONLY_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# Time each request held a database connection, summed over all transactions of its session
+connection_hold_times = DurationHistogram()
+
+
+@event.listens_for(SessionLocal, 'after_begin')
+def _on_connection_acquired(session, transaction, connection):
+    if session.info.get('read_only'):
+        connection.exec_driver_sql('SET TRANSACTION READ ONLY')
+    session.info['connection_acquired_at'] = time.perf_counter()
+
+
+@event.listens_for(SessionLocal, 'after_transaction_end')
+def _on_connection_released(session, transaction):
+    # Only the outermost transaction gives the connection back to the pool
+    if transaction.parent is not None:
+        return
+    acquired_at = session.info.pop('connection_acquired_at', None)
+    if acquired_at is not None:
+        session.info['connection_hold_time'] = \
+            session.info.get('connection_hold_time', 0.0) + time.perf_counter() - acquired_at
+
+
+def _record_hold_time(request: Request, db):
+    hold_time = db.info.get('connection_hold_time')
+    if hold_time is not None:
+        connection_hold_times.observe(hold_time)
+        logging.debug('{} {} held a database connection for {:.1f} ms'.format(
+            request.method, request.url.path, hold_time * 1000))
+
+
+def _request_session(request: Request, bind=None):
+    db = SessionLocal(bind=bind) if bind is not None else SessionLocal()
+    if request.method in READ_ONLY_METHODS:
+        db.info['read_only'] = True
+    try:
+        yield db
+    finally:
+        db.close()
+        _record_hold_time(request, db)
+
+
+@asynccontextmanager
+async def _async_request_session(request: Request, bind):
+    db = AsyncSessionLocal(bind=bind)
+    if request.method in READ_ONLY_METHODS:
+        db.info['read_only'] = True
+    try:
+        yield db
+    finally:
+        await db.close()
+        _record_hold_time(request, db)
+
+
+def get_db(request: Request):
+    """Session of a single request on the primary database.
+
+    The session checks out a connection on its first query only, so requests that never touch the database
+    (validation errors, cached responses) don't take a connection from the pool. GET requests run in read-only
+    transactions.
+    """
+    yield from _request_session(request)
+
+
+async def get_async_db(request: Request):
+    """get_db of DATABASE_ASYNC: an AsyncSession on the async engine of the primary."""
+    async with _async_request_session(request, get_async_engine()) as db:
+        yield db
+
+
+# The dependency that replaces get_db when the endpoints run on the event loop, see app/api/v1/async_endpoint.py
+get_db.async_dependency = get_async_db
+
+
+def replica_db(max_staleness: float = DATABASE_REPLICA_MAX_STALENESS):
+    """Dependency for read-only endpoints that may be served by a read replica.
+
+    A replica is used if it is at most max_staleness seconds behind the primary, otherwise (or if no replica is
+    configured) the session uses the primary. Endpoints that must see the writes of a preceding request keep
+    using get_db.
+    """
+    def get_replica_db(request: Request):
+        yield from _request_session(request, bind=get_replica_router().choose(max_staleness))
+
+    async def get_async_replica_db(request: Request):
+        # The lag check of the router may connect to the replicas, off the event loop
+        engine = await run_in_threadpool(get_replica_router().choose, max_staleness)
+        bind = get_async_replica_engine(engine) if engine is not None else get_async_engine()
+        async with _async_request_session(request, bind) as db:
+            yield db
+
+    get_replica_db.async_dependency = get_async_replica_db
+    return get_replica_db
+
+
+get_replica_db = replica_db()
+
+
+async def run_with_session(function, *args):
+    """function(*args, db) with a session of its own, outside of a request: on the event loop with DATABASE_ASYNC,
+    otherwise in the threadpool."""
+    if DATABASE_ASYNC:
+        async with AsyncSessionLocal(bind=get_async_engine()) as db:
+            return await db.run_sync(lambda session: function(*args, session))
+
+    def run():
+        with SessionLocal() as db:
+            return function(*args, db)
+
+    return await run_in_threadpool(run)
+
+
+def get_connection_hold_statistics():
+    statistics = connection_hold_times.snapshot()
+    return {
+        'requests': statistics['count'],
+        'hold_time_total': statistics['total'],
+        'hold_time_max': statistics['max'],
+        'hold_time_avg': statistics['avg'],
+        'hold_time_histogram': statistics['histogram'],
+    }
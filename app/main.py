@@ -1,13 +1,21 @@
 import logging
+import os
 
-import uvicorn
+from anyio import to_thread
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
-from app.api.v1.router import router as api_v1_router
+import app.api.v1.endpoints.menu.crud as menu_crud
+from app.api.v1.endpoints.order.stock_logic.stock_jobs import STOCK_JOBS
+from app.api.v1.async_endpoint import run_on_event_loop
+from app.api.v1.router import routers as api_v1_routers
+from app.database.connection import DATABASE_ASYNC, SessionLocal, get_async_engine, get_engine, get_replica_router
 
 logging.basicConfig(format='%(asctime)s:%(levelname)s:%(message)s', level=logging.DEBUG)  # NOSONAR
 
+# Number of threads running the sync endpoints concurrently (not with DATABASE_ASYNC), see doc/database/README.md
+WORKER_THREADS = int(os.getenv('WORKER_THREADS', '40'))
+
 tags_metadata = [
     {
         'name': 'user',
@@ -33,6 +41,14 @@ tags_metadata = [
         'name': 'topping',
         'description': 'Operations with toppings. ',
     },
+    {
+        'name': 'menu',
+        'description': 'The complete menu in one response. ',
+    },
+    {
+        'name': 'monitoring',
+        'description': 'Runtime statistics of the service. ',
+    },
 ]
 
 app = FastAPI(openapi_tags=tags_metadata)
@@ -51,12 +67,78 @@ app.add_middleware(
     expose_headers=[],
 )
 
+
+@app.on_event('startup')
+async def configure_worker_threads():
+    to_thread.current_default_thread_limiter().total_tokens = WORKER_THREADS
+    logging.info('Worker threadpool limited to {} threads'.format(WORKER_THREADS))
+
+
+@app.on_event('startup')
+def connect_database():
+    # Create the engines and open the first connection before the first request instead of during it
+    get_replica_router()
+    try:
+        with get_engine().connect():
+            logging.info('Connected to the database')
+    except Exception as e:
+        logging.error('Could not connect to the database on startup: {}'.format(e))
+
+
+@app.on_event('startup')
+async def connect_async_database():
+    if not DATABASE_ASYNC:
+        return
+    try:
+        async with get_async_engine().connect():
+            logging.info('Connected to the database with the async engine')
+    except Exception as e:
+        logging.error('Could not connect to the database with the async engine on startup: {}'.format(e))
+
+
+@app.on_event('shutdown')
+async def dispose_async_database():
+    if DATABASE_ASYNC:
+        await get_async_engine().dispose()
+
+
+@app.on_event('startup')
+def build_menu_snapshot():
+    # The first menu request is served from the snapshot instead of building it
+    db = SessionLocal()
+    try:
+        menu_crud.get_menu(db)
+    except Exception as e:
+        logging.error('Could not build the menu on startup: {}'.format(e))
+    finally:
+        db.close()
+
+
+@app.on_event('startup')
+def start_stock_jobs():
+    # Snapshot compactor, shard rebalancer, reservation sweeper and order total checker
+    for job in STOCK_JOBS:
+        job.start()
+
+
+@app.on_event('shutdown')
+def stop_stock_jobs():
+    for job in STOCK_JOBS:
+        job.stop()
+
+
 # This function routes to version 1 of the REST API /v1/..
-app.include_router(
-    api_v1_router,
-    prefix='/v1',
-)
+for api_v1_router, prefix in api_v1_routers:
+    if DATABASE_ASYNC:
+        run_on_event_loop(api_v1_router)
+    app.include_router(
+        api_v1_router,
+        prefix='/v1' + prefix,
+    )
 
 if __name__ == '__main__':
+    # Only needed when started as a script, uvicorn is started from the command line in the containers
+    import uvicorn
+
     logging.info('App is up and running')
     uvicorn.run('app.main:app', host='0.0.0.0', port=8000)
@@ -0,0 +1,117 @@
+"""Concurrent orders competing for the stock of one topping, against a running API.
+
+Every worker adds pizzas with the same topping to its own order until the topping runs out (409) or the time is up.
+Afterwards the stock of the topping is compared with the number of pizzas in the orders: taken stock and ordered
+pizzas must match exactly and the stock must never be negative. Exits with status 1 if they don't.
+
+    API_SERVER=localhost API_PORT=8000 python tests/benchmark/hot_topping.py --workers 32 --stock 2000
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+BASE_URL = 'http://{}:{}/v1'.format(os.getenv('API_SERVER', 'localhost'), os.getenv('API_PORT', '8000'))
+STOCK = 1_000_000
+
+
+def create_catalog(session: requests.Session, topping_stock: int):
+    suffix = uuid.uuid4().hex[:8]
+    dough = session.post(BASE_URL + '/doughs', json={
+        'name': 'benchmark dough ' + suffix, 'price': 1, 'description': '', 'stock': STOCK,
+    }).json()
+    sauce = session.post(BASE_URL + '/sauces', json={
+        'name': 'benchmark sauce ' + suffix, 'price': 1, 'description': '', 'stock': STOCK, 'spice': 'MILD',
+    }).json()
+    topping = session.post(BASE_URL + '/toppings', json={
+        'name': 'benchmark hot topping ' + suffix, 'price': 1, 'description': '', 'stock': topping_stock,
+    }).json()
+    pizza_type = session.post(BASE_URL + '/pizza-types', json={
+        'name': 'benchmark pizza ' + suffix, 'price': 8, 'description': '',
+        'dough_id': dough['id'], 'sauce_ids': [sauce['id']],
+    }).json()
+    session.post(BASE_URL + '/pizza-types/{}/toppings'.format(pizza_type['id']), json={
+        'topping_id': topping['id'], 'quantity': 1,
+    }).raise_for_status()
+    user = session.post(BASE_URL + '/users', json={'username': 'benchmark ' + suffix}).json()
+    return {'pizza_type_id': pizza_type['id'], 'topping_id': topping['id'], 'user_id': user['id']}
+
+
+def create_order(session: requests.Session, catalog):
+    order = session.post(BASE_URL + '/order', json={
+        'user_id': catalog['user_id'],
+        'address': {
+            'street': 'Benchmarkweg', 'post_code': '64295', 'house_number': 1, 'country': 'Deutschland',
+            'town': 'Darmstadt', 'first_name': 'Bench', 'last_name': 'Mark',
+        },
+    })
+    order.raise_for_status()
+    return order.json()['id']
+
+
+def worker(catalog, order_id: str, deadline: float, latencies, conflicts, errors):
+    session = requests.Session()
+    url = BASE_URL + '/order/{}/pizzas'.format(order_id)
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            response = session.post(url, json={'pizza_type_id': catalog['pizza_type_id']})
+        except requests.RequestException:
+            errors.append(1)
+            continue
+        if response.status_code == 409:
+            # Out of stock, the other workers get the same answer from now on
+            conflicts.append(1)
+            return
+        if response.status_code != 200:
+            errors.append(1)
+            continue
+        latencies.append(time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=32, help='concurrent clients')
+    parser.add_argument('--stock', type=int, default=2000, help='initial stock of the hot topping')
+    parser.add_argument('--duration', type=float, default=60, help='seconds to run at most')
+    args = parser.parse_args()
+
+    session = requests.Session()
+    catalog = create_catalog(session, args.stock)
+    order_ids = [create_order(session, catalog) for _ in range(args.workers)]
+    latencies = []
+    conflicts = []
+    errors = []
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        for order_id in order_ids:
+            executor.submit(worker, catalog, order_id, start + args.duration, latencies, conflicts, errors)
+    elapsed = time.perf_counter() - start
+
+    stock = session.get(BASE_URL + '/toppings/' + catalog['topping_id']).json()['stock']
+    pizzas = sum(len(session.get(BASE_URL + '/order/{}/pizzas'.format(order_id)).json()) for order_id in order_ids)
+    added = len(latencies)
+
+    print('workers:            {}'.format(args.workers))
+    print('pizzas added:       {} ({} conflicts, {} errors)'.format(added, len(conflicts), len(errors)))
+    print('pizzas/second:      {:.1f}'.format(added / elapsed))
+    if latencies:
+        latencies.sort()
+        print('latency p50:        {:.1f} ms'.format(statistics.median(latencies) * 1000))
+        print('latency p99:        {:.1f} ms'.format(latencies[max(int(added * 0.99) - 1, 0)] * 1000))
+    print('topping stock:      {} -> {}'.format(args.stock, stock))
+    print('pizzas in orders:   {}'.format(pizzas))
+
+    if stock < 0 or stock != args.stock - pizzas or pizzas != added:
+        print('STOCK MISMATCH: {} taken, {} pizzas ordered, {} added'.format(args.stock - stock, pizzas, added))
+        sys.exit(1)
+    print('stock consistent:   yes')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""Per-call overhead of the hot get_*_by_id / get_*_by_name lookups.
+
+Compares the former Query based lookups with Session.get (identity map hit and miss) and cached lambda
+statements. Runs against the database configured by the DATABASE_* variables:
+
+    PYTHONPATH=. python tests/benchmark/lookups.py --calls 5000
+"""
+import argparse
+import time
+import uuid
+
+from sqlalchemy import lambda_stmt, select
+
+from app.database.connection import SessionLocal
+from app.database.models import Dough
+
+
+def measure(name: str, calls: int, lookup):
+    # Warm up the compiled statement caches
+    for _ in range(100):
+        lookup()
+    start = time.perf_counter()
+    for _ in range(calls):
+        lookup()
+    per_call = (time.perf_counter() - start) / calls
+    print('{:<40} {:>8.1f} us/call'.format(name, per_call * 1_000_000))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calls', type=int, default=2000)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    dough = Dough(name='benchmark dough ' + uuid.uuid4().hex[:8], price=1, description='', stock=1)
+    db.add(dough)
+    db.commit()
+    dough_id, dough_name = dough.id, dough.name
+
+    try:
+        measure('query().filter(id).first()', args.calls,
+                lambda: db.query(Dough).filter(Dough.id == dough_id).first())
+        measure('session.get() identity map hit', args.calls,
+                lambda: db.get(Dough, dough_id))
+
+        def get_without_identity_map():
+            db.expunge_all()
+            return db.get(Dough, dough_id)
+        measure('session.get() identity map miss', args.calls, get_without_identity_map)
+
+        measure('query().filter(name).first()', args.calls,
+                lambda: db.query(Dough).filter(Dough.name == dough_name).first())
+        measure('lambda_stmt(name)', args.calls,
+                lambda: db.scalars(lambda_stmt(lambda: select(Dough).where(Dough.name == dough_name))).first())
+    finally:
+        db.rollback()
+        db.delete(db.get(Dough, dough_id))
+        db.commit()
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+"""Throughput benchmark of the order flow.
+
+Every iteration creates an order, adds a pizza and a beverage, reads the price and deletes the order again.
+Against a running API, started with the settings to compare (e.g. WORKER_THREADS or DATABASE_POOL_SIZE):
+
+    API_SERVER=localhost API_PORT=8000 python tests/benchmark/order_flow.py --workers 64 --duration 30
+
+Sync endpoints on the worker threadpool against the async path (DATABASE_ASYNC): --modes starts the API with
+uvicorn once per mode, like tests/benchmark/startup.py, and needs the DATABASE_* variables:
+
+    PYTHONPATH=. python tests/benchmark/order_flow.py --modes sync async --workers 64 --duration 30
+"""
+import argparse
+import os
+import statistics
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from tests.benchmark.startup import running_api
+
+BASE_URL = 'http://{}:{}/v1'.format(os.getenv('API_SERVER', 'localhost'), os.getenv('API_PORT', '8000'))
+STOCK = 1_000_000
+# DATABASE_ASYNC of the API per mode of --modes
+MODES = {'sync': 'false', 'async': 'true'}
+
+
+def create_catalog(session: requests.Session, base_url: str):
+    suffix = uuid.uuid4().hex[:8]
+    dough = session.post(base_url + '/doughs', json={
+        'name': 'benchmark dough ' + suffix, 'price': 1, 'description': '', 'stock': STOCK,
+    }).json()
+    sauce = session.post(base_url + '/sauces', json={
+        'name': 'benchmark sauce ' + suffix, 'price': 1, 'description': '', 'stock': STOCK, 'spice': 'MILD',
+    }).json()
+    topping = session.post(base_url + '/toppings', json={
+        'name': 'benchmark topping ' + suffix, 'price': 1, 'description': '', 'stock': STOCK,
+    }).json()
+    pizza_type = session.post(base_url + '/pizza-types', json={
+        'name': 'benchmark pizza ' + suffix, 'price': 8, 'description': '',
+        'dough_id': dough['id'], 'sauce_ids': [sauce['id']],
+    }).json()
+    session.post(base_url + '/pizza-types/{}/toppings'.format(pizza_type['id']), json={
+        'topping_id': topping['id'], 'quantity': 1,
+    })
+    beverage = session.post(base_url + '/beverages', json={
+        'name': 'benchmark beverage ' + suffix, 'price': 2, 'description': '', 'stock': STOCK,
+    }).json()
+    user = session.post(base_url + '/users', json={'username': 'benchmark ' + suffix}).json()
+    return {'pizza_type_id': pizza_type['id'], 'beverage_id': beverage['id'], 'user_id': user['id']}
+
+
+def run_order_flow(session: requests.Session, base_url: str, catalog):
+    order = session.post(base_url + '/order', json={
+        'user_id': catalog['user_id'],
+        'address': {
+            'street': 'Benchmarkweg', 'post_code': '64295', 'house_number': 1, 'country': 'Deutschland',
+            'town': 'Darmstadt', 'first_name': 'Bench', 'last_name': 'Mark',
+        },
+    })
+    order.raise_for_status()
+    order_url = base_url + '/order/' + order.json()['id']
+    session.post(order_url + '/pizzas', json={'pizza_type_id': catalog['pizza_type_id']}).raise_for_status()
+    session.post(order_url + '/beverages', json={
+        'beverage_id': catalog['beverage_id'], 'quantity': 1,
+    }).raise_for_status()
+    session.get(order_url + '/price').raise_for_status()
+    session.delete(order_url).raise_for_status()
+
+
+def worker(base_url: str, catalog, deadline: float, latencies, errors):
+    session = requests.Session()
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            run_order_flow(session, base_url, catalog)
+        except requests.RequestException:
+            errors.append(1)
+            continue
+        latencies.append(time.perf_counter() - start)
+
+
+def run_benchmark(base_url: str, workers: int, duration: float):
+    catalog = create_catalog(requests.Session(), base_url)
+    latencies = []
+    errors = []
+    deadline = time.perf_counter() + duration
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for _ in range(workers):
+            executor.submit(worker, base_url, catalog, deadline, latencies, errors)
+    latencies.sort()
+    flows = len(latencies)
+    return {
+        'order flows': flows,
+        'errors': len(errors),
+        'flows/second': flows / duration,
+        # Every flow issues five requests
+        'requests/second': flows * 5 / duration,
+        'flow latency p50 (ms)': statistics.median(latencies) * 1000 if latencies else 0.0,
+        'flow latency p99 (ms)': latencies[max(int(flows * 0.99) - 1, 0)] * 1000 if latencies else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=32, help='concurrent clients')
+    parser.add_argument('--duration', type=float, default=20, help='seconds to run')
+    parser.add_argument('--modes', nargs='+', choices=MODES, help='start the API in these modes and compare them')
+    parser.add_argument('--port', type=int, default=8765, help='port of the APIs started for --modes')
+    args = parser.parse_args()
+
+    if not args.modes:
+        results = {'': run_benchmark(BASE_URL, args.workers, args.duration)}
+    else:
+        results = {}
+        for mode in args.modes:
+            with running_api(args.port, {'DATABASE_ASYNC': MODES[mode]}):
+                results[mode] = run_benchmark(
+                    'http://127.0.0.1:{}/v1'.format(args.port), args.workers, args.duration)
+
+    print('workers: {}'.format(args.workers))
+    print('{:<22}'.format('') + ''.join('{:>12}'.format(mode) for mode in results))
+    for metric in next(iter(results.values())):
+        print('{:<22}'.format(metric) + ''.join('{:>12.1f}'.format(result[metric]) for result in results.values()))
+
+
+if __name__ == '__main__':
+    main()
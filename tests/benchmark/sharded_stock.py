@@ -0,0 +1,103 @@
+"""Order throughput on one hot topping, with its stock in one row versus split across stock shards.
+
+Every worker takes one unit of the same topping per transaction for --duration seconds, like an order does
+(stock_ingredients_crud.take_ingredient_demand). Unsharded, all workers queue for the lock of the one topping row;
+sharded, a take goes to a random shard no other worker holds. Besides throughput and latency, pg_stat_activity is
+sampled for backends waiting on a lock: the mean number of waiting workers is the row-lock wait that sharding removes.
+After every mode the stock is checked against the counted takes and the ledger. Runs against the database configured
+by the DATABASE_* variables, with a pool large enough for all workers:
+
+    DATABASE_POOL_SIZE=32 PYTHONPATH=. python tests/benchmark/sharded_stock.py --workers 16 --shards 16
+"""
+import argparse
+import statistics
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import text
+
+import app.api.v1.endpoints.order.stock_logic.stock_ingredients_crud as stock_ingredients_crud
+import app.api.v1.endpoints.order.stock_logic.stock_ledger_crud as stock_ledger_crud
+import app.api.v1.endpoints.order.stock_logic.stock_shard_crud as stock_shard_crud
+from app.database.connection import SessionLocal
+from app.database.models import Topping
+
+STOCK = 100_000_000
+LOCK_WAITS = text(
+    'SELECT count(*) FROM pg_stat_activity WHERE datname = current_database() AND wait_event_type = :lock') \
+    .bindparams(lock='Lock')
+
+
+def worker(topping_id: uuid.UUID, deadline: float):
+    latencies = []
+    db = SessionLocal()
+    try:
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            assert stock_ingredients_crud.take_ingredient_demand({}, {topping_id: 1}, db)
+            db.commit()
+            latencies.append(time.perf_counter() - start)
+    finally:
+        db.close()
+    return latencies
+
+
+def sample_lock_waits(deadline: float, samples: list):
+    db = SessionLocal()
+    try:
+        while time.perf_counter() < deadline:
+            samples.append(db.scalar(LOCK_WAITS))
+            db.rollback()
+            time.sleep(0.01)
+    finally:
+        db.close()
+
+
+def measure(mode: str, shards: int, workers: int, duration: float):
+    db = SessionLocal()
+    topping = Topping(name='benchmark hot topping ' + uuid.uuid4().hex[:8], price=1, description='', stock=STOCK)
+    db.add(topping)
+    db.commit()
+    stock_shard_crud.set_stock_shards(Topping, topping, shards, db)
+    topping_id = topping.id
+
+    try:
+        deadline = time.perf_counter() + duration
+        lock_waits = []
+        sampler = threading.Thread(target=sample_lock_waits, args=(deadline, lock_waits))
+        sampler.start()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(lambda _: worker(topping_id, deadline), range(workers)))
+        sampler.join()
+        latencies = sorted(latency for result in results for latency in result)
+
+        db.expire_all()
+        stock = db.get(Topping, topping_id).stock
+        ledger_stock = stock_ledger_crud.get_ledger_stock(Topping, [topping_id], db)[topping_id]
+        consistent = stock == ledger_stock == STOCK - len(latencies)
+        print('{:<10} {:>6.0f} commits/s   p50 {:>7.2f} ms   p99 {:>7.2f} ms   {:>5.2f} waiting on locks   {}'.format(
+            mode, len(latencies) / duration, statistics.median(latencies) * 1000,
+            latencies[int(len(latencies) * 0.99)] * 1000, statistics.mean(lock_waits),
+            'consistent' if consistent else 'INCONSISTENT'))
+    finally:
+        db.delete(db.get(Topping, topping_id))
+        db.commit()
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--shards', type=int, default=16)
+    args = parser.parse_args()
+
+    print('{} workers, {:.0f} s per mode'.format(args.workers, args.duration))
+    measure('unsharded', 1, args.workers, args.duration)
+    measure('sharded', args.shards, args.workers, args.duration)
+
+
+if __name__ == '__main__':
+    main()
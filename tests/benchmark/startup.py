@@ -0,0 +1,90 @@
+"""Cold start time of the API: importing app.main, running the startup hooks and serving the first request.
+
+Starts the app with uvicorn in a fresh process, the same way the containers do, and needs the DATABASE_* variables:
+
+    PYTHONPATH=. python tests/benchmark/startup.py --metrics metrics.txt
+
+The optional metrics file uses the format of GitLab metrics reports, so CI can track the numbers per merge request.
+To see which imports are slow: python -X importtime -c 'import app.main' 2> importtime.log
+"""
+import argparse
+import os
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+import requests
+
+IMPORT_TIME_SCRIPT = 'import time; start = time.perf_counter(); import app.main; print(time.perf_counter() - start)'
+# Logged by uvicorn after the startup hooks ran and the socket is bound
+SERVER_RUNNING = 'Uvicorn running on'
+
+
+def measure_import():
+    output = subprocess.run([sys.executable, '-c', IMPORT_TIME_SCRIPT], check=True, capture_output=True, text=True)
+    return float(output.stdout.strip())
+
+
+@contextmanager
+def running_api(port: int, env: Optional[dict] = None):
+    """Starts the app with uvicorn in a fresh process, yields once its startup hooks are done and stops it after."""
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'app.main:app', '--port', str(port), '--log-level', 'info'],
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, env=dict(os.environ, **(env or {})),
+    )
+    try:
+        for line in server.stderr:
+            if SERVER_RUNNING in line:
+                break
+        else:
+            raise RuntimeError('uvicorn exited with {} before the startup completed'.format(server.wait()))
+        # Keep reading the log, a full pipe would block the server
+        threading.Thread(target=server.stderr.read, daemon=True).start()
+        yield server
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def measure_startup(port: int, path: str):
+    spawned = time.perf_counter()
+    with running_api(port):
+        started = time.perf_counter()
+        response = requests.get('http://127.0.0.1:{}{}'.format(port, path))
+        first_response = time.perf_counter()
+        response.raise_for_status()
+
+    return started - spawned, first_response - started, first_response - spawned
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--metrics', help='write the results to this file')
+    parser.add_argument('--path', default='/v1/pizza-types', help='path of the first request')
+    parser.add_argument('--port', type=int, default=8765, help='port the benchmarked server listens on')
+    args = parser.parse_args()
+
+    imported = measure_import()
+    started, first_request, first_response = measure_startup(args.port, args.path)
+
+    metrics = {
+        'startup_import_seconds': imported,
+        # Process start, interpreter, imports and startup hooks up to the point uvicorn accepts requests
+        'startup_process_seconds': started,
+        'startup_first_request_seconds': first_request,
+        'startup_time_to_first_response_seconds': first_response,
+    }
+    for name, value in metrics.items():
+        print('{:<42} {:.3f}'.format(name, value))
+
+    if args.metrics:
+        with open(args.metrics, 'w') as metrics_file:
+            for name, value in metrics.items():
+                metrics_file.write('{} {:.3f}\n'.format(name, value))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""Writer throughput on one hot topping: the stock update with and without the movements of the stock ledger.
+
+Every worker takes one unit of the same topping per transaction for --duration seconds, in three modes:
+
+    update  stock_crud.take_stock with STOCK_LEDGER=false: the guarded UPDATE of the stock row only
+    ledger  stock_crud.take_stock: the guarded UPDATE and the RESERVE movement in one statement
+    append  INSERT of the movement only, no row update and no guard against overselling
+
+The ledger is an audit trail and costs throughput: its movements are inserted while the writer holds the row lock of
+the topping, so ledger stays below update. append shows what an append-only ledger would reach, but without a guard
+concurrent orders oversell, so it is no option for orders; hot items are sharded instead (sharded_stock.py). Runs
+against the database configured by the DATABASE_* variables, with a pool large enough for all workers:
+
+    DATABASE_POOL_SIZE=32 PYTHONPATH=. python tests/benchmark/stock_writers.py --workers 32 --duration 10
+"""
+import argparse
+import statistics
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import insert
+
+import app.api.v1.endpoints.order.stock_logic.stock_crud as stock_crud
+import app.api.v1.endpoints.order.stock_logic.stock_ledger_crud as stock_ledger_crud
+from app.database.connection import SessionLocal
+from app.database.models import StockMovement, StockMovementReason, Topping
+
+STOCK = 100_000_000
+
+
+def take_stock(topping_id: uuid.UUID, db):
+    stock_crud.take_stock(Topping, {topping_id: 1}, db)
+
+
+def take_with_append(topping_id: uuid.UUID, db):
+    db.execute(insert(StockMovement).values(
+        item_type=Topping.__tablename__, item_id=topping_id, change=-1, stock_after=0,
+        reason=StockMovementReason.RESERVE))
+
+
+# Take function and STOCK_LEDGER of every mode
+MODES = {
+    'update': (take_stock, False),
+    'ledger': (take_stock, True),
+    'append': (take_with_append, True),
+}
+
+
+def worker(take, topping_id: uuid.UUID, deadline: float):
+    latencies = []
+    db = SessionLocal()
+    try:
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            take(topping_id, db)
+            db.commit()
+            latencies.append(time.perf_counter() - start)
+    finally:
+        db.close()
+    return latencies
+
+
+def measure(mode: str, workers: int, duration: float, topping_id: uuid.UUID):
+    take, stock_ledger_crud.STOCK_LEDGER = MODES[mode]
+    deadline = time.perf_counter() + duration
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(lambda _: worker(take, topping_id, deadline), range(workers)))
+    latencies = sorted(latency for result in results for latency in result)
+    print('{:<8} {:>9.0f} commits/s   p50 {:>7.2f} ms   p99 {:>7.2f} ms'.format(
+        mode, len(latencies) / duration, statistics.median(latencies) * 1000,
+        latencies[int(len(latencies) * 0.99)] * 1000))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--modes', nargs='+', choices=list(MODES), default=list(MODES))
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    topping = Topping(name='benchmark hot topping ' + uuid.uuid4().hex[:8], price=1, description='', stock=STOCK)
+    db.add(topping)
+    db.commit()
+    topping_id = topping.id
+
+    try:
+        print('{} workers, {:.0f} s per mode'.format(args.workers, args.duration))
+        for mode in args.modes:
+            measure(mode, args.workers, args.duration, topping_id)
+    finally:
+        db.delete(db.get(Topping, topping_id))
+        db.commit()
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
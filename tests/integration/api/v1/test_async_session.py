@@ -0,0 +1,54 @@
+import asyncio
+from decimal import Decimal
+
+import pytest
+
+import app.api.v1.endpoints.dough.crud as dough_crud
+import app.api.v1.endpoints.order.stock_logic.stock_ledger_crud as stock_ledger_crud
+from app.api.v1.endpoints.dough.schemas import DoughCreateSchema
+from app.database.catalog_cache import catalog_cache
+from app.database.connection import AsyncSessionLocal, SessionLocal, get_async_engine
+from app.database.models import Dough, StockMovementReason
+from tests.integration.api.v1.helper import clear_db
+
+
+@pytest.fixture(scope='module')
+def db():
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def version_of(model):
+    return next((statistics['version'] for statistics in catalog_cache.get_statistics()
+                 if statistics['entity_type'] == model.__tablename__), 0)
+
+
+def test_crud_in_async_session(db):
+    clear_db(db)
+    version = version_of(Dough)
+    schema = DoughCreateSchema(name='async dough', price=Decimal('1.00'), description='', stock=7)
+
+    async def create_and_list():
+        engine = get_async_engine()
+        try:
+            async with AsyncSessionLocal(bind=engine) as async_db:
+                dough = await async_db.run_sync(lambda session: dough_crud.create_dough(schema, session))
+                doughs = await async_db.run_sync(dough_crud.get_all_doughs)
+                return dough.id, doughs
+        finally:
+            # The connections belong to the event loop of this test
+            await engine.dispose()
+
+    # Act: Create a dough through the AsyncSession and list the doughs
+    dough_id, doughs = asyncio.run(create_and_list())
+
+    # Assert: The listeners of SessionLocal ran for the sync session inside the AsyncSession
+    assert version_of(Dough) == version + 1
+    assert [(movement.reason, movement.change) for movement in stock_ledger_crud.get_stock_movements(
+        Dough, dough_id, db)] == [(StockMovementReason.RESTOCK, 7)]
+    assert [dough.name for dough in doughs] == ['async dough']
+
+    dough_crud.delete_dough_by_id(dough_id, db)
@@ -0,0 +1,120 @@
+import os
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import event
+
+import app.api.v1.endpoints.dough.crud as dough_crud
+import app.api.v1.endpoints.pizza_type.crud as pizza_type_crud
+import app.api.v1.endpoints.topping.crud as topping_crud
+from app.api.v1.endpoints.dough.schemas import DoughCreateSchema
+from app.api.v1.endpoints.order.stock_logic.stock_availability_crud import PIZZA_TYPE_AVAILABILITY
+from app.api.v1.endpoints.pizza_type.schemas import PizzaTypeCreateSchema
+from app.api.v1.endpoints.topping.schemas import ToppingCreateSchema
+from app.database.catalog_cache import catalog_cache, invalidate_on_commit
+from app.database.connection import SessionLocal, create_pooled_engine, get_database_url, get_engine
+from app.database.models import PizzaType, Topping
+from tests.integration.api.v1.helper import clear_db
+
+
+@pytest.fixture(scope='module')
+def db():
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def statistics_of(model):
+    return next(statistics for statistics in catalog_cache.get_statistics()
+                if statistics['entity_type'] == getattr(model, '__tablename__', model))
+
+
+def test_catalog_cache(db):
+    clear_db(db)
+    statements = []
+
+    def count_statement(*args):
+        statements.append(args)
+
+    # Arrange: A topping, listed once
+    topping_schema = ToppingCreateSchema(name='cached topping', price=Decimal('1.00'), description='', stock=10)
+    topping = topping_crud.create_topping(topping_schema, db)
+    assert [item.name for item in topping_crud.get_all_toppings(db)] == ['cached topping']
+    hits = statistics_of(Topping)['hits']
+
+    # Act: List again
+    event.listen(get_engine(), 'before_cursor_execute', count_statement)
+    try:
+        toppings = topping_crud.get_all_toppings(db)
+    finally:
+        event.remove(get_engine(), 'before_cursor_execute', count_statement)
+
+    # Assert: Served from the cache, without a statement
+    assert [item.name for item in toppings] == ['cached topping']
+    assert statements == []
+    assert statistics_of(Topping)['hits'] == hits + 1
+    assert statistics_of(Topping)['cached']
+
+    # Act & Assert: An update is listed right away, a rolled back change keeps the cache
+    topping_crud.update_topping(topping, topping_schema.copy(update={'price': Decimal('2.00')}), db)
+    assert [item.price for item in topping_crud.get_all_toppings(db)] == [2.0]
+    version = statistics_of(Topping)['version']
+    invalidate_on_commit(db, Topping)
+    db.rollback()
+    assert statistics_of(Topping)['version'] == version
+    assert statistics_of(Topping)['cached']
+
+    # Act & Assert: Stock changes of the dough change max_makeable of the cached pizza types, only the availability
+    # map is reloaded
+    dough_schema = DoughCreateSchema(name='cached dough', price=Decimal('1.00'), description='', stock=5)
+    dough = dough_crud.create_dough(dough_schema, db)
+    pizza_type = pizza_type_crud.create_pizza_type(PizzaTypeCreateSchema(
+        name='cached pizza type', price=Decimal('5.00'), description='', dough_id=dough.id, sauce_ids=[]), db)
+    pizza_types = pizza_type_crud.get_all_pizza_types(db)
+    assert [item.max_makeable for item in pizza_types] == [5]
+    version = statistics_of(PizzaType)['version']
+    availability_version = statistics_of(PIZZA_TYPE_AVAILABILITY)['version']
+    dough_crud.update_dough(dough, dough_schema.copy(update={'stock': 3}), db)
+    changed_pizza_types = pizza_type_crud.get_all_pizza_types(db)
+    assert [item.max_makeable for item in changed_pizza_types] == [3]
+    assert changed_pizza_types.etag != pizza_types.etag
+    assert statistics_of(PizzaType)['version'] == version
+    assert statistics_of(PizzaType)['cached']
+    assert statistics_of(PIZZA_TYPE_AVAILABILITY)['version'] == availability_version + 1
+
+    # Act & Assert: Deleted items leave the list
+    pizza_type_crud.delete_pizza_type_by_id(pizza_type.id, db)
+    dough_crud.delete_dough_by_id(dough.id, db)
+    topping_crud.delete_topping_by_id(topping.id, db)
+    assert pizza_type_crud.get_all_pizza_types(db) == []
+    assert dough_crud.get_all_doughs(db) == []
+    assert topping_crud.get_all_toppings(db) == []
+
+
+def test_catalog_cache_misses_load_from_the_primary(db):
+    clear_db(db)
+    replica_statements = []
+
+    def count_statement(*args):
+        replica_statements.append(args)
+
+    # Arrange: A second engine standing in for a replica, and a topping that was just written
+    replica = create_pooled_engine(get_database_url(os.environ['DATABASE_HOST']))
+    event.listen(replica, 'before_cursor_execute', count_statement)
+    topping = topping_crud.create_topping(
+        ToppingCreateSchema(name='primary topping', price=Decimal('1.00'), description='', stock=10), db)
+    replica_db = SessionLocal(bind=replica)
+
+    # Act: A request on the replica misses the cache
+    try:
+        toppings = topping_crud.get_all_toppings(replica_db)
+    finally:
+        replica_db.close()
+        replica.dispose()
+
+    # Assert: The entry was loaded from the primary
+    assert [item.name for item in toppings] == ['primary topping']
+    assert replica_statements == []
+    topping_crud.delete_topping_by_id(topping.id, db)
@@ -0,0 +1,69 @@
+import uuid
+
+import pytest
+
+import app.api.v1.idempotency.crud as idempotency_crud
+from app.database.connection import SessionLocal
+
+
+@pytest.fixture(scope='module')
+def db():
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def test_idempotency_key_claim_store_release(db):
+    key = 'test-' + uuid.uuid4().hex
+    request = 'POST /v1/order? ' + uuid.uuid4().hex
+    first, second = uuid.uuid4(), uuid.uuid4()
+
+    # Act: First claim owns the key, a concurrent claim sees the request in progress
+    assert idempotency_crud.claim_idempotency_key(key, request, first, 30, db) is None
+    in_progress = idempotency_crud.claim_idempotency_key(key, request, second, 30, db)
+    assert in_progress.request == request
+    assert in_progress.status_code is None
+
+    # Act: Only the owner releases or stores
+    idempotency_crud.release_idempotency_key(key, second, db)
+    assert not idempotency_crud.store_idempotent_response(key, second, 500, {}, b'', 60, db)
+    assert idempotency_crud.store_idempotent_response(
+        key, first, 201, {'content-type': 'application/json'}, b'{"id": 1}', 60, db)
+
+    # Act: A retry gets the stored response
+    stored = idempotency_crud.claim_idempotency_key(key, request, second, 30, db)
+    assert stored.status_code == 201
+    assert stored.headers == {'content-type': 'application/json'}
+    assert stored.body == b'{"id": 1}'
+
+    # Act: A key with a response is neither released nor stored again
+    idempotency_crud.release_idempotency_key(key, first, db)
+    assert not idempotency_crud.store_idempotent_response(key, first, 200, {}, b'', 60, db)
+    assert idempotency_crud.claim_idempotency_key(key, request, second, 30, db).status_code == 201
+
+    # Act: A released key can be claimed again
+    other_key = 'test-' + uuid.uuid4().hex
+    assert idempotency_crud.claim_idempotency_key(other_key, request, first, 30, db) is None
+    idempotency_crud.release_idempotency_key(other_key, first, db)
+    assert idempotency_crud.claim_idempotency_key(other_key, request, second, 30, db) is None
+    idempotency_crud.release_idempotency_key(other_key, second, db)
+
+
+def test_expired_lease_is_taken_over(db):
+    key = 'test-' + uuid.uuid4().hex
+    request = 'POST /v1/order? ' + uuid.uuid4().hex
+    slow, retry = uuid.uuid4(), uuid.uuid4()
+
+    # Arrange: The lease of the slow request expires while it runs
+    assert idempotency_crud.claim_idempotency_key(key, request, slow, 0, db) is None
+
+    # Act: A retry takes the key over and stores its response
+    assert idempotency_crud.claim_idempotency_key(key, request, retry, 30, db) is None
+    assert idempotency_crud.store_idempotent_response(key, retry, 201, {}, b'{"id": 2}', 60, db)
+
+    # Assert: The slow request neither overwrites nor releases the response of the retry
+    assert not idempotency_crud.store_idempotent_response(key, slow, 201, {}, b'{"id": 1}', 60, db)
+    idempotency_crud.release_idempotency_key(key, slow, db)
+    assert idempotency_crud.claim_idempotency_key(key, request, slow, 30, db).body == b'{"id": 2}'
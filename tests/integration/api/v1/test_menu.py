@@ -0,0 +1,95 @@
+import json
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import event
+
+import app.api.v1.endpoints.dough.crud as dough_crud
+import app.api.v1.endpoints.menu.crud as menu_crud
+import app.api.v1.endpoints.order.stock_logic.stock_ingredients_crud as stock_ingredients_crud
+import app.api.v1.endpoints.pizza_type.crud as pizza_type_crud
+import app.api.v1.endpoints.sauce.crud as sauce_crud
+import app.api.v1.endpoints.topping.crud as topping_crud
+from app.api.v1.endpoints.dough.schemas import DoughCreateSchema
+from app.api.v1.endpoints.pizza_type.schemas import PizzaTypeCreateSchema, PizzaTypeToppingQuantityCreateSchema
+from app.api.v1.endpoints.sauce.schemas import SauceCreateSchema
+from app.api.v1.endpoints.topping.schemas import ToppingCreateSchema
+from app.database.connection import SessionLocal, get_engine
+from tests.integration.api.v1.helper import clear_db
+
+
+@pytest.fixture(scope='module')
+def db():
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def statements_of_menu(db):
+    statements = []
+
+    def count_statement(*args):
+        statements.append(args)
+
+    event.listen(get_engine(), 'before_cursor_execute', count_statement)
+    try:
+        menu = menu_crud.get_menu(db)
+    finally:
+        event.remove(get_engine(), 'before_cursor_execute', count_statement)
+    return json.loads(menu.body), len(statements)
+
+
+def test_menu(db):
+    clear_db(db)
+
+    # Arrange: Three pizza types of one dough and sauce, one of them with a topping
+    dough = dough_crud.create_dough(
+        DoughCreateSchema(name='menu dough', price=Decimal('1.00'), description='', stock=5), db)
+    sauce = sauce_crud.create_sauce(
+        SauceCreateSchema(name='menu sauce', price=Decimal('0.50'), description='', stock=5, spice='MILD'), db)
+    topping = topping_crud.create_topping(
+        ToppingCreateSchema(name='menu topping', price=Decimal('1.00'), description='', stock=6), db)
+    pizza_types = [
+        pizza_type_crud.create_pizza_type(PizzaTypeCreateSchema(
+            name='menu pizza {}'.format(number), price=Decimal('5.00'), description='', dough_id=dough.id,
+            sauce_ids=[sauce.id]), db)
+        for number in range(3)]
+    pizza_type_crud.create_topping_quantity(
+        pizza_types[0], PizzaTypeToppingQuantityCreateSchema(topping_id=topping.id, quantity=2), db)
+
+    # Act: Build the menu
+    menu, statements = statements_of_menu(db)
+
+    # Assert: Every pizza type with its recipe, from three queries and one for the counts
+    assert statements == 4
+    assert [pizza_type['name'] for pizza_type in menu['pizza_types']] == [
+        'menu pizza 0', 'menu pizza 1', 'menu pizza 2']
+    assert menu['pizza_types'][0]['dough']['id'] == str(dough.id)
+    assert [sauce['id'] for sauce in menu['pizza_types'][1]['sauces']] == [str(sauce.id)]
+    assert menu['pizza_types'][0]['toppings'] == [
+        {'id': str(topping.id), 'name': 'menu topping', 'price': 1.0, 'description': '', 'quantity': 2}]
+    assert [pizza_type['max_makeable'] for pizza_type in menu['pizza_types']] == [3, 5, 5]
+
+    # Act & Assert: The snapshot is served without a query until the catalog changes
+    assert statements_of_menu(db) == (menu, 0)
+
+    # Act & Assert: Taking stock only reloads the counts, the menu is not rebuilt
+    assert stock_ingredients_crud.reduce_stock_of_ingredients(pizza_types[1], db)
+    menu, statements = statements_of_menu(db)
+    assert statements == 1
+    assert [pizza_type['max_makeable'] for pizza_type in menu['pizza_types']] == [3, 4, 4]
+    topping_crud.update_topping(
+        topping, ToppingCreateSchema(name='menu topping', price=Decimal('2.00'), description='', stock=6), db)
+    menu, statements = statements_of_menu(db)
+    assert statements == 3
+    assert menu['pizza_types'][0]['toppings'][0]['price'] == 2.0
+
+    # Clean up
+    for pizza_type in pizza_types:
+        pizza_type_crud.delete_pizza_type_by_id(pizza_type.id, db)
+    topping_crud.delete_topping_by_id(topping.id, db)
+    sauce_crud.delete_sauce_by_id(sauce.id, db)
+    dough_crud.delete_dough_by_id(dough.id, db)
+    assert statements_of_menu(db)[0] == {'pizza_types': []}
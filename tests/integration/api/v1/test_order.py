@@ -2,23 +2,26 @@ import uuid
 from decimal import Decimal
 
 import pytest
+from sqlalchemy.orm import selectinload
 
 import app.api.v1.endpoints.dough.crud as dough_crud
 from app.api.v1.endpoints.beverage.schemas import BeverageCreateSchema
 from app.api.v1.endpoints.dough.schemas import DoughCreateSchema
 from app.api.v1.endpoints.order.address.schemas import AddressCreateSchema
 from app.api.v1.endpoints.order.schemas import OrderCreateSchema, OrderStatus
-from app.api.v1.endpoints.pizza_type.schemas import PizzaTypeCreateSchema
+from app.api.v1.endpoints.pizza_type.schemas import PizzaTypeCreateSchema, PizzaTypeToppingQuantityCreateSchema
 from app.api.v1.endpoints.sauce.schemas import SauceCreateSchema, SpiceLevel
 from app.api.v1.endpoints.topping.schemas import ToppingCreateSchema
 from app.api.v1.endpoints.user.schemas import UserCreateSchema
 from app.database.connection import SessionLocal
+from app.database.models import Order
 import app.api.v1.endpoints.user.crud as user_crud
 import app.api.v1.endpoints.beverage.crud as beverage_crud
 import app.api.v1.endpoints.topping.crud as topping_crud
 import app.api.v1.endpoints.order.address.crud as address_crud
 import app.api.v1.endpoints.pizza_type.crud as pizza_type_crud
 import app.api.v1.endpoints.order.crud as order_crud
+import app.api.v1.endpoints.order.stock_logic.stock_availability_crud as stock_availability_crud
 import app.api.v1.endpoints.sauce.crud as sauce_crud
 from tests.integration.api.v1.helper import clear_db
 
@@ -123,8 +126,11 @@ def test_dough_create_read_update_delete(db):
     false_order = order_crud.get_order_by_id(uuid.UUID('00000000-0000-0000-0000-000000000000'), db)
     assert false_order is None
 
-    # Proof that we get correct order using id
-    resolved_order = order_crud.get_order_by_id(order.id, db)
+    # Proof that we get correct order using id, with the relationships asked for. The test shares its session, so the
+    # order is expired to be loaded again
+    db.expire(order)
+    resolved_order = order_crud.get_order_by_id(
+        order.id, db, selectinload(Order.beverages), selectinload(Order.pizzas))
     assert order.order_status == resolved_order.order_status
     assert order.order_datetime == resolved_order.order_datetime
     assert order.id == resolved_order.id
@@ -140,6 +146,9 @@ def test_dough_create_read_update_delete(db):
 
     order_price = order_crud.get_price_of_order(order.id, db)
     assert order_price == 5
+    assert order_crud.get_prices_of_orders([order.id, uuid.UUID('00000000-0000-0000-0000-000000000000')], db) \
+        == {order.id: 5}
+    assert order_crud.get_price_of_order(uuid.UUID('00000000-0000-0000-0000-000000000000'), db) is None
 
     order_crud.delete_pizza_from_order(order, pizza.id, db)
     pizzas_in_order = order_crud.get_all_pizzas_of_order(order, db)
@@ -163,3 +172,41 @@ def test_dough_create_read_update_delete(db):
     dough_crud.delete_dough_by_id(dough.id, db)
     sauce_crud.delete_sauce_by_id(sauce_id, db)
     user_crud.delete_user_by_id(user.id, db)
+
+
+def test_cart_availability_of_shared_topping(db):
+    clear_db(db)
+
+    # Arrange: Two pizza types sharing a topping for 7 units, each pizza needs 2 of it
+    dough = dough_crud.create_dough(
+        DoughCreateSchema(name='cart dough', stock=10, price=Decimal('1.00'), description=''), db)
+    topping = topping_crud.create_topping(
+        ToppingCreateSchema(name='cart topping', stock=7, price=Decimal('1.00'), description=''), db)
+    pizza_types = []
+    for name in ('first cart pizza type', 'second cart pizza type'):
+        pizza_type = pizza_type_crud.create_pizza_type(PizzaTypeCreateSchema(
+            name=name, price=Decimal('5.00'), description='', dough_id=dough.id, sauce_ids=[]), db)
+        pizza_type_crud.create_topping_quantity(
+            pizza_type, PizzaTypeToppingQuantityCreateSchema(topping_id=topping.id, quantity=2), db)
+        pizza_types.append(pizza_type)
+    first, second = pizza_types
+
+    # Act: Check 2 + 2 pizzas, which need 8 units of the topping
+    availability = stock_availability_crud.get_cart_availability({first.id: 2, second.id: 2}, {}, db)
+
+    # Assert: Next to the other line, only one more pizza of each type can be made
+    assert availability['available'] is False
+    assert [(line['max_quantity'], line['shortfall']) for line in availability['pizzas']] == [(1, 1), (1, 1)]
+    assert availability['shortfalls'] == [
+        {'kind': 'topping', 'id': topping.id, 'needed': 8, 'stock': 7, 'missing': 1},
+    ]
+
+    # Assert: 2 + 1 pizzas fit, unknown pizza types are reported
+    assert stock_availability_crud.get_cart_availability({first.id: 2, second.id: 1}, {}, db)['available'] is True
+    assert stock_availability_crud.get_cart_availability({uuid.uuid4(): 1}, {}, db) is None
+
+    # Clean up
+    for pizza_type in pizza_types:
+        pizza_type_crud.delete_pizza_type_by_id(pizza_type.id, db)
+    topping_crud.delete_topping_by_id(topping.id, db)
+    dough_crud.delete_dough_by_id(dough.id, db)
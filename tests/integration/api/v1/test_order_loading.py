@@ -0,0 +1,127 @@
+import uuid
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.orm import joinedload
+
+import app.api.v1.endpoints.dough.crud as dough_crud
+import app.api.v1.endpoints.order.crud as order_crud
+import app.api.v1.endpoints.pizza_type.crud as pizza_type_crud
+import app.api.v1.endpoints.user.crud as user_crud
+from app.api.v1.endpoints.dough.schemas import DoughCreateSchema
+from app.api.v1.endpoints.order.address.schemas import AddressCreateSchema
+from app.api.v1.endpoints.order.schemas import OrderCreateSchema, OrderSchema
+from app.api.v1.endpoints.pizza_type.schemas import PizzaTypeCreateSchema
+from app.api.v1.endpoints.user.schemas import UserCreateSchema
+from app.database.connection import SessionLocal, get_engine
+from app.database.models import Order
+from tests.integration.api.v1.helper import clear_db
+
+
+@pytest.fixture(scope='module')
+def db():
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def statements_of(function, *args):
+    statements = []
+
+    def count_statement(*event_args):
+        statements.append(event_args)
+
+    event.listen(get_engine(), 'before_cursor_execute', count_statement)
+    try:
+        result = function(*args)
+    finally:
+        event.remove(get_engine(), 'before_cursor_execute', count_statement)
+    return result, len(statements)
+
+
+def statements_of_order_list(db):
+    statements = []
+
+    def count_statement(*args):
+        statements.append(args)
+
+    db.expire_all()
+    event.listen(get_engine(), 'before_cursor_execute', count_statement)
+    try:
+        orders = [OrderSchema.from_orm(order) for order in order_crud.get_all_orders(db)]
+    finally:
+        event.remove(get_engine(), 'before_cursor_execute', count_statement)
+    return len(orders), len(statements)
+
+
+def test_order_list_loads_addresses_up_front(db):
+    clear_db(db)
+
+    # Arrange: A user with one order
+    user = user_crud.create_user(UserCreateSchema(username='eager user'), db)
+
+    def create_order(house_number):
+        address = AddressCreateSchema(
+            street='Seitenweg', post_code='64283', house_number=house_number,
+            country='Germany', town='Darmstadt', first_name='Test', last_name='User')
+        order_crud.create_order(OrderCreateSchema(user_id=user.id, address=address), db)
+
+    create_order(0)
+    number_of_orders, statements_of_one_order = statements_of_order_list(db)
+    assert number_of_orders == 1
+
+    # Act: List four more orders
+    for house_number in range(1, 5):
+        create_order(house_number)
+    number_of_orders, statements_of_five_orders = statements_of_order_list(db)
+
+    # Assert: The orders and their addresses take the same queries, however many orders there are
+    assert number_of_orders == 5
+    assert statements_of_five_orders == statements_of_one_order == 2
+
+    # Clean up
+    user_crud.delete_user_by_id(user.id, db)
+
+
+def test_single_lookups_load_only_what_they_are_asked_for(db):
+    clear_db(db)
+
+    # Arrange: An order and two pizza types
+    user = user_crud.create_user(UserCreateSchema(username='lookup user'), db)
+    address = AddressCreateSchema(
+        street='Seitenweg', post_code='64283', house_number=1,
+        country='Germany', town='Darmstadt', first_name='Test', last_name='User')
+    order = order_crud.create_order(OrderCreateSchema(user_id=user.id, address=address), db)
+    dough = dough_crud.create_dough(
+        DoughCreateSchema(name='lookup dough', price=Decimal('1.00'), description='', stock=5), db)
+    pizza_types = [
+        pizza_type_crud.create_pizza_type(PizzaTypeCreateSchema(
+            name='lookup pizza {}'.format(number), price=Decimal('5.00'), description='', dough_id=dough.id,
+            sauce_ids=[]), db)
+        for number in range(2)]
+    order_id, pizza_type_ids = order.id, {pizza_type.id for pizza_type in pizza_types}
+
+    # Act: Load the order as GET /v1/order/{order_id} does, in a session of its own like a request, and serialize it
+    request_db = SessionLocal()
+    try:
+        order_schema, statements_of_order = statements_of(
+            lambda: OrderSchema.from_orm(order_crud.get_order_by_id(order_id, request_db, joinedload(Order.address))))
+    finally:
+        request_db.close()
+
+    # Assert: One query for the order and its address, none for its items
+    assert order_schema.address.house_number == 1
+    assert statements_of_order == 1
+
+    # Act & Assert: Checking the pizza types of a checkout takes one query, however many there are
+    assert statements_of(pizza_type_crud.pizza_types_exist, pizza_type_ids, db) == (True, 1)
+    assert statements_of(pizza_type_crud.pizza_types_exist, pizza_type_ids | {uuid.uuid4()}, db) == (False, 1)
+
+    # Clean up
+    user_crud.delete_user_by_id(user.id, db)
+    for pizza_type in pizza_types:
+        pizza_type_crud.delete_pizza_type_by_id(pizza_type.id, db)
+    dough_crud.delete_dough_by_id(dough.id, db)
@@ -0,0 +1,235 @@
+import threading
+from datetime import timedelta
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import func, update
+
+import app.api.v1.endpoints.beverage.crud as beverage_crud
+import app.api.v1.endpoints.dough.crud as dough_crud
+import app.api.v1.endpoints.order.address.crud as address_crud
+import app.api.v1.endpoints.order.crud as order_crud
+import app.api.v1.endpoints.order.stock_logic.stock_beverage_crud as stock_beverage_crud
+import app.api.v1.endpoints.order.stock_logic.stock_ledger_crud as stock_ledger_crud
+import app.api.v1.endpoints.order.stock_logic.stock_reservation_crud as stock_reservation_crud
+import app.api.v1.endpoints.pizza_type.crud as pizza_type_crud
+import app.api.v1.endpoints.user.crud as user_crud
+from app.api.v1.endpoints.beverage.schemas import BeverageCreateSchema
+from app.api.v1.endpoints.dough.schemas import DoughCreateSchema
+from app.api.v1.endpoints.order.address.schemas import AddressCreateSchema
+from app.api.v1.endpoints.order.schemas import (
+    OrderBeverageQuantityCreateSchema, OrderCheckoutSchema, OrderPizzaQuantitySchema,
+)
+from app.api.v1.endpoints.pizza_type.schemas import PizzaTypeCreateSchema
+from app.api.v1.endpoints.user.schemas import UserCreateSchema
+from app.database.connection import SessionLocal
+from app.database.models import Order, OrderStatus
+from tests.integration.api.v1.helper import clear_db
+
+
+@pytest.fixture(scope='module')
+def db():
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def expire(order_id, db):
+    # Moves the expiry of the reservation into the past
+    db.execute(update(Order).where(Order.id == order_id).values(reserved_until=func.now() - timedelta(seconds=1)))
+    db.commit()
+
+
+def test_expired_reservations_are_released(db):
+    clear_db(db)
+
+    # Arrange: Two orders of 2 pizzas and 3 beverages each
+    dough = dough_crud.create_dough(
+        DoughCreateSchema(name='reservation dough', stock=10, price=Decimal('1.00'), description=''), db)
+    beverage = beverage_crud.create_beverage(
+        BeverageCreateSchema(name='reservation beverage', stock=10, price=Decimal('1.00'), description=''), db)
+    pizza_type = pizza_type_crud.create_pizza_type(PizzaTypeCreateSchema(
+        name='reservation pizza type', price=Decimal('5.00'), description='', dough_id=dough.id, sauce_ids=[]), db)
+    user = user_crud.create_user(UserCreateSchema(username='reservation user'), db)
+    address = AddressCreateSchema(
+        street='Testweg', post_code='64283', house_number=1,
+        country='Germany', town='Darmstadt', first_name='Test', last_name='User')
+    orders = [order_crud.checkout_order(OrderCheckoutSchema(
+        user_id=user.id, address=address,
+        pizzas=[OrderPizzaQuantitySchema(pizza_type_id=pizza_type.id, quantity=2)],
+        beverages=[OrderBeverageQuantityCreateSchema(beverage_id=beverage.id, quantity=3)],
+    ), db) for _ in range(2)]
+    order_ids = [order.id for order in orders]
+    assert all(order.reserved_until is not None for order in orders)
+
+    # Act: Both reservations expire, but the second order is being made
+    for order_id in order_ids:
+        expire(order_id, db)
+    order_crud.update_order_status(orders[1], OrderStatus.PREPARING, db)
+    assert stock_reservation_crud.release_expired_reservations(db) == 1
+
+    # Assert: Only the stock of the first order is back, the order is kept as EXPIRED with its items
+    db.expire_all()
+    expired_order = order_crud.get_order_by_id(order_ids[0], db)
+    assert (expired_order.order_status, expired_order.reserved_until) == (OrderStatus.EXPIRED, None)
+    assert len(order_crud.get_all_pizzas_of_order(expired_order, db)) == 2
+    assert db.get(Order, order_ids[1]).reserved_until is None
+    assert (dough_crud.get_dough_by_id(dough.id, db).stock, beverage_crud.get_beverage_by_id(beverage.id, db).stock) \
+        == (8, 7)
+    assert stock_reservation_crud.release_expired_reservations(db) == 0
+    assert stock_ledger_crud.find_stock_drift(db) == []
+
+    # Act: Add to the expired order, then delete it
+    assert not stock_beverage_crud.change_stock_of_beverage(beverage.id, -1, db, order_ids[0])
+    assert order_crud.delete_order_by_id(order_ids[0], db)
+
+    # Assert: Its stock is not put back twice
+    assert (dough_crud.get_dough_by_id(dough.id, db).stock, beverage_crud.get_beverage_by_id(beverage.id, db).stock) \
+        == (8, 7)
+
+    # Act: A third order expires, but a change extends its reservation before the sweeper runs
+    order = order_crud.checkout_order(OrderCheckoutSchema(user_id=user.id, address=address), db)
+    expire(order.id, db)
+    assert stock_beverage_crud.change_stock_of_beverage(beverage.id, -1, db, order.id)
+
+    # Assert: The order keeps its reservation
+    assert stock_reservation_crud.release_expired_reservations(db) == 0
+    stock_beverage_crud.change_stock_of_beverage(beverage.id, 1, db, order.id)
+
+    # Clean up
+    user_crud.delete_user_by_id(user.id, db)
+    pizza_type_crud.delete_pizza_type_by_id(pizza_type.id, db)
+    dough_crud.delete_dough_by_id(dough.id, db)
+    beverage_crud.delete_beverage_by_id(beverage.id, db)
+
+
+def test_deleted_and_expired_order_is_released_once(db):
+    clear_db(db)
+
+    # Arrange: An expired order of 2 pizzas and 3 beverages
+    dough = dough_crud.create_dough(
+        DoughCreateSchema(name='release dough', stock=10, price=Decimal('1.00'), description=''), db)
+    beverage = beverage_crud.create_beverage(
+        BeverageCreateSchema(name='release beverage', stock=10, price=Decimal('1.00'), description=''), db)
+    pizza_type = pizza_type_crud.create_pizza_type(PizzaTypeCreateSchema(
+        name='release pizza type', price=Decimal('5.00'), description='', dough_id=dough.id, sauce_ids=[]), db)
+    user = user_crud.create_user(UserCreateSchema(username='release user'), db)
+    address = AddressCreateSchema(
+        street='Testweg', post_code='64283', house_number=1,
+        country='Germany', town='Darmstadt', first_name='Test', last_name='User')
+    order = order_crud.checkout_order(OrderCheckoutSchema(
+        user_id=user.id, address=address,
+        pizzas=[OrderPizzaQuantitySchema(pizza_type_id=pizza_type.id, quantity=2)],
+        beverages=[OrderBeverageQuantityCreateSchema(beverage_id=beverage.id, quantity=3)],
+    ), db)
+    order_id, address_id = order.id, order.address_id
+    expire(order_id, db)
+
+    # Act: The sweeper expires the order, a request deletes it meanwhile and waits for the row
+    deleted = []
+
+    def delete():
+        request_db = SessionLocal()
+        try:
+            deleted.append(order_crud.delete_order_by_id(order_id, request_db))
+        finally:
+            request_db.close()
+
+    sweeper = SessionLocal()
+    try:
+        released = stock_reservation_crud.expire_orders(sweeper, Order.id == order_id)
+        request = threading.Thread(target=delete)
+        request.start()
+        request.join(0.5)
+        assert request.is_alive()
+        sweeper.commit()
+        request.join()
+    finally:
+        sweeper.close()
+
+    # Assert: The request deleted the expired order with its address, only the sweeper restocked it
+    assert released == [order_id]
+    assert deleted == [True]
+    db.expire_all()
+    assert (dough_crud.get_dough_by_id(dough.id, db).stock, beverage_crud.get_beverage_by_id(beverage.id, db).stock) \
+        == (10, 10)
+    assert stock_ledger_crud.find_stock_drift(db) == []
+    assert address_crud.get_address_by_id(address_id, db) is None
+
+    # Act: A second order is deleted by a request
+    order = order_crud.checkout_order(OrderCheckoutSchema(
+        user_id=user.id, address=address,
+        pizzas=[OrderPizzaQuantitySchema(pizza_type_id=pizza_type.id, quantity=2)],
+    ), db)
+    order_id, deleted_address_id = order.id, order.address_id
+    assert order_crud.delete_order_by_id(order_id, db)
+
+    # Assert: The request deletes the address with the order
+    assert dough_crud.get_dough_by_id(dough.id, db).stock == 10
+    assert address_crud.get_address_by_id(deleted_address_id, db) is None
+    assert order_crud.delete_order_by_id(order_id, db) is False
+
+    # Clean up
+    user_crud.delete_user_by_id(user.id, db)
+    pizza_type_crud.delete_pizza_type_by_id(pizza_type.id, db)
+    dough_crud.delete_dough_by_id(dough.id, db)
+    beverage_crud.delete_beverage_by_id(beverage.id, db)
+
+
+def test_concurrent_beverage_updates_apply_their_change_once(db):
+    clear_db(db)
+
+    # Arrange: An order of 3 beverages
+    beverage = beverage_crud.create_beverage(
+        BeverageCreateSchema(name='update beverage', stock=10, price=Decimal('1.00'), description=''), db)
+    user = user_crud.create_user(UserCreateSchema(username='update user'), db)
+    address = AddressCreateSchema(
+        street='Testweg', post_code='64283', house_number=1,
+        country='Germany', town='Darmstadt', first_name='Test', last_name='User')
+    order = order_crud.checkout_order(OrderCheckoutSchema(
+        user_id=user.id, address=address,
+        beverages=[OrderBeverageQuantityCreateSchema(beverage_id=beverage.id, quantity=3)],
+    ), db)
+    order_id = order.id
+
+    def update_quantity(new_quantity, session):
+        old_quantity = order_crud.update_beverage_quantity_of_order(order_id, beverage.id, new_quantity, session)
+        return stock_beverage_crud.change_stock_of_beverage(beverage.id, old_quantity - new_quantity, session, order_id)
+
+    # Act: One request sets the quantity to 5, another one sets it to 1 meanwhile and waits for the line
+    updated = []
+
+    def update():
+        request_db = SessionLocal()
+        try:
+            updated.append(update_quantity(1, request_db))
+        finally:
+            request_db.close()
+
+    first = SessionLocal()
+    try:
+        old_quantity = order_crud.update_beverage_quantity_of_order(order_id, beverage.id, 5, first)
+        request = threading.Thread(target=update)
+        request.start()
+        request.join(0.5)
+        assert request.is_alive()
+        assert stock_beverage_crud.change_stock_of_beverage(beverage.id, old_quantity - 5, first, order_id)
+        request.join()
+    finally:
+        first.close()
+
+    # Assert: The second request applied its change to the quantity of the first one
+    assert updated == [True]
+    db.expire_all()
+    assert order_crud.get_beverage_quantity_by_id(order_id, beverage.id, db).quantity == 1
+    assert beverage_crud.get_beverage_by_id(beverage.id, db).stock == 9
+    assert stock_ledger_crud.find_stock_drift(db) == []
+    assert order_crud.update_beverage_quantity_of_order(order_id, order_id, 1, db) is None
+
+    # Clean up
+    db.rollback()
+    assert order_crud.delete_order_by_id(order_id, db)
+    user_crud.delete_user_by_id(user.id, db)
+    beverage_crud.delete_beverage_by_id(beverage.id, db)
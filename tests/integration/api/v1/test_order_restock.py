@@ -0,0 +1,201 @@
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import event
+
+import app.api.v1.endpoints.beverage.crud as beverage_crud
+import app.api.v1.endpoints.dough.crud as dough_crud
+import app.api.v1.endpoints.order.crud as order_crud
+import app.api.v1.endpoints.order.stock_logic.stock_ledger_crud as stock_ledger_crud
+import app.api.v1.endpoints.pizza_type.crud as pizza_type_crud
+import app.api.v1.endpoints.topping.crud as topping_crud
+import app.api.v1.endpoints.user.crud as user_crud
+from app.api.v1.endpoints.beverage.schemas import BeverageCreateSchema
+from app.api.v1.endpoints.dough.schemas import DoughCreateSchema
+from app.api.v1.endpoints.order.address.schemas import AddressCreateSchema
+from app.api.v1.endpoints.order.schemas import (
+    OrderBeverageQuantityCreateSchema, OrderCheckoutSchema, OrderPizzaQuantitySchema,
+)
+from app.api.v1.endpoints.pizza_type.schemas import PizzaTypeCreateSchema, PizzaTypeToppingQuantityCreateSchema
+from app.api.v1.endpoints.topping.schemas import ToppingCreateSchema
+from app.api.v1.endpoints.user.schemas import UserCreateSchema
+from app.database.connection import SessionLocal, get_engine
+from tests.integration.api.v1.helper import clear_db
+
+
+@pytest.fixture(scope='module')
+def db():
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def statements_and_commits_of(function, *args):
+    statements, commits = [], []
+
+    def count_statement(*event_args):
+        statements.append(event_args)
+
+    def count_commit(*event_args):
+        commits.append(event_args)
+
+    event.listen(get_engine(), 'before_cursor_execute', count_statement)
+    event.listen(get_engine(), 'commit', count_commit)
+    try:
+        result = function(*args)
+    finally:
+        event.remove(get_engine(), 'before_cursor_execute', count_statement)
+        event.remove(get_engine(), 'commit', count_commit)
+    return result, len(statements), len(commits)
+
+
+def create_menu(db):
+    dough = dough_crud.create_dough(
+        DoughCreateSchema(name='restock dough', stock=50, price=Decimal('1.00'), description=''), db)
+    topping = topping_crud.create_topping(
+        ToppingCreateSchema(name='restock topping', stock=100, price=Decimal('0.50'), description=''), db)
+    other_topping = topping_crud.create_topping(
+        ToppingCreateSchema(name='other restock topping', stock=100, price=Decimal('0.50'), description=''), db)
+    beverage = beverage_crud.create_beverage(
+        BeverageCreateSchema(name='restock beverage', stock=20, price=Decimal('2.00'), description=''), db)
+    pizza_type = pizza_type_crud.create_pizza_type(PizzaTypeCreateSchema(
+        name='restock pizza type', price=Decimal('5.00'), description='', dough_id=dough.id, sauce_ids=[]), db)
+    pizza_type_crud.create_topping_quantity(
+        pizza_type, PizzaTypeToppingQuantityCreateSchema(topping_id=topping.id, quantity=2), db)
+    pizza_type_crud.create_topping_quantity(
+        pizza_type, PizzaTypeToppingQuantityCreateSchema(topping_id=other_topping.id, quantity=1), db)
+    return dough, topping, other_topping, beverage, pizza_type
+
+
+def stocks(db, dough, topping, other_topping, beverage):
+    db.expire_all()
+    return (
+        dough_crud.get_dough_by_id(dough.id, db).stock,
+        topping_crud.get_topping_by_id(topping.id, db).stock,
+        topping_crud.get_topping_by_id(other_topping.id, db).stock,
+        beverage_crud.get_beverage_by_id(beverage.id, db).stock,
+    )
+
+
+def test_deleting_an_order_restocks_it_in_one_transaction(db):
+    clear_db(db)
+
+    # Arrange: A pizza type of one dough, 2 of one topping and 1 of another
+    dough, topping, other_topping, beverage, pizza_type = create_menu(db)
+    user = user_crud.create_user(UserCreateSchema(username='restock user'), db)
+    address = AddressCreateSchema(
+        street='Testweg', post_code='64283', house_number=1,
+        country='Germany', town='Darmstadt', first_name='Test', last_name='User')
+
+    def checkout(pizzas, beverages):
+        return order_crud.checkout_order(OrderCheckoutSchema(
+            user_id=user.id, address=address,
+            pizzas=[OrderPizzaQuantitySchema(pizza_type_id=pizza_type.id, quantity=pizzas)],
+            beverages=[OrderBeverageQuantityCreateSchema(beverage_id=beverage.id, quantity=beverages)],
+        ), db)
+
+    # Act: Delete an order of 1 pizza and 1 beverage
+    small_order = checkout(1, 1)
+    assert stocks(db, dough, topping, other_topping, beverage) == (49, 98, 99, 19)
+    deleted, statements_of_small_order, commits_of_small_order = statements_and_commits_of(
+        order_crud.delete_order_by_id, small_order.id, db)
+
+    # Assert: Every ingredient and beverage is back, with one commit
+    assert deleted
+    assert stocks(db, dough, topping, other_topping, beverage) == (50, 100, 100, 20)
+    assert commits_of_small_order == 1
+
+    # Act: Delete an order of 20 pizzas and 5 beverages
+    large_order = checkout(20, 5)
+    assert stocks(db, dough, topping, other_topping, beverage) == (30, 60, 80, 15)
+    deleted, statements_of_large_order, commits_of_large_order = statements_and_commits_of(
+        order_crud.delete_order_by_id, large_order.id, db)
+
+    # Assert: The restock takes as many statements as for one pizza
+    assert deleted
+    assert stocks(db, dough, topping, other_topping, beverage) == (50, 100, 100, 20)
+    assert commits_of_large_order == 1
+    assert statements_of_large_order == statements_of_small_order
+    assert stock_ledger_crud.find_stock_drift(db) == []
+
+    # Clean up
+    user_crud.delete_user_by_id(user.id, db)
+    pizza_type_crud.delete_pizza_type_by_id(pizza_type.id, db)
+    dough_crud.delete_dough_by_id(dough.id, db)
+    topping_crud.delete_topping_by_id(topping.id, db)
+    topping_crud.delete_topping_by_id(other_topping.id, db)
+    beverage_crud.delete_beverage_by_id(beverage.id, db)
+
+
+def test_deleting_a_pizza_restocks_only_its_ingredients(db):
+    clear_db(db)
+
+    # Arrange: Two orders of 2 pizzas each
+    dough, topping, other_topping, beverage, pizza_type = create_menu(db)
+    user = user_crud.create_user(UserCreateSchema(username='restock pizza user'), db)
+    address = AddressCreateSchema(
+        street='Testweg', post_code='64283', house_number=1,
+        country='Germany', town='Darmstadt', first_name='Test', last_name='User')
+    order, other_order = [order_crud.checkout_order(OrderCheckoutSchema(
+        user_id=user.id, address=address,
+        pizzas=[OrderPizzaQuantitySchema(pizza_type_id=pizza_type.id, quantity=2)],
+    ), db) for _ in range(2)]
+    pizza = order_crud.get_all_pizzas_of_order(order, db)[0]
+    assert stocks(db, dough, topping, other_topping, beverage) == (46, 92, 96, 20)
+
+    # Act: Delete one pizza of the first order, twice
+    assert order_crud.delete_pizza_from_order(order, pizza.id, db)
+    assert not order_crud.delete_pizza_from_order(order, pizza.id, db)
+
+    # Assert: The ingredients of that pizza are back once, the other pizzas keep theirs
+    assert stocks(db, dough, topping, other_topping, beverage) == (47, 94, 97, 20)
+    assert len(order_crud.get_all_pizzas_of_order(order, db)) == 1
+    assert len(order_crud.get_all_pizzas_of_order(other_order, db)) == 2
+    assert stock_ledger_crud.find_stock_drift(db) == []
+
+    # Clean up
+    assert order_crud.delete_order_by_id(order.id, db)
+    assert order_crud.delete_order_by_id(other_order.id, db)
+    assert stocks(db, dough, topping, other_topping, beverage) == (50, 100, 100, 20)
+    user_crud.delete_user_by_id(user.id, db)
+    pizza_type_crud.delete_pizza_type_by_id(pizza_type.id, db)
+    dough_crud.delete_dough_by_id(dough.id, db)
+    topping_crud.delete_topping_by_id(topping.id, db)
+    topping_crud.delete_topping_by_id(other_topping.id, db)
+    beverage_crud.delete_beverage_by_id(beverage.id, db)
+
+
+def test_deleting_a_beverage_line_restocks_it_once(db):
+    clear_db(db)
+
+    # Arrange: An order of 3 beverages
+    dough, topping, other_topping, beverage, pizza_type = create_menu(db)
+    user = user_crud.create_user(UserCreateSchema(username='restock beverage user'), db)
+    address = AddressCreateSchema(
+        street='Testweg', post_code='64283', house_number=1,
+        country='Germany', town='Darmstadt', first_name='Test', last_name='User')
+    order = order_crud.checkout_order(OrderCheckoutSchema(
+        user_id=user.id, address=address,
+        beverages=[OrderBeverageQuantityCreateSchema(beverage_id=beverage.id, quantity=3)],
+    ), db)
+    assert stocks(db, dough, topping, other_topping, beverage) == (50, 100, 100, 17)
+
+    # Act: Delete the beverage line twice
+    assert order_crud.delete_beverage_from_order(order.id, beverage.id, db)
+    assert not order_crud.delete_beverage_from_order(order.id, beverage.id, db)
+
+    # Assert: The beverages are back once
+    assert stocks(db, dough, topping, other_topping, beverage) == (50, 100, 100, 20)
+    assert order_crud.get_beverage_quantity_by_id(order.id, beverage.id, db) is None
+    assert stock_ledger_crud.find_stock_drift(db) == []
+
+    # Clean up
+    assert order_crud.delete_order_by_id(order.id, db)
+    user_crud.delete_user_by_id(user.id, db)
+    pizza_type_crud.delete_pizza_type_by_id(pizza_type.id, db)
+    dough_crud.delete_dough_by_id(dough.id, db)
+    topping_crud.delete_topping_by_id(topping.id, db)
+    topping_crud.delete_topping_by_id(other_topping.id, db)
+    beverage_crud.delete_beverage_by_id(beverage.id, db)
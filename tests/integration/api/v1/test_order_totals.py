@@ -0,0 +1,103 @@
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import update
+
+import app.api.v1.endpoints.beverage.crud as beverage_crud
+import app.api.v1.endpoints.dough.crud as dough_crud
+import app.api.v1.endpoints.order.crud as order_crud
+import app.api.v1.endpoints.pizza_type.crud as pizza_type_crud
+import app.api.v1.endpoints.user.crud as user_crud
+from app.api.v1.endpoints.beverage.schemas import BeverageCreateSchema
+from app.api.v1.endpoints.dough.schemas import DoughCreateSchema
+from app.api.v1.endpoints.order.address.schemas import AddressCreateSchema
+from app.api.v1.endpoints.order.schemas import (
+    OrderBeverageQuantityCreateSchema, OrderCheckoutSchema, OrderCreateSchema, OrderPizzaQuantitySchema,
+)
+from app.api.v1.endpoints.pizza_type.schemas import PizzaTypeCreateSchema
+from app.api.v1.endpoints.user.schemas import UserCreateSchema
+from app.database.connection import SessionLocal
+from app.database.models import Order
+from tests.integration.api.v1.helper import clear_db
+
+
+@pytest.fixture(scope='module')
+def db():
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def totals(order, db):
+    db.refresh(order)
+    return order.total_price, order.pizza_count, order.beverage_count
+
+
+def test_order_totals_follow_the_items(db):
+    clear_db(db)
+
+    # Arrange: A pizza type for 5.00 and a beverage for 2.50
+    dough = dough_crud.create_dough(
+        DoughCreateSchema(name='totals dough', stock=20, price=Decimal('1.00'), description=''), db)
+    beverage = beverage_crud.create_beverage(
+        BeverageCreateSchema(name='totals beverage', stock=20, price=Decimal('2.50'), description=''), db)
+    pizza_type_schema = PizzaTypeCreateSchema(
+        name='totals pizza type', price=Decimal('5.00'), description='', dough_id=dough.id, sauce_ids=[])
+    pizza_type = pizza_type_crud.create_pizza_type(pizza_type_schema, db)
+    user = user_crud.create_user(UserCreateSchema(username='totals user'), db)
+    address = AddressCreateSchema(
+        street='Testweg', post_code='64283', house_number=1,
+        country='Germany', town='Darmstadt', first_name='Test', last_name='User')
+
+    # Act & Assert: Every path changing the items of an order keeps its totals
+    order = order_crud.checkout_order(OrderCheckoutSchema(
+        user_id=user.id, address=address,
+        pizzas=[OrderPizzaQuantitySchema(pizza_type_id=pizza_type.id, quantity=2)],
+        beverages=[OrderBeverageQuantityCreateSchema(beverage_id=beverage.id, quantity=3)],
+    ), db)
+    assert totals(order, db) == (Decimal('17.50'), 2, 3)
+
+    order_crud.add_pizzas_to_order(order, {pizza_type.id: 1}, db)
+    assert totals(order, db) == (Decimal('22.50'), 3, 3)
+
+    order_crud.update_beverage_quantity_of_order(order.id, beverage.id, 1, db)
+    assert totals(order, db) == (Decimal('17.50'), 3, 1)
+
+    pizza = order_crud.add_pizza_to_order(order, pizza_type, db)
+    order_crud.delete_pizza_from_order(order, pizza.id, db)
+    order_crud.delete_beverage_from_order(order.id, beverage.id, db)
+    assert totals(order, db) == (Decimal('15.00'), 3, 0)
+
+    copied_order = order_crud.copy_order(
+        OrderCreateSchema(user_id=user.id, address=address.copy(update={'street': 'Kopieweg'})), order.id, db)
+    assert totals(copied_order, db) == (Decimal('15.00'), 3, 0)
+
+    # Ordered pizzas keep their price, new pizzas and copies cost the new one
+    pizza_type_crud.update_pizza_type(pizza_type, pizza_type_schema.copy(update={'price': Decimal('6.00')}), db)
+    assert totals(order, db) == (Decimal('15.00'), 3, 0)
+    assert order_crud.get_price_of_order(order.id, db) == Decimal('15.00')
+
+    order_crud.add_pizza_to_order(order, pizza_type, db)
+    assert totals(order, db) == (Decimal('21.00'), 4, 0)
+    assert order_crud.get_price_of_order(order.id, db) == Decimal('21.00')
+
+    copied_order = order_crud.copy_order(
+        OrderCreateSchema(user_id=user.id, address=address.copy(update={'street': 'Neuweg'})), order.id, db)
+    assert totals(copied_order, db) == (Decimal('24.00'), 4, 0)
+    assert order_crud.find_order_total_drift(db) == []
+
+    # Act: A write bypassing the ORM and the refresh
+    db.execute(update(Order).where(Order.id == order.id).values(pizza_count=5))
+    db.commit()
+
+    # Assert: The drift is found
+    assert order_crud.find_order_total_drift(db) == [
+        {'order_id': order.id, 'stored': (Decimal('21.00'), 5, 0), 'computed': (Decimal('21.00'), 4, 0)}]
+
+    # Clean up
+    user_crud.delete_user_by_id(user.id, db)
+    pizza_type_crud.delete_pizza_type_by_id(pizza_type.id, db)
+    dough_crud.delete_dough_by_id(dough.id, db)
+    beverage_crud.delete_beverage_by_id(beverage.id, db)
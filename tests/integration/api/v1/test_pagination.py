@@ -0,0 +1,68 @@
+import datetime
+import uuid
+
+import pytest
+from fastapi import HTTPException
+
+import app.api.v1.endpoints.order.crud as order_crud
+import app.api.v1.endpoints.user.crud as user_crud
+from app.api.v1.endpoints.order.address.schemas import AddressCreateSchema
+from app.api.v1.endpoints.order.schemas import OrderCreateSchema
+from app.api.v1.endpoints.user.schemas import UserCreateSchema
+from app.api.v1.pagination import PageParams, encode_cursor
+from app.database.connection import SessionLocal
+from tests.integration.api.v1.helper import clear_db
+
+
+@pytest.fixture(scope='module')
+def db():
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def pages_of_orders(db, limit):
+    pages, after = [], None
+    while True:
+        orders = order_crud.get_all_orders(db, after=after, limit=limit)
+        pages.append([order.id for order in orders[:limit]])
+        if len(orders) <= limit:
+            return pages
+        page = PageParams(cursor=encode_cursor(orders[limit - 1].order_datetime.isoformat(), orders[limit - 1].id),
+                          limit=limit)
+        after = page.after(datetime.datetime.fromisoformat, uuid.UUID)
+
+
+def test_keyset_pagination(db):
+    clear_db(db)
+
+    # Arrange: A user with five orders
+    user = user_crud.create_user(UserCreateSchema(username='paged user'), db)
+    order_ids = []
+    for house_number in range(5):
+        address = AddressCreateSchema(
+            street='Seitenweg', post_code='64283', house_number=house_number,
+            country='Germany', town='Darmstadt', first_name='Test', last_name='User')
+        order_ids.append(order_crud.create_order(OrderCreateSchema(user_id=user.id, address=address), db).id)
+
+    # Act: Page through the orders two at a time
+    pages = pages_of_orders(db, 2)
+
+    # Assert: Every order once, in the order of the unpaged list
+    assert [len(page) for page in pages] == [2, 2, 1]
+    assert [order_id for page in pages for order_id in page] == [order.id for order in order_crud.get_all_orders(db)]
+    assert sorted(order_id for page in pages for order_id in page) == sorted(order_ids)
+
+    # Act & Assert: Users page by id
+    first_page = user_crud.get_all_users(db, limit=1)
+    assert len(first_page) == 1
+    assert user_crud.get_all_users(db, after=(first_page[0].id,), limit=1) == []
+
+    # Act & Assert: A cursor that wasn't issued is rejected
+    with pytest.raises(HTTPException):
+        PageParams(cursor='not a cursor', limit=2).after(datetime.datetime.fromisoformat, uuid.UUID)
+
+    # Clean up
+    user_crud.delete_user_by_id(user.id, db)
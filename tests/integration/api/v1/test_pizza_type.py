@@ -1,6 +1,8 @@
 from decimal import Decimal
 import uuid
 import pytest
+from sqlalchemy import event
+from sqlalchemy.orm import selectinload
 
 import app.api.v1.endpoints.dough.crud as dough_crud
 import app.api.v1.endpoints.pizza_type.crud as pizza_type_crud
@@ -10,7 +12,8 @@ from app.api.v1.endpoints.dough.schemas import DoughCreateSchema
 from app.api.v1.endpoints.pizza_type.schemas import PizzaTypeCreateSchema, PizzaTypeToppingQuantityCreateSchema
 from app.api.v1.endpoints.sauce.schemas import SauceCreateSchema, SpiceLevel
 from app.api.v1.endpoints.topping.schemas import ToppingCreateSchema
-from app.database.connection import SessionLocal
+from app.database.connection import SessionLocal, get_engine
+from app.database.models import PizzaType
 from tests.integration.api.v1.helper import clear_db
 import app.api.v1.endpoints.sauce.crud as sauce_crud
 
@@ -101,8 +104,9 @@ def test_pizza_type_create_read_update_delete(db):
     pizza_types = pizza_type_crud.get_all_pizza_types(db)
     assert len(pizza_types) == number_of_pizza_types_before + 1
 
-    # Act: Re-read pizza type from database
-    pizza_type = pizza_type_crud.get_pizza_type_by_id(created_pizza_type_id, db)
+    # Act: Re-read pizza type from database, with its sauces
+    db.expire_all()
+    pizza_type = pizza_type_crud.get_pizza_type_by_id(created_pizza_type_id, db, selectinload(PizzaType.sauces))
 
     # Assert: Proof correct values of pizza type in database
     assert pizza_type.name == new_pizza_type_name
@@ -143,7 +147,7 @@ def test_pizza_type_create_read_update_delete(db):
     assert pizza_type.description == new_pizza_type_description
     assert pizza_type.price == new_pizza_type_price
     assert pizza_type.dough_id == new_pizza_type_dough_id
-    assert pizza_type.sauces[0].sauce_id == sauce_id
+    assert pizza_type.id == created_pizza_type_id
 
     # Act: Change pizza type price
     changed_pizza_type = PizzaTypeCreateSchema(
@@ -258,3 +262,74 @@ def test_pizza_type_create_read_update_delete(db):
 
     # Act: Delete sauce
     sauce_crud.delete_sauce_by_id(sauce_id, db)
+
+
+def test_pizza_type_max_makeable(db):
+    clear_db(db)
+
+    # Arrange: Pizza type with a dough for 10 pizzas and a topping for 3 pizzas (7 // 2)
+    dough = dough_crud.create_dough(
+        DoughCreateSchema(name='makeable dough', stock=10, price=Decimal('1.00'), description=''), db)
+    topping = topping_crud.create_topping(
+        ToppingCreateSchema(name='makeable topping', stock=7, price=Decimal('1.00'), description=''), db)
+    pizza_type = pizza_type_crud.create_pizza_type(PizzaTypeCreateSchema(
+        name='makeable pizza type', price=Decimal('5.00'), description='', dough_id=dough.id, sauce_ids=[]), db)
+
+    # Assert: Without toppings the dough limits the count
+    assert pizza_type.max_makeable == 10
+
+    # Act: Add topping quantity
+    pizza_type_crud.create_topping_quantity(
+        pizza_type, PizzaTypeToppingQuantityCreateSchema(topping_id=topping.id, quantity=2), db)
+
+    # Assert: The topping limits the count
+    assert pizza_type.max_makeable == 3
+
+    # Act: Take the ingredients of one pizza from stock
+    assert stock_ingredients_crud.reduce_stock_of_ingredients(pizza_type, db)
+
+    # Assert: 5 // 2 pizzas are left
+    assert pizza_type.max_makeable == 2
+
+    # Act: Put the ingredients back
+    stock_ingredients_crud.increase_stock_of_ingredients(pizza_type, db)
+    assert pizza_type.max_makeable == 3
+
+    # Act: Take stock twice and flush in between, within one transaction
+    statements = []
+
+    def count_statement(conn, cursor, statement, *args):
+        if statement.startswith('UPDATE pizza_type'):
+            statements.append(statement)
+
+    event.listen(get_engine(), 'before_cursor_execute', count_statement)
+    try:
+        assert stock_ingredients_crud.take_ingredient_demand({dough.id: 1}, {topping.id: 2}, db)
+        db.flush()
+        assert stock_ingredients_crud.take_ingredient_demand({dough.id: 1}, {topping.id: 2}, db)
+        assert statements == []
+        db.commit()
+    finally:
+        event.remove(get_engine(), 'before_cursor_execute', count_statement)
+
+    # Assert: max_makeable is refreshed once, on commit
+    assert len(statements) == 1
+    assert pizza_type.max_makeable == 1
+    stock_ingredients_crud.increase_stock_of_ingredients(pizza_type, db)
+    stock_ingredients_crud.increase_stock_of_ingredients(pizza_type, db)
+    assert pizza_type.max_makeable == 3
+
+    # Act: Update dough stock
+    dough_crud.update_dough(
+        dough, DoughCreateSchema(name='makeable dough', stock=1, price=Decimal('1.00'), description=''), db)
+
+    # Assert: The dough limits the count again
+    db.refresh(pizza_type)
+    assert pizza_type.max_makeable == 1
+    assert stock_ingredients_crud.ingredients_are_available(pizza_type) is True
+    assert stock_ingredients_crud.ingredients_are_available(pizza_type, 2) is False
+
+    # Clean up
+    pizza_type_crud.delete_pizza_type_by_id(pizza_type.id, db)
+    topping_crud.delete_topping_by_id(topping.id, db)
+    dough_crud.delete_dough_by_id(dough.id, db)
@@ -0,0 +1,195 @@
+import threading
+from decimal import Decimal
+
+import pytest
+
+import app.api.v1.endpoints.dough.crud as dough_crud
+import app.api.v1.endpoints.order.crud as order_crud
+import app.api.v1.endpoints.order.stock_logic.stock_crud as stock_crud
+import app.api.v1.endpoints.order.stock_logic.stock_ledger_crud as stock_ledger_crud
+import app.api.v1.endpoints.pizza_type.crud as pizza_type_crud
+import app.api.v1.endpoints.user.crud as user_crud
+from app.api.v1.endpoints.dough.schemas import DoughCreateSchema
+from app.api.v1.endpoints.order.address.schemas import AddressCreateSchema
+from app.api.v1.endpoints.order.schemas import OrderCheckoutSchema, OrderPizzaQuantitySchema
+from app.api.v1.endpoints.pizza_type.schemas import PizzaTypeCreateSchema
+from app.api.v1.endpoints.user.schemas import UserCreateSchema
+from app.database.connection import SessionLocal
+from app.database.models import Dough, StockMovementReason
+from tests.integration.api.v1.helper import clear_db
+
+
+@pytest.fixture(scope='module')
+def db():
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def test_stock_movements_and_snapshots(db):
+    clear_db(db)
+
+    # Arrange: Dough for 10 pizzas and a user to order them
+    dough = dough_crud.create_dough(
+        DoughCreateSchema(name='ledger dough', stock=10, price=Decimal('1.00'), description=''), db)
+    pizza_type = pizza_type_crud.create_pizza_type(PizzaTypeCreateSchema(
+        name='ledger pizza type', price=Decimal('5.00'), description='', dough_id=dough.id, sauce_ids=[]), db)
+    user = user_crud.create_user(UserCreateSchema(username='ledger user'), db)
+    address = AddressCreateSchema(
+        street='Testweg', post_code='64283', house_number=1,
+        country='Germany', town='Darmstadt', first_name='Test', last_name='User')
+
+    # Act: Order 3 pizzas, compact, then delete the order and put its ingredients back
+    order = order_crud.checkout_order(OrderCheckoutSchema(
+        user_id=user.id, address=address, pizzas=[OrderPizzaQuantitySchema(pizza_type_id=pizza_type.id, quantity=3)],
+    ), db)
+    assert stock_ledger_crud.compact_stock_snapshots(db) >= 1
+    assert stock_ledger_crud.get_ledger_stock(Dough, [dough.id], db) == {dough.id: 7}
+
+    assert order_crud.delete_order_by_id(order.id, db)
+
+    # Assert: Every change of the stock is a movement
+    movements = stock_ledger_crud.get_stock_movements(Dough, dough.id, db)
+    assert [(movement.reason, movement.change, movement.stock_after, movement.order_id) for movement in movements] == [
+        (StockMovementReason.RESTOCK, 10, 10, None),
+        (StockMovementReason.RESERVE, -3, 7, order.id),
+        (StockMovementReason.RELEASE, 3, 10, order.id),
+    ]
+
+    # Act: Set the stock of the dough
+    dough_crud.update_dough(
+        dough, DoughCreateSchema(name='ledger dough', stock=4, price=Decimal('1.00'), description=''), db)
+
+    # Assert: The snapshot plus the movements after it give the stock
+    assert stock_ledger_crud.get_stock_movements(Dough, dough.id, db)[-1].change == -6
+    assert stock_ledger_crud.get_ledger_stock(Dough, [dough.id], db) == {dough.id: 4}
+    assert stock_ledger_crud.compact_stock_snapshots(db) >= 1
+    assert stock_ledger_crud.get_ledger_stock(Dough, [dough.id], db) == {dough.id: 4}
+    assert stock_ledger_crud.find_stock_drift(db) == []
+
+    # Clean up
+    user_crud.delete_user_by_id(user.id, db)
+    pizza_type_crud.delete_pizza_type_by_id(pizza_type.id, db)
+    dough_crud.delete_dough_by_id(dough.id, db)
+
+
+def test_compaction_keeps_movements_that_commit_later(db):
+    clear_db(db)
+    late_dough, dough = [dough_crud.create_dough(
+        DoughCreateSchema(name=name, stock=10, price=Decimal('1.00'), description=''), db)
+        for name in ('late dough', 'early dough')]
+    late_writer = SessionLocal()
+    writer = SessionLocal()
+    try:
+        # Arrange: One writer takes stock without committing, a second one gets a larger movement id and commits
+        assert stock_crud.take_stock(Dough, {late_dough.id: 1}, late_writer)
+        assert stock_crud.take_stock(Dough, {dough.id: 2}, writer)
+        writer.commit()
+
+        # Act: Compact while the first movement is in flight, then commit it
+        assert stock_ledger_crud.compact_stock_snapshots(db) >= 1
+        late_writer.commit()
+    finally:
+        late_writer.close()
+        writer.close()
+
+    # Assert: The movement with the smaller id was not skipped
+    expected = {late_dough.id: 9, dough.id: 8}
+    assert stock_ledger_crud.get_ledger_stock(Dough, [late_dough.id, dough.id], db) == expected
+    assert stock_ledger_crud.compact_stock_snapshots(db) >= 1
+    assert stock_ledger_crud.get_ledger_stock(Dough, [late_dough.id, dough.id], db) == expected
+    assert stock_ledger_crud.find_stock_drift(db) == []
+
+    # Clean up
+    dough_crud.delete_dough_by_id(late_dough.id, db)
+    dough_crud.delete_dough_by_id(dough.id, db)
+
+
+def test_compaction_runs_concurrently_with_writers(db):
+    clear_db(db)
+    dough = dough_crud.create_dough(
+        DoughCreateSchema(name='busy dough', stock=1000, price=Decimal('1.00'), description=''), db)
+    writers_done = threading.Event()
+
+    def write():
+        writer = SessionLocal()
+        try:
+            for _ in range(200):
+                assert stock_crud.take_stock(Dough, {dough.id: 2}, writer)
+                writer.commit()
+                stock_crud.return_stock(Dough, {dough.id: 1}, writer)
+                writer.commit()
+        finally:
+            writer.close()
+
+    def compact():
+        compactor = SessionLocal()
+        try:
+            while not writers_done.is_set():
+                stock_ledger_crud.compact_stock_snapshots(compactor)
+        finally:
+            compactor.close()
+
+    # Act: Two writers change the stock while the compactor runs in a loop
+    writers = [threading.Thread(target=write) for _ in range(2)]
+    compactor = threading.Thread(target=compact)
+    compactor.start()
+    for writer in writers:
+        writer.start()
+    for writer in writers:
+        writer.join(timeout=60)
+    writers_done.set()
+    compactor.join(timeout=60)
+    assert not compactor.is_alive()
+
+    # Assert: Every movement is counted exactly once, compacted or not
+    db.refresh(dough)
+    assert dough.stock == 600
+    assert stock_ledger_crud.get_ledger_stock(Dough, [dough.id], db) == {dough.id: 600}
+    stock_ledger_crud.compact_stock_snapshots(db)
+    assert stock_ledger_crud.get_ledger_stock(Dough, [dough.id], db) == {dough.id: 600}
+    assert stock_ledger_crud.find_stock_drift(db) == []
+    assert len(stock_ledger_crud.get_stock_movements(Dough, dough.id, db)) == 801
+
+    # Clean up
+    dough_crud.delete_dough_by_id(dough.id, db)
+
+
+def test_stock_changes_without_ledger(db, monkeypatch):
+    clear_db(db)
+
+    # Arrange: A dough with 10 in stock, recorded as RESTOCK
+    dough = dough_crud.create_dough(
+        DoughCreateSchema(name='unrecorded dough', stock=10, price=Decimal('1.00'), description=''), db)
+    monkeypatch.setattr(stock_ledger_crud, 'STOCK_LEDGER', False)
+
+    # Act: Take and return stock, and set it
+    assert stock_crud.take_stock(Dough, {dough.id: 4}, db)
+    assert not stock_crud.take_stock(Dough, {dough.id: 7}, db)
+    db.rollback()
+    assert stock_crud.take_stock(Dough, {dough.id: 4}, db)
+    assert stock_crud.return_stock(Dough, {dough.id: 1}, db) == [dough.id]
+    db.commit()
+    db.refresh(dough)
+    stock = dough.stock
+    dough.stock = 20
+    db.commit()
+
+    # Assert: The stock row is guarded and updated as before, without movements
+    assert stock == 7
+    assert [movement.reason for movement in stock_ledger_crud.get_stock_movements(Dough, dough.id, db)] \
+        == [StockMovementReason.RESTOCK]
+
+    # Act: Record again, setting the stock reconciles the ledger
+    monkeypatch.setattr(stock_ledger_crud, 'STOCK_LEDGER', True)
+    assert len(stock_ledger_crud.find_stock_drift(db)) == 1
+    dough.stock = 15
+    db.commit()
+
+    # Assert
+    assert stock_ledger_crud.find_stock_drift(db) == []
+
+    # Clean up
+    dough_crud.delete_dough_by_id(dough.id, db)
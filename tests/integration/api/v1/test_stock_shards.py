@@ -0,0 +1,110 @@
+from decimal import Decimal
+
+import pytest
+
+import app.api.v1.endpoints.dough.crud as dough_crud
+import app.api.v1.endpoints.order.stock_logic.stock_crud as stock_crud
+import app.api.v1.endpoints.order.stock_logic.stock_ingredients_crud as stock_ingredients_crud
+import app.api.v1.endpoints.order.stock_logic.stock_ledger_crud as stock_ledger_crud
+import app.api.v1.endpoints.order.stock_logic.stock_shard_crud as stock_shard_crud
+import app.api.v1.endpoints.pizza_type.crud as pizza_type_crud
+import app.api.v1.endpoints.topping.crud as topping_crud
+from app.api.v1.endpoints.dough.schemas import DoughCreateSchema
+from app.api.v1.endpoints.pizza_type.schemas import PizzaTypeCreateSchema, PizzaTypeToppingQuantityCreateSchema
+from app.api.v1.endpoints.topping.schemas import ToppingCreateSchema
+from app.database.connection import SessionLocal
+from app.database.models import Topping
+from tests.integration.api.v1.helper import clear_db
+
+
+@pytest.fixture(scope='module')
+def db():
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def test_sharded_topping_stock(db):
+    clear_db(db)
+
+    # Arrange: A topping with 100 in stock, split into 4 shards
+    topping = topping_crud.create_topping(
+        ToppingCreateSchema(name='sharded topping', price=Decimal('1.00'), description='', stock=100), db)
+    stock_shard_crud.set_stock_shards(Topping, topping, 4, db)
+    assert stock_shard_crud.get_stock_of_shards(Topping, topping.id, db) == [25, 25, 25, 25]
+    assert topping.own_stock == 0
+    assert topping.stock == 100
+
+    # Act: One take from a single shard, one larger than any shard
+    assert stock_ingredients_crud.take_ingredient_demand({}, {topping.id: 10}, db)
+    assert stock_ingredients_crud.take_ingredient_demand({}, {topping.id: 40}, db)
+    db.commit()
+
+    # Assert: The total is the sum of the shards and matches the ledger
+    assert sum(stock_shard_crud.get_stock_of_shards(Topping, topping.id, db)) == 50
+    db.refresh(topping)
+    assert topping.stock == 50
+    assert not stock_ingredients_crud.take_ingredient_demand({}, {topping.id: 51}, db)
+    db.rollback()
+    assert stock_ledger_crud.find_stock_drift(db) == []
+
+    # Act: Put stock back and rebalance
+    stock_crud.return_stock(Topping, {topping.id: 2}, db)
+    db.commit()
+    assert stock_shard_crud.rebalance_stock_shards(db) == 1
+
+    # Assert: The stock is spread over the shards again
+    assert stock_shard_crud.get_stock_of_shards(Topping, topping.id, db) == [13, 13, 13, 13]
+    db.refresh(topping)
+    assert (topping.own_stock, topping.stock) == (0, 52)
+
+    # Act: Set the stock of the topping
+    topping_crud.update_topping(
+        topping, ToppingCreateSchema(name='sharded topping', price=Decimal('1.00'), description='', stock=30), db)
+
+    # Assert: The new stock replaces the stock of the shards
+    assert topping.stock == 30
+    assert stock_ledger_crud.get_ledger_stock(Topping, [topping.id], db) == {topping.id: 30}
+
+    # Act: Stop sharding
+    stock_shard_crud.set_stock_shards(Topping, topping, 1, db)
+
+    # Assert: The whole stock is back in the topping row
+    assert stock_shard_crud.get_stock_of_shards(Topping, topping.id, db) == []
+    assert (topping.own_stock, topping.stock) == (30, 30)
+    assert stock_ledger_crud.find_stock_drift(db) == []
+
+    # Clean up
+    topping_crud.delete_topping_by_id(topping.id, db)
+
+
+def test_orders_refresh_max_makeable_of_sharded_toppings(db):
+    clear_db(db)
+
+    # Arrange: A pizza type of 2 of a topping with 100 in stock, split into 4 shards
+    dough = dough_crud.create_dough(
+        DoughCreateSchema(name='sharded dough', stock=100, price=Decimal('1.00'), description=''), db)
+    topping = topping_crud.create_topping(
+        ToppingCreateSchema(name='sharded topping', price=Decimal('1.00'), description='', stock=100), db)
+    pizza_type = pizza_type_crud.create_pizza_type(PizzaTypeCreateSchema(
+        name='sharded pizza type', price=Decimal('5.00'), description='', dough_id=dough.id, sauce_ids=[]), db)
+    pizza_type_crud.create_topping_quantity(
+        pizza_type, PizzaTypeToppingQuantityCreateSchema(topping_id=topping.id, quantity=2), db)
+    stock_shard_crud.set_stock_shards(Topping, topping, 4, db)
+    db.refresh(pizza_type)
+    assert pizza_type.max_makeable == 50
+
+    # Act: Take the toppings of 5 pizzas from a shard
+    assert stock_ingredients_crud.take_ingredient_demand({}, {topping.id: 10}, db)
+    db.commit()
+
+    # Assert: The count follows the stock of the shards with the commit
+    db.refresh(pizza_type)
+    assert pizza_type.max_makeable == 45
+
+    # Clean up
+    pizza_type_crud.delete_pizza_type_by_id(pizza_type.id, db)
+    topping_crud.delete_topping_by_id(topping.id, db)
+    dough_crud.delete_dough_by_id(dough.id, db)
@@ -0,0 +1,38 @@
+import asyncio
+import inspect
+
+from fastapi import APIRouter, Depends
+from sqlalchemy.orm import Session
+
+from app.api.v1.async_endpoint import async_endpoint, run_on_event_loop
+from app.database.session import get_async_db, get_db
+
+
+class FakeAsyncSession:
+    async def run_sync(self, function):
+        return function('sync session')
+
+
+def test_endpoint_with_session_runs_in_run_sync():
+    router = APIRouter()
+
+    @router.get('/{item_id}')
+    def get_item(item_id: int, db: Session = Depends(get_db)):
+        return {'item_id': item_id, 'db': db}
+
+    endpoint = async_endpoint(router.routes[0])
+
+    assert inspect.iscoroutinefunction(endpoint)
+    assert inspect.signature(endpoint).parameters['db'].default.dependency is get_async_db
+    assert asyncio.run(endpoint(item_id=1, db=FakeAsyncSession())) == {'item_id': 1, 'db': 'sync session'}
+
+
+def test_endpoint_without_session_is_kept():
+    router = APIRouter()
+
+    @router.get('')
+    def get_status():
+        return {'status': 'ok'}
+
+    run_on_event_loop(router)
+    assert router.routes[0].endpoint is get_status
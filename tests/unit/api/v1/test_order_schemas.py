@@ -2,13 +2,16 @@ import uuid
 import enum
 
 from datetime import datetime
+from decimal import Decimal
 
 import pytest
 from app.api.v1.endpoints.order.schemas import OrderSchema, OrderBaseSchema, OrderCreateSchema, \
     OrderUpdateOrderStatusSchema
 from app.api.v1.endpoints.order.schemas import PizzaBaseSchema, PizzaCreateSchema,\
     PizzaSchema, PizzaWithoutPizzaTypeSchema, JoinedPizzaPizzaTypeSchema,\
-    OrderBeverageQuantityBaseSchema, OrderBeverageQuantityCreateSchema
+    OrderBeverageQuantityBaseSchema, OrderBeverageQuantityCreateSchema, OrderPizzaQuantitySchema, MAX_LINE_QUANTITY, \
+    MAX_ORDER_LINES, CartSchema, OrderBeverageQuantitySchema
+from pydantic import ValidationError
 
 
 # Enum for OrderStatus
@@ -27,6 +30,9 @@ def order_dict(create_real_address):
         'user_id': uuid.uuid4(),
         'address': create_real_address,
         'order_status': OrderStatus.TRANSMITTED,
+        'total_price': Decimal('17.50'),
+        'pizza_count': 2,
+        'beverage_count': 3,
     }
 
 
@@ -77,6 +83,7 @@ def test_order_schema(order_dict):
     assert schema.order_datetime == order_dict['order_datetime']
     assert schema.user_id == order_dict['user_id']
     assert schema.order_status == order_dict['order_status']
+    assert (schema.total_price, schema.pizza_count, schema.beverage_count) == (Decimal('17.50'), 2, 3)
 
 
 def test_update_schema(order_dict):
@@ -134,3 +141,41 @@ def test_order_beverage_quantity_create_schema(order_beverage_quantity_dict):
     schema = OrderBeverageQuantityCreateSchema(**order_beverage_quantity_dict)
     assert schema.quantity == order_beverage_quantity_dict['quantity']
     assert schema.beverage_id == order_beverage_quantity_dict['beverage_id']
+
+
+@pytest.mark.parametrize('quantity', [0, -1, MAX_LINE_QUANTITY + 1, 3_000_000_000])
+def test_order_pizza_quantity_schema_rejects_quantity(quantity):
+    with pytest.raises(ValidationError):
+        OrderPizzaQuantitySchema(pizza_type_id=uuid.uuid4(), quantity=quantity)
+
+
+def test_order_pizza_quantity_schema_max_quantity():
+    schema = OrderPizzaQuantitySchema(pizza_type_id=uuid.uuid4(), quantity=MAX_LINE_QUANTITY)
+    assert schema.quantity == MAX_LINE_QUANTITY
+
+
+@pytest.mark.parametrize('quantity', [0, MAX_LINE_QUANTITY + 1, 3_000_000_000])
+def test_order_beverage_quantity_create_schema_rejects_quantity(quantity):
+    with pytest.raises(ValidationError):
+        OrderBeverageQuantityCreateSchema(beverage_id=uuid.uuid4(), quantity=quantity)
+
+
+def test_order_beverage_quantity_schema_returns_quantity_above_bound():
+    schema = OrderBeverageQuantitySchema(beverage_id=uuid.uuid4(), quantity=MAX_LINE_QUANTITY + 1)
+    assert schema.quantity == MAX_LINE_QUANTITY + 1
+
+
+def test_cart_schema_rejects_too_many_lines():
+    pizza_type_id = uuid.uuid4()
+    with pytest.raises(ValidationError):
+        CartSchema(pizzas=[{'pizza_type_id': pizza_type_id, 'quantity': 1}] * (MAX_ORDER_LINES + 1))
+
+
+def test_cart_schema_rejects_summed_quantity():
+    beverage_id = uuid.uuid4()
+    line = {'beverage_id': beverage_id, 'quantity': MAX_LINE_QUANTITY}
+    with pytest.raises(ValidationError):
+        CartSchema(beverages=[line, {'beverage_id': beverage_id, 'quantity': 1}])
+
+    schema = CartSchema(beverages=[line, {'beverage_id': uuid.uuid4(), 'quantity': 1}])
+    assert len(schema.beverages) == 2
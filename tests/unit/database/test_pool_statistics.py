@@ -0,0 +1,68 @@
+import threading
+
+import pytest
+
+from app.database.pool_statistics import PoolStatistics
+
+
+@pytest.fixture
+def statistics():
+    return PoolStatistics(buckets=(0.01, 0.1, 1))
+
+
+def test_empty_statistics(statistics):
+    snapshot = statistics.snapshot()
+    assert snapshot['checkouts'] == 0
+    assert snapshot['timeouts'] == 0
+    assert snapshot['wait_time_avg'] == 0.0
+    assert [bucket['count'] for bucket in snapshot['checkout_latency_histogram']] == [0, 0, 0, 0]
+
+
+def test_checkout_histogram_is_cumulative(statistics):
+    statistics.record_checkout(0.005)
+    statistics.record_checkout(0.05)
+    statistics.record_checkout(0.5)
+    statistics.record_checkout(5)
+
+    snapshot = statistics.snapshot()
+    assert snapshot['checkouts'] == 4
+    assert snapshot['wait_time_max'] == 5
+    assert snapshot['checkout_latency_histogram'] == [
+        {'le': 0.01, 'count': 1},
+        {'le': 0.1, 'count': 2},
+        {'le': 1, 'count': 3},
+        {'le': None, 'count': 4},
+    ]
+
+
+def test_timeouts_count_as_waits(statistics):
+    statistics.record_checkout(0.2)
+    statistics.record_timeout(1.8)
+
+    snapshot = statistics.snapshot()
+    assert snapshot['checkouts'] == 1
+    assert snapshot['timeouts'] == 1
+    assert snapshot['wait_time_total'] == pytest.approx(2.0)
+    assert snapshot['wait_time_avg'] == pytest.approx(1.0)
+
+
+def test_reset(statistics):
+    statistics.record_checkout(0.2)
+    statistics.reset()
+    assert statistics.snapshot()['checkouts'] == 0
+
+
+def test_concurrent_timeouts_are_not_lost(statistics):
+    def record_timeouts():
+        for _ in range(1000):
+            statistics.record_timeout(0.001)
+
+    threads = [threading.Thread(target=record_timeouts) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    snapshot = statistics.snapshot()
+    assert snapshot['timeouts'] == 8000
+    assert snapshot['checkouts'] == 0
@@ -0,0 +1,25 @@
+from app.database.replicas import ReplicaRouter
+
+
+def test_no_replicas_uses_primary():
+    router = ReplicaRouter({})
+    assert router.choose(max_staleness=5) is None
+
+
+def test_round_robin(mocker):
+    first, second = object(), object()
+    router = ReplicaRouter({'first': first, 'second': second})
+    mocker.patch.object(router, 'get_replication_lag', return_value=0.0)
+
+    assert [router.choose(max_staleness=5) for _ in range(4)] == [first, second, first, second]
+
+
+def test_skips_stale_and_unreachable_replicas(mocker):
+    stale, unreachable, fresh = object(), object(), object()
+    router = ReplicaRouter({'stale': stale, 'unreachable': unreachable, 'fresh': fresh})
+    lags = {stale: 10.0, unreachable: None, fresh: 0.5}
+    mocker.patch.object(router, 'get_replication_lag', side_effect=lags.get)
+
+    assert router.choose(max_staleness=5) is fresh
+    assert router.choose(max_staleness=5) is fresh
+    assert router.choose(max_staleness=0.1) is None
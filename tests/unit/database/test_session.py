@@ -0,0 +1,81 @@
+import pytest
+from sqlalchemy import create_engine, text
+from starlette.requests import Request
+
+from app.database import session as session_module
+from app.database.session import connection_hold_times, get_db, replica_db
+
+
+def make_request(method):
+    return Request({'type': 'http', 'method': method, 'path': '/v1/menu', 'headers': [], 'query_string': b''})
+
+
+@pytest.fixture
+def replica():
+    engine = create_engine('sqlite://')
+    yield engine
+    engine.dispose()
+
+
+def test_read_only_path_binds_to_replica(mocker, replica):
+    router = mocker.Mock()
+    router.choose.return_value = replica
+    mocker.patch.object(session_module, 'get_replica_router', return_value=router)
+
+    dependency = replica_db(max_staleness=2)(make_request('GET'))
+    db = next(dependency)
+
+    assert db.get_bind() is replica
+    assert db.info['read_only']
+    router.choose.assert_called_once_with(2)
+    dependency.close()
+
+
+def test_read_only_path_falls_back_to_primary(mocker):
+    router = mocker.Mock()
+    router.choose.return_value = None
+    mocker.patch.object(session_module, 'get_replica_router', return_value=router)
+
+    dependency = replica_db()(make_request('GET'))
+    db = next(dependency)
+
+    assert db.bind is None
+    dependency.close()
+
+
+def test_write_requests_are_not_read_only():
+    dependency = get_db(make_request('POST'))
+    db = next(dependency)
+
+    assert 'read_only' not in db.info
+    dependency.close()
+
+
+def test_connection_hold_time_is_recorded(mocker, replica):
+    router = mocker.Mock()
+    router.choose.return_value = replica
+    mocker.patch.object(session_module, 'get_replica_router', return_value=router)
+    # sqlite has no read-only transactions, so the request is a POST on the replica engine
+    mocker.patch.object(session_module.time, 'perf_counter', side_effect=[10.0, 10.25])
+    requests = connection_hold_times.snapshot()['count']
+    total = connection_hold_times.snapshot()['total']
+
+    dependency = replica_db()(make_request('POST'))
+    db = next(dependency)
+    db.execute(text('SELECT 1'))
+    dependency.close()
+
+    assert db.info['connection_hold_time'] == 0.25
+    statistics = connection_hold_times.snapshot()
+    assert statistics['count'] == requests + 1
+    assert statistics['total'] == pytest.approx(total + 0.25)
+
+
+def test_sessions_without_queries_record_nothing():
+    requests = connection_hold_times.snapshot()['count']
+
+    dependency = get_db(make_request('GET'))
+    next(dependency)
+    dependency.close()
+
+    assert connection_hold_times.snapshot()['count'] == requests